@@ -0,0 +1,168 @@
+"""Use pynbox from asyncio programs without blocking the event loop.
+
+Classes:
+    AsyncInbox: Async counterparts of the services and views.
+"""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from itertools import islice
+from types import TracebackType
+from typing import AsyncIterator, Callable, Dict, Optional, Type, TypeVar
+
+from repository_orm import Repository
+
+from . import services, views
+from .config import Config
+from .model import Element, ElementOrder, ParseReport
+
+Result = TypeVar("Result")
+
+
+class AsyncInbox:
+    """Async counterparts of the services and views.
+
+    The repository is opened and used from a single worker thread, as the SQLite
+    connections can't be shared between threads. The calls are run there one after
+    the other, while the event loop goes on with other tasks.
+
+    Use it as an async context manager so that the repository is closed:
+
+    ```python
+    async with AsyncInbox(config, lambda: get_repo(config)) as inbox:
+        await inbox.parse_file("inbox.pynbox")
+        async for element in inbox.get_elements():
+            await inbox.close(element)
+    ```
+    """
+
+    def __init__(self, config: Config, repo_factory: Callable[[], Repository]) -> None:
+        """Start the worker thread and open the repository in it.
+
+        Args:
+            config: pynbox configuration instance.
+            repo_factory: Function that returns the repository to use.
+        """
+        self.config = config
+        self._executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="pynbox-repository"
+        )
+        self._repo = self._executor.submit(repo_factory)
+
+    async def __aenter__(self) -> "AsyncInbox":
+        """Wait until the repository is open."""
+        await asyncio.wrap_future(self._repo)
+        return self
+
+    async def __aexit__(
+        self,
+        exc_type: Optional[Type[BaseException]],
+        exc_value: Optional[BaseException],
+        traceback: Optional[TracebackType],
+    ) -> None:
+        """Close the repository."""
+        await self.aclose()
+
+    async def aclose(self) -> None:
+        """Close the repository and stop the worker thread."""
+        await self._run(lambda repo: repo.close())
+        self._executor.shutdown(wait=True)
+
+    async def parse_file(self, file_path: str) -> ParseReport:
+        """Parse the elements from a file, see services.parse_file.
+
+        Args:
+            file_path: Path to file to parse.
+        """
+        return await self._run(partial(services.parse_file, self.config), file_path)
+
+    async def get_elements(
+        self,
+        type_: Optional[str] = None,
+        order: ElementOrder = ElementOrder.TYPE,
+        page_size: int = 50,
+    ) -> AsyncIterator[Element]:
+        """Yield the elements to process, see views.get_elements.
+
+        The elements are built a page at a time in the worker thread.
+
+        Args:
+            type_: type of element to process.
+            order: Order of the elements.
+            page_size: Number of elements to build at once.
+        """
+        elements = await self._run(
+            partial(
+                views.get_elements,
+                config=self.config,
+                type_=type_,
+                order=order,
+                page_size=page_size,
+            )
+        )
+        while True:
+            page = await self._run(lambda _: list(islice(elements, page_size)))
+            if len(page) == 0:
+                return
+            for element in page:
+                yield element
+
+    async def status(self) -> Dict[str, int]:
+        """Get the number of open elements per type, see views.status."""
+        return await self._run(partial(views.status, config=self.config))
+
+    async def close(self, element: Element) -> None:
+        """Close an element and store it.
+
+        Args:
+            element: Element to close.
+        """
+        await self._transition(element, element.close)
+
+    async def delete(self, element: Element) -> None:
+        """Delete an element and store it.
+
+        Args:
+            element: Element to delete.
+        """
+        await self._transition(element, element.delete)
+
+    async def skip(self, element: Element) -> None:
+        """Skip an element and store it.
+
+        Args:
+            element: Element to skip.
+        """
+        await self._transition(element, element.skip)
+
+    async def change_type(self, element: Element, type_: str) -> None:
+        """Change the type of an element and store it.
+
+        Args:
+            element: Element to change.
+            type_: New type of the element.
+        """
+        await self._transition(element, partial(setattr, element, "type_", type_))
+
+    async def _transition(self, element: Element, change: Callable[[], None]) -> None:
+        """Change an element and store it with its counters in the worker thread."""
+        previous = (element.type_, element.state)
+        change()
+
+        def save(repo: Repository) -> None:
+            services.save_element(repo, element, previous)
+            repo.commit()
+
+        await self._run(save)
+
+    async def _run(self, function: Callable[..., Result], *args: object) -> Result:
+        """Run a function with the repository in the worker thread.
+
+        Args:
+            function: Function that receives the repository as first argument.
+            args: Rest of arguments of the function.
+        """
+        loop = asyncio.get_running_loop()
+        repo = await asyncio.wrap_future(self._repo)
+        return await loop.run_in_executor(self._executor, function, repo, *args)
@@ -1,12 +1,21 @@
 """Define the configuration of the main program."""
 
+import hashlib
+import logging
 import os
+import pickle  # nosec
 from enum import Enum
-from typing import List
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
-from goodconf import GoodConf
+from goodconf import GoodConf, file_config_settings_source
+from pydantic import BaseSettings, parse_obj_as
 
 from .model import ElementType
+from .version import __version__
+
+log = logging.getLogger(__name__)
+
+SettingsSource = Callable[[BaseSettings], Dict[str, Any]]
 
 
 class LogLevel(str, Enum):
@@ -18,6 +27,14 @@ class LogLevel(str, Enum):
     ERROR = "error"
 
 
+class DuplicateMode(str, Enum):
+    """Define how the duplicated elements are detected when parsing."""
+
+    OFF = "off"
+    EXACT = "exact"
+    NEAR = "near"
+
+
 class Config(GoodConf):
     """Configure the frontend."""
 
@@ -36,6 +53,25 @@ class Config(GoodConf):
     #   * priority: type priority, by default 3.
     types: List[ElementType] = []
 
+    # Directory where `pynbox archive` moves the old closed and deleted elements.
+    archive_path: str = "~/.local/share/pynbox/archive"
+
+    # If set, the closed and deleted elements older than this number of days are
+    # archived automatically at the end of each `pynbox process` session.
+    archive_days: Optional[int] = None
+
+    # Detect the parsed elements that are already open in the inbox, and drop them:
+    #   * off: Store all the parsed elements.
+    #   * exact: Drop the elements with the same type, description and body,
+    #       ignoring the case and the whitespaces.
+    #   * near: Also drop the elements of the same type whose description and
+    #       body are almost equal.
+    duplicates: DuplicateMode = DuplicateMode.EXACT
+
+    # File where `pynbox process` records the time taken by each decision, see
+    # `pynbox metrics`. Set it to null to not record them.
+    metrics_path: Optional[str] = "~/.local/share/pynbox/metrics.jsonl"
+
     log_level: LogLevel = LogLevel.INFO
 
     class Config:
@@ -45,3 +81,123 @@ class Config(GoodConf):
             os.path.expanduser("~/.local/share/pynbox/config.yaml"),
             "config.yaml",
         ]
+
+        @classmethod
+        def customise_sources(
+            cls,
+            init_settings: SettingsSource,
+            env_settings: SettingsSource,
+            file_secret_settings: SettingsSource,
+        ) -> Tuple[SettingsSource, ...]:
+            """Load the configuration file through the compiled cache.
+
+            The environment variables still take precedence over the file values.
+            """
+            return (
+                init_settings,
+                env_settings,
+                cached_file_settings_source,
+                file_secret_settings,
+            )
+
+
+def cached_file_settings_source(settings: BaseSettings) -> Dict[str, Any]:
+    """Return the values of the configuration file, using the compiled cache.
+
+    The first time a configuration file is loaded, its values, with the element
+    types already validated, are stored in a pickle file. The next loads use it
+    while the modification time and the hash of the configuration file don't
+    change, skipping the YAML parsing and the validation of the types. The cache is
+    invalidated too when pynbox is upgraded or the schema of the element types
+    changes, as the pickled types may no longer match the model.
+
+    Args:
+        settings: Configuration object being loaded.
+
+    Returns:
+        The values of the configuration file.
+    """
+    # _config_file is where goodconf stores the path of the file to load.
+    config_file = getattr(settings, "_config_file", None)
+    if config_file is None or not os.path.isfile(config_file):
+        return file_config_settings_source(settings)
+
+    with open(config_file, "rb") as file_descriptor:
+        key = {
+            "path": os.path.abspath(config_file),
+            "mtime": os.stat(file_descriptor.fileno()).st_mtime_ns,
+            "hash": hashlib.sha256(file_descriptor.read()).hexdigest(),
+            "version": __version__,
+            "schema": hashlib.sha256(
+                ElementType.schema_json().encode("utf-8")
+            ).hexdigest(),
+        }
+    cache_path = _config_cache_path(key["path"])
+
+    cache = _read_config_cache(cache_path)
+    if cache is not None and cache["key"] == key:
+        log.debug(f"Loading the configuration from the cache {cache_path}")
+        # The values are copied so that the cached types are not shared.
+        return {**cache["values"], "types": list(cache["values"]["types"])}
+
+    values = file_config_settings_source(settings)
+    try:
+        values["types"] = parse_obj_as(List[ElementType], values.get("types", []))
+    except ValueError:
+        # Let pydantic report the validation errors.
+        return values
+    _write_config_cache(cache_path, {"key": key, "values": values})
+    return values
+
+
+def _config_cache_path(config_file: str) -> str:
+    """Return the path to the compiled cache of a configuration file.
+
+    Args:
+        config_file: Absolute path to the configuration file.
+    """
+    cache_directory = os.path.join(
+        os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")), "pynbox"
+    )
+    file_id = hashlib.sha256(config_file.encode("utf-8")).hexdigest()[:16]
+    return os.path.join(cache_directory, f"config-{file_id}.pickle")
+
+
+def _read_config_cache(cache_path: str) -> Optional[Dict[str, Any]]:
+    """Load the compiled cache of a configuration file.
+
+    Args:
+        cache_path: Path to the cache file.
+
+    Returns:
+        The cached data or None if it doesn't exist or is corrupt.
+    """
+    try:
+        with open(cache_path, "rb") as file_descriptor:
+            # B301: The cache is created by pynbox in the user's cache directory.
+            cache = pickle.load(file_descriptor)  # nosec
+    except Exception:  # noqa: W0703
+        # Any error unpickling means that the cache needs to be built again.
+        return None
+    if not isinstance(cache, dict) or "key" not in cache:
+        return None
+    return cache
+
+
+def _write_config_cache(cache_path: str, cache: Dict[str, Any]) -> None:
+    """Atomically store the compiled cache of a configuration file.
+
+    Failing to write the cache is not an error, the configuration will be parsed
+    again the next time.
+
+    Args:
+        cache_path: Path to the cache file.
+        cache: Data to store.
+    """
+    try:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        with open(f"{cache_path}.tmp", "wb") as file_descriptor:
+            pickle.dump(cache, file_descriptor, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(f"{cache_path}.tmp", cache_path)
+    except OSError as error:
+        log.debug(f"Could not write the configuration cache: {error}")
@@ -8,9 +8,9 @@ import logging
 import os
 import sys
 
-from repository_orm import Repository, load_repository
-from ruamel.yaml.parser import ParserError
+from repository_orm import PypikaRepository, Repository, load_repository
 
+from .. import services
 from ..config import Config
 
 log = logging.getLogger(__name__)
@@ -23,7 +23,12 @@ def load_config(config_path: str) -> Config:
 
     try:
         config.load(os.path.expanduser(config_path))
-    except ParserError as error:
+    except Exception as error:  # noqa: W0703
+        # C0415: ruamel is only loaded if the configuration is not in the cache.
+        from ruamel.yaml.parser import ParserError  # noqa: C0415
+
+        if not isinstance(error, ParserError):
+            raise
         log.error(f"Configuration Error: {str(error)}")
         sys.exit(1)
 
@@ -34,6 +39,16 @@ def get_repo(config: "Config") -> Repository:
     """Configure the repository."""
     log.debug("Initializing repository")
     repo = load_repository(database_url=config.database_url)
+    if isinstance(repo, PypikaRepository):
+        repo.apply_migrations(
+            os.path.join(os.path.dirname(__file__), "..", "migrations")
+        )
+        # The write ahead log lets the reads go on while a commit is written, and
+        # with it the NORMAL synchronous mode is still safe against corruption.
+        repo.connection.execute("PRAGMA journal_mode=WAL")
+        repo.connection.execute("PRAGMA synchronous=NORMAL")
+    # Apply the changes left in the journal by a process session that was killed.
+    services.compact_journal(repo)
 
     return repo
 
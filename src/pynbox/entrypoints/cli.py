@@ -1,23 +1,39 @@
-"""Define the command line interface."""
+"""Define the command line interface.
 
+The TUI libraries are imported inside the commands that use them, so that the
+commands that don't, like `add`, start faster.
+"""
+
+import logging
+import shutil
+import signal
 import subprocess  # nosec
 import time
+from datetime import datetime, timedelta
 from enum import Enum
-from typing import TYPE_CHECKING, List, Optional
+from itertools import islice
+from threading import Event
+from typing import TYPE_CHECKING, Iterator, List, Optional
 
 import click
 from click.core import Context
-from questionary import Choice, select
-from rich import box
-from rich.console import Console
-from rich.table import Table
-from rich.text import Text
 
 from .. import services, version, views
+from ..exceptions import ExportError, MigrationError
+from ..model import Decision, ElementOrder, ElementState, ExportFormat
 from . import get_repo, load_config, load_logger
 
 if TYPE_CHECKING:
-    from ..model import Element
+    import cProfile  # noqa: C0415
+
+    from questionary import Choice  # noqa: C0415
+    from repository_orm import Repository
+    from rich.console import Console  # noqa: C0415
+
+    from ..model import ElementRecord
+    from ..profiling import Profiler
+
+log = logging.getLogger(__name__)
 
 
 @click.group()
@@ -30,27 +46,168 @@ if TYPE_CHECKING:
     help="configuration file path",
     envvar="PYNBOX_CONFIG_PATH",
 )
+@click.option(
+    "--profile",
+    is_flag=True,
+    help="Show how long each phase of the command takes.",
+)
+@click.option(
+    "--profile-output",
+    default=None,
+    help="Also write the profile to this file. If it ends in .json it's written "
+    "in the speedscope format, otherwise it's a cProfile dump.",
+)
 @click.pass_context
-def cli(ctx: Context, config_path: str, verbose: bool) -> None:
+def cli(
+    ctx: Context,
+    config_path: str,
+    verbose: bool,
+    profile: bool = False,
+    profile_output: Optional[str] = None,
+) -> None:
     """Command line interface main click entrypoint."""
     ctx.ensure_object(dict)
-    ctx.obj["config"] = load_config(config_path)
-    ctx.obj["repo"] = get_repo(ctx.obj["config"])
+    if profile or profile_output is not None:
+        profiler = _start_profiler(ctx, profile_output)
+        with profiler.span("config", "load_config"):
+            ctx.obj["config"] = load_config(config_path)
+    else:
+        ctx.obj["config"] = load_config(config_path)
     ctx.obj["verbose"] = verbose
 
     load_logger(verbose)
 
 
+def _start_profiler(ctx: Context, profile_output: Optional[str]) -> "Profiler":
+    """Measure the command until its context is closed.
+
+    The cProfile profiler is only started if its dump is requested, as it slows
+    down the command much more than the spans.
+    """
+    # C0415: Imported here so that the commands that are not profiled don't
+    # load it.
+    from ..profiling import Profiler  # noqa: C0415
+
+    profiler = Profiler()
+    profiler.install()
+    cprofile: Optional["cProfile.Profile"] = None
+    if profile_output is not None and not profile_output.endswith(".json"):
+        # C0415: Imported here as it's only used to dump the cProfile profile.
+        import cProfile  # noqa: C0415
+
+        cprofile = cProfile.Profile()
+        cprofile.enable()
+    ctx.call_on_close(lambda: _stop_profiler(profiler, profile_output, cprofile))
+    return profiler
+
+
+def _stop_profiler(
+    profiler: "Profiler",
+    profile_output: Optional[str],
+    cprofile: Optional["cProfile.Profile"],
+) -> None:
+    """Print the time taken by each phase and write the profile dump."""
+    # C0415: Imported here so that the commands without tables start faster.
+    from rich import box  # noqa: C0415
+    from rich.console import Console  # noqa: C0415
+    from rich.table import Table  # noqa: C0415
+
+    if cprofile is not None:
+        cprofile.disable()
+    profiler.uninstall()
+    wall_time = profiler.wall_time()
+    phases = profiler.phases()
+    unmeasured_time = max(0.0, wall_time - sum(phases.values()))
+    table = Table(
+        box=box.MINIMAL_HEAVY_HEAD,
+        title=f"Profile of {wall_time * 1000:.1f}ms",
+        caption=", ".join(
+            f"{phase} {phase_time / wall_time:.0%}"
+            for phase, phase_time in [*phases.items(), ("other", unmeasured_time)]
+        ),
+    )
+    table.add_column("Phase", justify="left", style="green")
+    table.add_column("Function", justify="left")
+    table.add_column("Calls", justify="right", style="magenta")
+    table.add_column("Total", justify="right", style="cyan")
+    table.add_column("Self", justify="right", style="cyan")
+    table.add_column("Self %", justify="right", style="yellow")
+    for span in profiler.spans():
+        table.add_row(
+            span.phase,
+            span.name,
+            str(span.calls),
+            f"{span.total * 1000:.1f}ms",
+            f"{span.self_time * 1000:.1f}ms",
+            f"{span.self_time / wall_time:.1%}",
+        )
+    Console(stderr=True).print(table)
+
+    if profile_output is None:
+        return
+    if cprofile is None:
+        profiler.dump_speedscope(profile_output)
+    else:
+        cprofile.dump_stats(profile_output)
+    log.info(f"Profile written to {profile_output}")
+
+
+def _get_repo(ctx: Context) -> "Repository":
+    """Return the repository, initializing it the first time it's requested."""
+    if "repo" not in ctx.obj:
+        ctx.obj["repo"] = get_repo(ctx.obj["config"])
+    return ctx.obj["repo"]
+
+
 @cli.command()
-@click.argument("file_path")
+@click.argument("paths", nargs=-1, required=True)
 @click.pass_context
-def parse(ctx: Context, file_path: str) -> None:
-    """Parse a markup file and add the elements to the repository."""
-    repo = ctx.obj["repo"]
+def parse(ctx: Context, paths: List[str]) -> None:
+    """Parse markup files and add the elements to the repository.
+
+    PATHS can be files, directories, whose files are parsed, or glob patterns.
+    """
+    file_paths = services.expand_paths(paths)
+    if len(file_paths) == 0:
+        log.debug(f"There are no elements to parse in {', '.join(paths)}")
+        return
+    repo = _get_repo(ctx)
 
-    services.parse_file(ctx.obj["config"], repo, file_path)
+    report = services.parse_paths(ctx.obj["config"], repo, file_paths)
 
     repo.close()
+    if report.duplicates > 0:
+        log.info(f"Merged {report.duplicates} duplicated elements")
+
+
+@cli.command()
+@click.argument("paths", nargs=-1, required=True)
+@click.option(
+    "--polling",
+    is_flag=True,
+    help="Check the files periodically instead of using inotify.",
+)
+@click.pass_context
+def watch(ctx: Context, paths: List[str], polling: bool = False) -> None:
+    """Parse the PATHS each time they change until interrupted.
+
+    PATHS can be files, directories, whose files are parsed, or glob patterns.
+    """
+    # C0415: Imported here so that the rest of commands don't load the watchers.
+    from ..watch import WatchStats
+    from ..watch import watch as watch_paths  # noqa: C0415
+
+    repo = _get_repo(ctx)
+    stop = Event()
+    for signal_number in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signal_number, lambda *_: stop.set())
+    stats = WatchStats()
+
+    try:
+        watch_paths(ctx.obj["config"], repo, list(paths), stop, stats, polling)
+    finally:
+        repo.close()
+        log.info(stats.summary())
 
 
 @cli.command()
@@ -58,20 +215,33 @@ def parse(ctx: Context, file_path: str) -> None:
 @click.pass_context
 def add(ctx: Context, element_strings: List[str]) -> None:
     """Parse a markup file and add the elements to the repository."""
-    repo = ctx.obj["repo"]
+    repo = _get_repo(ctx)
 
     element = services.parse(ctx.obj["config"], " ".join(element_strings))[0]
 
-    repo.add(element)
+    services.add_elements(repo, [element])
     repo.commit()
     repo.close()
 
 
 @cli.command()
+@click.option(
+    "--rebuild",
+    is_flag=True,
+    help="Recompute the element counters from the stored elements.",
+)
 @click.pass_context
-def status(ctx: Context) -> None:
+def status(ctx: Context, rebuild: bool = False) -> None:
     """Print the status of the inbox."""
-    repo = ctx.obj["repo"]
+    # C0415: Imported here so that the commands without tables start faster.
+    from rich import box  # noqa: C0415
+    from rich.console import Console  # noqa: C0415
+    from rich.table import Table  # noqa: C0415
+
+    repo = _get_repo(ctx)
+    if rebuild:
+        services.rebuild_counters(repo)
+        repo.commit()
     status_data = views.status(repo, ctx.obj["config"])
     repo.close()
 
@@ -88,6 +258,249 @@ def status(ctx: Context) -> None:
     console.print(table)
 
 
+@cli.command()
+@click.option(
+    "-d",
+    "--days",
+    type=int,
+    default=None,
+    help="Archive the elements closed more than these days ago. By default "
+    "archive_days of the configuration, or 30.",
+)
+@click.pass_context
+def archive(ctx: Context, days: Optional[int] = None) -> None:
+    """Move the old closed and deleted elements to the archive."""
+    config = ctx.obj["config"]
+    if days is None:
+        days = config.archive_days or 30
+    repo = _get_repo(ctx)
+
+    archived_elements = services.archive_elements(repo, config.archive_path, days)
+
+    repo.commit()
+    repo.close()
+    log.info(f"Archived {archived_elements} elements to {config.archive_path}")
+
+
+@cli.command()
+@click.argument("source_url")
+@click.pass_context
+def migrate(ctx: Context, source_url: str) -> None:
+    """Copy the elements of the SOURCE_URL database into the configured one.
+
+    For example `pynbox migrate tinydb://~/.local/share/pynbox/database.tinydb` with
+    a `sqlite://` database_url in the configuration.
+    """
+    config = ctx.obj["config"]
+    source_repo = get_repo(config.copy(update={"database_url": source_url}))
+    repo = _get_repo(ctx)
+
+    try:
+        migrated_elements = services.migrate_elements(source_repo, repo)
+        repo.commit()
+    except MigrationError as error:
+        log.error(str(error))
+        ctx.exit(1)
+    finally:
+        source_repo.close()
+        repo.close()
+    log.info(f"Migrated {migrated_elements} elements to {config.database_url}")
+
+
+@cli.command()
+@click.argument("file_path")
+@click.option(
+    "-f",
+    "--format",
+    "format_",
+    type=click.Choice([format_.value for format_ in ExportFormat]),
+    default=ExportFormat.CSV.value,
+    help="Format of the file, parquet and arrow need the pyarrow package.",
+)
+@click.pass_context
+def export(ctx: Context, file_path: str, format_: str) -> None:
+    """Write all the elements to FILE_PATH to analyze them with other tools."""
+    repo = _get_repo(ctx)
+
+    try:
+        exported_elements = services.export_elements(
+            repo, file_path, ExportFormat(format_)
+        )
+    except ExportError as error:
+        log.error(str(error))
+        ctx.exit(1)
+    finally:
+        repo.close()
+    log.info(f"Exported {exported_elements} elements to {file_path}")
+
+
+@cli.command()
+@click.option(
+    "-d",
+    "--days",
+    type=int,
+    default=7,
+    help="Number of days to show the elements created and closed per day.",
+)
+@click.pass_context
+def stats(ctx: Context, days: int) -> None:
+    """Print the throughput, time to close and skips of the elements."""
+    # C0415: Imported here so that the commands without tables start faster.
+    from rich import box  # noqa: C0415
+    from rich.console import Console  # noqa: C0415
+    from rich.table import Table  # noqa: C0415
+
+    repo = _get_repo(ctx)
+    element_stats = views.element_stats(repo)
+    repo.close()
+
+    types = sorted(set(element_stats.created) | set(element_stats.closed))
+    summary = Table(box=box.MINIMAL_HEAVY_HEAD, title="Elements per type")
+    summary.add_column("Type", justify="left", style="green")
+    summary.add_column("Created", justify="right", style="magenta")
+    summary.add_column("Closed", justify="right", style="magenta")
+    summary.add_column("Median days to close", justify="right", style="cyan")
+    summary.add_column("P90 days to close", justify="right", style="cyan")
+    for type_ in types:
+        summary.add_row(
+            type_.title(),
+            str(sum(element_stats.created.get(type_, {}).values())),
+            str(sum(element_stats.closed.get(type_, {}).values())),
+            _format_days(element_stats.median_time_to_close.get(type_)),
+            _format_days(element_stats.p90_time_to_close.get(type_)),
+        )
+
+    daily = Table(box=box.MINIMAL_HEAVY_HEAD, title=f"Last {days} days")
+    daily.add_column("Day", justify="left", style="cyan")
+    daily.add_column("Type", justify="left", style="green")
+    daily.add_column("Created", justify="right", style="magenta")
+    daily.add_column("Closed", justify="right", style="magenta")
+    first_day = datetime.now().date() - timedelta(days=days - 1)
+    for day in (first_day + timedelta(days=offset) for offset in range(days)):
+        for type_ in types:
+            created = element_stats.created.get(type_, {}).get(day, 0)
+            closed = element_stats.closed.get(type_, {}).get(day, 0)
+            if created > 0 or closed > 0:
+                daily.add_row(day.isoformat(), type_.title(), str(created), str(closed))
+
+    skips = Table(box=box.MINIMAL_HEAVY_HEAD, title="Skips")
+    skips.add_column("Skips", justify="right", style="cyan")
+    skips.add_column("Elements", justify="right", style="magenta")
+    for skip_count, elements in sorted(element_stats.skips.items()):
+        skips.add_row(str(skip_count), str(elements))
+
+    console = Console()
+    console.print(summary)
+    console.print(daily)
+    console.print(skips)
+
+
+@cli.command()
+@click.pass_context
+def metrics(ctx: Context) -> None:
+    """Print the time taken to decide and store the processed elements.
+
+    The think time goes from the moment the element is shown until the action is
+    chosen, and the storage time is the time taken to store the change.
+    """
+    # C0415: Imported here so that the commands without tables start faster.
+    from rich import box  # noqa: C0415
+    from rich.console import Console  # noqa: C0415
+    from rich.table import Table  # noqa: C0415
+
+    percentiles = (50, 90, 99)
+    report = views.decision_metrics(ctx.obj["config"].metrics_path, percentiles)
+
+    table = Table(
+        box=box.MINIMAL_HEAVY_HEAD,
+        title="Decisions per type and action",
+        caption=f"{report.sessions} sessions, "
+        + ", ".join(
+            f"p{percentile} {report.session_time.get(percentile, 0) / 60:.1f}m"
+            for percentile in percentiles
+        ),
+    )
+    table.add_column("Type", justify="left", style="green")
+    table.add_column("Action", justify="left", style="green")
+    table.add_column("Decisions", justify="right", style="magenta")
+    for percentile in percentiles:
+        table.add_column(f"Think p{percentile}", justify="right", style="cyan")
+    for percentile in percentiles:
+        table.add_column(f"Storage p{percentile}", justify="right", style="yellow")
+    for metric in report.metrics:
+        table.add_row(
+            metric.type_.title(),
+            metric.action,
+            str(metric.decisions),
+            *(f"{metric.think_time[percentile]:.1f}s" for percentile in percentiles),
+            *(
+                f"{metric.storage_time[percentile] * 1000:.1f}ms"
+                for percentile in percentiles
+            ),
+        )
+
+    console = Console()
+    console.print(table)
+
+
+def _format_days(days: Optional[float]) -> str:
+    """Return the days with one decimal, or a dash if there are none."""
+    if days is None:
+        return "-"
+    return f"{days:.1f}"
+
+
+@cli.command()
+@click.argument("query", nargs=-1, required=True)
+@click.option(
+    "-s",
+    "--state",
+    type=click.Choice([state.value for state in ElementState]),
+    default=None,
+    help="Show only the elements in this state.",
+)
+@click.option(
+    "-t", "--type", "type_", default=None, help="Show only the elements of this type."
+)
+@click.pass_context
+def search(
+    ctx: Context,
+    query: List[str],
+    state: Optional[str] = None,
+    type_: Optional[str] = None,
+) -> None:
+    """Find the elements that contain the words of the QUERY."""
+    # C0415: Imported here so that the commands without tables start faster.
+    from rich import box  # noqa: C0415
+    from rich.console import Console  # noqa: C0415
+    from rich.table import Table  # noqa: C0415
+
+    repo = _get_repo(ctx)
+    elements = views.search(
+        repo,
+        " ".join(query),
+        state=None if state is None else ElementState(state),
+        type_=type_,
+    )
+    repo.close()
+
+    table = Table(box=box.MINIMAL_HEAVY_HEAD)
+    table.add_column("Id", justify="right", style="cyan")
+    table.add_column("Type", justify="left", style="green")
+    table.add_column("State", justify="left", style="magenta")
+    table.add_column("Description", justify="left")
+    for element in elements:
+        table.add_row(
+            str(element.id_),
+            element.type_.title(),
+            element.state.value,
+            element.description,
+        )
+
+    console = Console()
+    console.print(table)
+
+
 class Choices(str, Enum):
     """Set the possible cli choices."""
 
@@ -101,13 +514,39 @@ class Choices(str, Enum):
 
 @cli.command()
 @click.argument("type_", required=False, default=None)
-@click.option("-n", "--newest", is_flag=True)
+@click.option("-n", "--newest", is_flag=True, help="Same as --order newest.")
+@click.option(
+    "-o",
+    "--order",
+    type=click.Choice([order.value for order in ElementOrder]),
+    default=ElementOrder.TYPE.value,
+    help="Order of the elements: by type and then the oldest first, by type and "
+    "then the newest first, or by a score of their priority, age and skips.",
+)
+@click.option(
+    "-b",
+    "--batch",
+    is_flag=True,
+    help="Select many elements at once and apply the same action to all of them.",
+)
 @click.pass_context
-def process(ctx: Context, type_: Optional[str] = None, newest: bool = False) -> None:
+def process(
+    ctx: Context,
+    type_: Optional[str] = None,
+    newest: bool = False,
+    order: str = ElementOrder.TYPE.value,
+    batch: bool = False,
+) -> None:
     """Create a TUI interface to process the elements."""
+    # C0415: Imported here so that the rest of commands don't load the TUI.
+    from questionary import Choice  # noqa: C0415
+    from rich.console import Console  # noqa: C0415
+    from rich.text import Text  # noqa: C0415
+
     console = Console()
     session_start = time.time()
-    repo = ctx.obj["repo"]
+    ctx.obj["session"] = datetime.now()
+    repo = _get_repo(ctx)
     config = ctx.obj["config"]
 
     choices = [
@@ -119,15 +558,33 @@ def process(ctx: Context, type_: Optional[str] = None, newest: bool = False) ->
         Choice(title=Choices.QUIT, shortcut_key="q"),
     ]
 
-    elements = views.get_elements(repo, config, type_, newest)
+    if newest:
+        order = ElementOrder.NEWEST.value
+    records = views.get_element_records(repo, config, type_, ElementOrder(order))
     processed_elements = 0
-    for element in elements:
+    errors: List[Exception] = []
+    if batch:
+        batch_choices = [choice for choice in choices if choice.value != Choices.COPY]
+        processed_elements = _process_batch(ctx, records, batch_choices)
+    else:
+        writer = services.WriteBehindQueue(
+            lambda: get_repo(config), config.metrics_path
+        )
         try:
-            processed_elements = _process_element(
-                ctx, element, console, choices, processed_elements
-            )
-        except StopIteration:
-            break
+            for record in records:
+                try:
+                    processed_elements = _process_element(
+                        ctx, record, console, choices, processed_elements, writer
+                    )
+                except StopIteration:
+                    break
+        finally:
+            errors = writer.flush()
+    services.compact_journal(repo)
+    if config.archive_days is not None:
+        services.archive_elements(repo, config.archive_path, config.archive_days)
+        repo.commit()
+    remaining_elements = views.count_open_elements(repo, config, type_)
     repo.close()
     session_end = time.time()
 
@@ -137,27 +594,42 @@ def process(ctx: Context, type_: Optional[str] = None, newest: bool = False) ->
         " minutes to process ",
         (str(processed_elements), "green"),
         " elements. There are still ",
-        (str(len(elements) - processed_elements), "red"),
+        (str(remaining_elements), "red"),
         " left.",
     )
     console.print(text)
+    if errors:
+        for error in errors:
+            log.error(f"Could not store a processed element: {error}")
+        ctx.exit(1)
 
 
 def _process_element(
     ctx: Context,
-    element: "Element",
-    console: Console,
-    choices: List[Choice],
+    record: "ElementRecord",
+    console: "Console",
+    choices: List["Choice"],
     processed_elements: int,
+    writer: "services.WriteBehindQueue",
 ) -> int:
-    """Create a TUI interface to process an Element."""
-    repo = ctx.obj["repo"]
+    """Create a TUI interface to process an Element.
+
+    The Element is only built from the record if it's changed. The changes are
+    stored by the writer in the background, so the next element is shown without
+    waiting for the disk. The writer records the decision too, with the time taken
+    to choose the action and to store the change.
+    """
+    # C0415: Imported here so that the rest of commands don't load the TUI.
+    from questionary import select  # noqa: C0415
+    from rich.text import Text  # noqa: C0415
+
     config = ctx.obj["config"]
 
-    if element.body is None or element.body == "":
-        prompt = f"[{element.type_.title()}] {element.description}"
+    if record.body is None or record.body == "":
+        prompt = f"[{record.type_.title()}] {record.description}"
     else:
-        prompt = f"[{element.type_.title()}] {element.description}\n\n{element.body}"
+        prompt = f"[{record.type_.title()}] {record.description}\n\n{record.body}"
+    previous = (record.type_, record.state)
     start = time.time()
     while True:
         choice = select(
@@ -167,7 +639,7 @@ def _process_element(
             use_shortcuts=True,
         ).ask()
         if choice == Choices.COPY:
-            _copy_element(element)
+            _copy_element(record)
         else:
             break
 
@@ -184,6 +656,11 @@ def _process_element(
         console.print(text)
         print()
 
+    if choice in (Choices.QUIT, None):
+        # questionary returns None when the user presses Ctrl-C.
+        raise StopIteration
+    action = Choices(choice).name.lower()
+    element = record.to_element()
     if choice == Choices.DONE:
         element.close()
         processed_elements += 1
@@ -194,18 +671,115 @@ def _process_element(
         element.skip()
     elif choice == Choices.CHANGE:
         types = [type_.name for type_ in config.types]
-        choice = select(
+        new_type = select(
             "Select the new type", choices=types, default=element.type_
         ).ask()
-        element.type_ = choice
-    elif choice == Choices.QUIT:
-        raise StopIteration
-    repo.add(element)
-    repo.commit()
+        if new_type is None:
+            raise StopIteration
+        element.type_ = new_type
+    decision = Decision(
+        id_=record.id_,
+        type_=record.type_,
+        action=action,
+        think_time=time.time() - start,
+        session=ctx.obj["session"],
+    )
+    writer.put(element, previous, decision)
+    return processed_elements
+
+
+def _process_batch(
+    ctx: Context, records: Iterator["ElementRecord"], choices: List["Choice"]
+) -> int:
+    """Create a TUI interface to apply the same action to many elements.
+
+    The elements are shown in pages that fit the terminal. The changes of each
+    action are stored with a single bulk update and commit. The session ends when
+    no element is selected or the user quits. The time taken to choose and store
+    each action is split evenly between the decisions of its elements.
+
+    Returns:
+        Number of closed or deleted elements.
+    """
+    # C0415: Imported here so that the rest of commands don't load the TUI.
+    from questionary import Choice, checkbox, select  # noqa: C0415
+
+    repo = _get_repo(ctx)
+    config = ctx.obj["config"]
+    page_size = max(10, shutil.get_terminal_size().lines - 5)
+    processed_elements = 0
+    page: List["ElementRecord"] = []
+    while True:
+        page.extend(islice(records, page_size - len(page)))
+        if len(page) == 0:
+            break
+        start = time.time()
+        selected = checkbox(
+            "Select the elements to process",
+            choices=[
+                Choice(
+                    title=f"[{record.type_.title()}] {record.description}",
+                    value=index,
+                )
+                for index, record in enumerate(page)
+            ],
+        ).ask()
+        if not selected:
+            break
+        selected_elements = [page[index].to_element() for index in selected]
+        choice = select(
+            f"What to do with the {len(selected_elements)} selected elements?",
+            qmark="\n",
+            choices=choices,
+            use_shortcuts=True,
+        ).ask()
+        if choice in (Choices.QUIT, None):
+            break
+        if choice == Choices.CHANGE:
+            new_type = select(
+                "Select the new type", choices=[type_.name for type_ in config.types]
+            ).ask()
+            if new_type is None:
+                break
+
+        think_time = time.time() - start
+        action = Choices(choice).name.lower()
+        changes = []
+        decisions = []
+        for element in selected_elements:
+            decisions.append(
+                Decision(
+                    id_=element.id_,
+                    type_=element.type_,
+                    action=action,
+                    think_time=think_time / len(selected_elements),
+                    session=ctx.obj["session"],
+                )
+            )
+            previous = (element.type_, element.state)
+            if choice == Choices.DONE:
+                element.close()
+                processed_elements += 1
+            elif choice == Choices.DELETE:
+                element.delete()
+                processed_elements += 1
+            elif choice == Choices.SKIP:
+                element.skip()
+            elif choice == Choices.CHANGE:
+                element.type_ = new_type
+            changes.append((element, previous))
+        start = time.time()
+        services.save_elements(repo, changes)
+        repo.commit()
+        storage_time = (time.time() - start) / len(decisions)
+        for decision in decisions:
+            decision.storage_time = storage_time
+        services.record_decisions(config.metrics_path, decisions)
+        page = [record for index, record in enumerate(page) if index not in selected]
     return processed_elements
 
 
-def _copy_element(element: "Element") -> None:
+def _copy_element(element: "ElementRecord") -> None:
     """Copy an element to the clipboard."""
     if element.body is None:
         clipboard = element.description
@@ -226,7 +800,7 @@ def null(ctx: Context) -> None:
 
     Used for the tests until we have a better solution.
     """
-    ctx.obj["repo"].close()
+    _get_repo(ctx).close()
 
 
 if __name__ == "__main__":  # pragma: no cover
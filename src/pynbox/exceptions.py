@@ -3,3 +3,11 @@
 
 class ParseError(Exception):
     """Gather the exceptions when parsing markup text."""
+
+
+class MigrationError(Exception):
+    """Gather the exceptions when migrating the elements between repositories."""
+
+
+class ExportError(Exception):
+    """Gather the exceptions when exporting the elements."""
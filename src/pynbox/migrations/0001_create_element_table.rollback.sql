@@ -0,0 +1,3 @@
+-- Remove the element table
+
+DROP TABLE element;
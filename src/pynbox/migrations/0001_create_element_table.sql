@@ -0,0 +1,14 @@
+-- Create the element table
+-- depends:
+
+CREATE TABLE element (
+    id INTEGER PRIMARY KEY,
+    type_ TEXT NOT NULL,
+    description TEXT NOT NULL,
+    body TEXT,
+    priority INTEGER NOT NULL DEFAULT 3,
+    skips INTEGER NOT NULL DEFAULT 0,
+    state TEXT NOT NULL DEFAULT 'open',
+    created TEXT NOT NULL,
+    closed TEXT
+);
@@ -0,0 +1,3 @@
+-- Remove the element counters table
+
+DROP TABLE elementcounter;
@@ -0,0 +1,9 @@
+-- Create the element counters table
+-- depends: 0001_create_element_table
+
+CREATE TABLE elementcounter (
+    id TEXT PRIMARY KEY,
+    type_ TEXT NOT NULL,
+    state TEXT NOT NULL,
+    count INTEGER NOT NULL DEFAULT 0
+);
@@ -0,0 +1,3 @@
+-- Remove the element queries index
+
+DROP INDEX element_state_type_created;
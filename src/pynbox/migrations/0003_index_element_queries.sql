@@ -0,0 +1,4 @@
+-- Index the element columns used by the pynbox queries
+-- depends: 0002_create_elementcounter_table
+
+CREATE INDEX element_state_type_created ON element (state, type_, created);
@@ -0,0 +1,6 @@
+-- Remove the full text search index of the elements
+
+DROP TRIGGER element_search_update;
+DROP TRIGGER element_search_delete;
+DROP TRIGGER element_search_insert;
+DROP TABLE element_search;
@@ -0,0 +1,27 @@
+-- Create the full text search index of the element descriptions and bodies
+-- depends: 0003_index_element_queries
+
+CREATE VIRTUAL TABLE element_search USING fts5(
+    description, body, content='element', content_rowid='id'
+);
+
+INSERT INTO element_search (rowid, description, body)
+    SELECT id, description, body FROM element;
+
+CREATE TRIGGER element_search_insert AFTER INSERT ON element BEGIN
+    INSERT INTO element_search (rowid, description, body)
+        VALUES (new.id, new.description, new.body);
+END;
+
+CREATE TRIGGER element_search_delete AFTER DELETE ON element BEGIN
+    INSERT INTO element_search (element_search, rowid, description, body)
+        VALUES ('delete', old.id, old.description, old.body);
+END;
+
+CREATE TRIGGER element_search_update AFTER UPDATE OF description, body ON element
+BEGIN
+    INSERT INTO element_search (element_search, rowid, description, body)
+        VALUES ('delete', old.id, old.description, old.body);
+    INSERT INTO element_search (rowid, description, body)
+        VALUES (new.id, new.description, new.body);
+END;
@@ -0,0 +1,3 @@
+-- Remove the index of the content of the open elements
+
+DROP TABLE elementdigest;
@@ -0,0 +1,17 @@
+-- Create the index of the content of the open elements
+-- depends: 0004_create_element_search_index
+
+CREATE TABLE elementdigest (
+    id TEXT PRIMARY KEY,
+    type_ TEXT NOT NULL,
+    count INTEGER NOT NULL DEFAULT 0,
+    band_0 INTEGER,
+    band_1 INTEGER,
+    band_2 INTEGER,
+    band_3 INTEGER
+);
+
+CREATE INDEX elementdigest_band_0 ON elementdigest (type_, band_0);
+CREATE INDEX elementdigest_band_1 ON elementdigest (type_, band_1);
+CREATE INDEX elementdigest_band_2 ON elementdigest (type_, band_2);
+CREATE INDEX elementdigest_band_3 ON elementdigest (type_, band_3);
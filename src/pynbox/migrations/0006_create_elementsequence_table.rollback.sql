@@ -0,0 +1,3 @@
+-- Remove the table with the highest id given to an element
+
+DROP TABLE elementsequence;
@@ -0,0 +1,7 @@
+-- Create the table with the highest id given to an element
+-- depends: 0005_create_elementdigest_table
+
+CREATE TABLE elementsequence (
+    id TEXT PRIMARY KEY,
+    last_id INTEGER NOT NULL DEFAULT -1
+);
@@ -0,0 +1,3 @@
+-- Remove the index of the open elements of each type by id
+
+DROP INDEX element_state_type;
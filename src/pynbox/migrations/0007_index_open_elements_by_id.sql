@@ -0,0 +1,4 @@
+-- Index the open elements of each type by id, so they can be read in pages
+-- depends: 0006_create_elementsequence_table
+
+CREATE INDEX element_state_type ON element (state, type_);
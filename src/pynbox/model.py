@@ -1,8 +1,8 @@
 """Define the program models."""
 
-from datetime import datetime
+from datetime import date, datetime
 from enum import Enum
-from typing import Optional
+from typing import Any, Dict, List, NamedTuple, Optional
 
 from pydantic import BaseModel  # noqa: E0611
 from pydantic import Field
@@ -25,6 +25,25 @@ class ElementState(str, Enum):
     DELETED = "deleted"
 
 
+class ElementOrder(str, Enum):
+    """Define the possible orders to process the elements."""
+
+    # By the order of the types in the configuration, and then the oldest first.
+    TYPE = "type"
+    # By the order of the types in the configuration, and then the newest first.
+    NEWEST = "newest"
+    # By the priority score, see views.priority_score.
+    PRIORITY = "priority"
+
+
+class ExportFormat(str, Enum):
+    """Define the possible formats to export the elements."""
+
+    CSV = "csv"
+    PARQUET = "parquet"
+    ARROW = "arrow"
+
+
 class Element(Entity):
     """Define the element model."""
 
@@ -50,3 +69,171 @@ class Element(Entity):
     def skip(self) -> None:
         """Skip an element."""
         self.skips += 1
+
+
+class ElementRecord(NamedTuple):
+    """Define a read only view of an element.
+
+    It's built without validation and takes a fraction of the memory of an
+    Element, use it to list many elements. Build the Element with to_element only
+    when it needs to be changed.
+    """
+
+    id_: int
+    type_: str
+    description: str
+    body: Optional[str]
+    priority: int
+    skips: int
+    state: ElementState
+    created: datetime
+    closed: Optional[datetime]
+
+    @classmethod
+    def from_row(cls, row: Dict[str, Any]) -> "ElementRecord":
+        """Build the record from the stored attributes of an element.
+
+        Args:
+            row: Attributes of the element, with the dates either as datetime
+                objects or as ISO 8601 strings.
+        """
+        created = row["created"]
+        closed = row["closed"]
+        return cls(
+            id_=row["id_"],
+            type_=row["type_"],
+            description=row["description"],
+            body=row["body"],
+            priority=row["priority"],
+            skips=row["skips"],
+            state=ElementState(row["state"]),
+            created=(
+                datetime.fromisoformat(created) if isinstance(created, str) else created
+            ),
+            closed=datetime.fromisoformat(closed)
+            if isinstance(closed, str)
+            else closed,
+        )
+
+    def to_element(self) -> "Element":
+        """Build the Element of the record."""
+        element = Element(**self._asdict())
+        # Mimic the elements returned by the repository
+        element.clear_defined_values()
+        return element
+
+
+class ElementCounter(Entity):
+    """Define the number of stored elements of a type and state.
+
+    It's kept up to date each time an element is added or changed, so that the
+    status of the inbox can be shown without loading the elements.
+    """
+
+    type_: str
+    state: ElementState
+    count: int = 0
+
+
+class ElementSequence(Entity):
+    """Define the highest id given to an element.
+
+    The archived elements are removed from the repository, so their ids are kept
+    here to avoid giving them to new elements.
+    """
+
+    last_id: int = -1
+
+
+class JournalCompaction(Entity):
+    """Define the last compaction of the journal applied to the repository.
+
+    It's committed with the changes of the journal, so a compaction that was
+    interrupted after the commit is not applied twice.
+    """
+
+    compaction_id: str
+
+
+class ParseReport(BaseModel):
+    """Define the result of parsing files into the repository."""
+
+    elements: int = 0
+    duplicates: int = 0
+
+
+class ElementStats(BaseModel):
+    """Define the aggregates of the history of the elements.
+
+    Attributes:
+        created: Number of elements created per type and day.
+        closed: Number of elements closed per type and day.
+        median_time_to_close: Median of the days from the creation to the closing
+            of the elements per type.
+        p90_time_to_close: 90th percentile of the days from the creation to the
+            closing of the elements per type.
+        skips: Number of elements per number of times they were skipped.
+    """
+
+    created: Dict[str, Dict[date, int]] = {}
+    closed: Dict[str, Dict[date, int]] = {}
+    median_time_to_close: Dict[str, float] = {}
+    p90_time_to_close: Dict[str, float] = {}
+    skips: Dict[int, int] = {}
+
+
+class Decision(BaseModel):
+    """Define the time taken to decide what to do with an element and store it.
+
+    Attributes:
+        id_: Id of the element.
+        type_: Type of the element when the decision was taken.
+        action: Action applied to the element, one of done, delete, skip or
+            change.
+        think_time: Seconds since the element was shown until the action was
+            chosen.
+        storage_time: Seconds taken to store the change.
+        session: Start of the processing session.
+        date: When the decision was taken.
+    """
+
+    id_: int
+    type_: str
+    action: str
+    think_time: float
+    storage_time: float = 0.0
+    session: datetime
+    date: datetime = Field(default_factory=datetime.now)
+
+
+class DecisionMetrics(BaseModel):
+    """Define the percentiles of the decisions of a type and action.
+
+    Attributes:
+        type_: Type of the elements.
+        action: Action applied to the elements.
+        decisions: Number of decisions.
+        think_time: Seconds to choose the action per percentile.
+        storage_time: Seconds to store the change per percentile.
+    """
+
+    type_: str
+    action: str
+    decisions: int
+    think_time: Dict[int, float]
+    storage_time: Dict[int, float]
+
+
+class MetricsReport(BaseModel):
+    """Define the metrics of the processing sessions.
+
+    Attributes:
+        metrics: Percentiles of the decisions per type and action.
+        sessions: Number of processing sessions.
+        session_time: Seconds from the start of the session to its last decision
+            per percentile.
+    """
+
+    metrics: List[DecisionMetrics] = []
+    sessions: int = 0
+    session_time: Dict[int, float] = {}
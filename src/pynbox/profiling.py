@@ -0,0 +1,276 @@
+"""Measure where the time of a pynbox command goes.
+
+Nothing is measured unless a Profiler is installed, so the commands run without
+overhead when they are not profiled.
+
+Classes:
+    Span: Time taken by a function of a phase of the program.
+    Profiler: Wrap the hot paths of the program in timing spans.
+"""
+
+import inspect
+import json
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from functools import wraps
+from typing import (
+    Any,
+    Callable,
+    DefaultDict,
+    Dict,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+)
+
+from repository_orm import FakeRepository, PypikaRepository, TinyDBRepository
+
+from . import services, views
+from .model import ElementRecord
+
+# Functions of the services module that are wrapped in spans, by phase.
+SERVICE_PHASES = {
+    "parse": ["parse", "parse_lines", "parse_file", "parse_files", "parse_paths"],
+    "storage": [
+        "add_elements",
+        "save_elements",
+        "record_element",
+        "compact_journal",
+        "archive_elements",
+        "export_elements",
+    ],
+}
+
+
+class Span(NamedTuple):
+    """Define the time taken by a function of a phase of the program.
+
+    Attributes:
+        phase: Part of the program, such as parse, views or commit.
+        name: Name of the measured function.
+        calls: Number of times it was called.
+        total: Seconds spent in the function.
+        self_time: Seconds spent in the function but not in the other spans it
+            called.
+    """
+
+    phase: str
+    name: str
+    calls: int
+    total: float
+    self_time: float
+
+
+class Profiler:
+    """Wrap the hot paths of the program in timing spans.
+
+    The configuration loading, the repository initialization, the parsing, the
+    views, the building of the Element objects, the storage services and the
+    repository commits are measured. The functions are replaced by timed
+    versions when the profiler is installed, and restored when it's uninstalled.
+
+    The spans of each thread are tracked apart, so the time of a span doesn't
+    include the spans it calls, nor the spans run meanwhile in other threads.
+    """
+
+    def __init__(self) -> None:
+        """Start the clock of the profiler."""
+        self.start = time.perf_counter()
+        self.end: Optional[float] = None
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._calls: DefaultDict[Tuple[str, str], int] = defaultdict(int)
+        self._totals: DefaultDict[Tuple[str, str], float] = defaultdict(float)
+        self._self_times: DefaultDict[Tuple[str, str], float] = defaultdict(float)
+        # Open and close events of the spans per thread, for the speedscope dump.
+        self._events: DefaultDict[str, List[Tuple[str, str, float]]] = defaultdict(list)
+        self._patches: List[Tuple[Any, str, Any]] = []
+
+    @contextmanager
+    def span(self, phase: str, name: str) -> Iterator[None]:
+        """Measure the time of a block of code.
+
+        Args:
+            phase: Part of the program, such as parse, views or commit.
+            name: Name of the measured function.
+        """
+        stack = self._stack()
+        thread = threading.current_thread().name
+        start = time.perf_counter()
+        stack.append(0.0)
+        self._events[thread].append(("O", name, start))
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            self._events[thread].append(("C", name, end))
+            children_time = stack.pop()
+            duration = end - start
+            if stack:
+                stack[-1] += duration
+            with self._lock:
+                self._calls[(phase, name)] += 1
+                self._totals[(phase, name)] += duration
+                self._self_times[(phase, name)] += duration - children_time
+
+    def wrap(self, phase: str, name: str, function: Callable[..., Any]) -> Any:
+        """Return a version of the function that is measured in a span.
+
+        The generator functions are measured each time they are advanced, as
+        their work is done while they are consumed.
+
+        Args:
+            phase: Part of the program, such as parse, views or commit.
+            name: Name of the function in the spans.
+            function: Function to measure.
+        """
+        if inspect.isgeneratorfunction(function):
+
+            @wraps(function)
+            def timed_generator(*args: Any, **kwargs: Any) -> Any:
+                iterator = function(*args, **kwargs)
+                while True:
+                    with self.span(phase, name):
+                        try:
+                            value = next(iterator)
+                        except StopIteration as stop:
+                            return stop.value
+                    yield value
+
+            return timed_generator
+
+        @wraps(function)
+        def timed_function(*args: Any, **kwargs: Any) -> Any:
+            with self.span(phase, name):
+                return function(*args, **kwargs)
+
+        return timed_function
+
+    def install(self) -> None:
+        """Replace the hot paths of the program by their measured versions."""
+        # C0415: Imported here to avoid the circular import with the entrypoints.
+        from . import entrypoints  # noqa: C0415
+        from .entrypoints import cli  # noqa: C0415
+
+        for module in (entrypoints, cli):
+            self._patch(module, "get_repo", "repository", "get_repo")
+        for phase, names in SERVICE_PHASES.items():
+            for name in names:
+                self._patch(services, name, phase, f"services.{name}")
+        for name, function in vars(views).copy().items():
+            if (
+                inspect.isfunction(function)
+                and function.__module__ == views.__name__
+                and not name.startswith("_")
+            ):
+                self._patch(views, name, "views", f"views.{name}")
+        self._patch(views, "_build_page", "hydration", "views._build_page")
+        self._patch(
+            ElementRecord, "to_element", "hydration", "ElementRecord.to_element"
+        )
+        self._patch(ElementRecord, "from_row", "hydration", "ElementRecord.from_row")
+        for repository in (FakeRepository, PypikaRepository, TinyDBRepository):
+            self._patch(repository, "commit", "commit", f"{repository.__name__}.commit")
+
+    def uninstall(self) -> None:
+        """Restore the original functions and stop the clock."""
+        for owner, attribute, original in reversed(self._patches):
+            setattr(owner, attribute, original)
+        self._patches = []
+        self.end = time.perf_counter()
+
+    def spans(self) -> List[Span]:
+        """Return the measured spans from the highest self time to the lowest."""
+        with self._lock:
+            spans = [
+                Span(
+                    phase=phase,
+                    name=name,
+                    calls=calls,
+                    total=self._totals[(phase, name)],
+                    self_time=self._self_times[(phase, name)],
+                )
+                for (phase, name), calls in self._calls.items()
+            ]
+        return sorted(spans, key=lambda span: span.self_time, reverse=True)
+
+    def phases(self) -> Dict[str, float]:
+        """Return the self time of each phase, from the highest to the lowest."""
+        phases: DefaultDict[str, float] = defaultdict(float)
+        for span in self.spans():
+            phases[span.phase] += span.self_time
+        return dict(sorted(phases.items(), key=lambda phase: phase[1], reverse=True))
+
+    def wall_time(self) -> float:
+        """Return the seconds since the profiler started until it was uninstalled."""
+        return (self.end or time.perf_counter()) - self.start
+
+    def dump_speedscope(self, file_path: str) -> None:
+        """Write the spans in the speedscope evented format.
+
+        See https://www.speedscope.app/file-format-schema.json, there is one
+        profile per thread.
+
+        Args:
+            file_path: Path of the file to write.
+        """
+        frames: Dict[str, int] = {}
+        profiles = []
+        end = self.end or time.perf_counter()
+        for thread, thread_events in list(self._events.items()):
+            events = []
+            for event_type, name, at in thread_events:
+                frame = frames.setdefault(name, len(frames))
+                events.append(
+                    {
+                        "type": event_type,
+                        "frame": frame,
+                        "at": (at - self.start) * 1000,
+                    }
+                )
+            profiles.append(
+                {
+                    "type": "evented",
+                    "name": thread,
+                    "unit": "milliseconds",
+                    "startValue": 0,
+                    "endValue": (end - self.start) * 1000,
+                    "events": events,
+                }
+            )
+        with open(file_path, "w", encoding="utf-8") as file_descriptor:
+            json.dump(
+                {
+                    "$schema": "https://www.speedscope.app/file-format-schema.json",
+                    "shared": {"frames": [{"name": name} for name in frames]},
+                    "profiles": profiles,
+                    "name": "pynbox",
+                    "exporter": "pynbox",
+                },
+                file_descriptor,
+            )
+
+    def _stack(self) -> List[float]:
+        """Return the time spent in the children of the open spans of the thread."""
+        try:
+            return self._local.stack
+        except AttributeError:
+            self._local.stack = []
+            return self._local.stack
+
+    def _patch(self, owner: Any, attribute: str, phase: str, name: str) -> None:
+        """Replace an attribute of a module or class by its measured version.
+
+        The class and static methods are wrapped keeping their kind.
+        """
+        original = inspect.getattr_static(owner, attribute)
+        if isinstance(original, (classmethod, staticmethod)):
+            timed: Any = type(original)(self.wrap(phase, name, original.__func__))
+        else:
+            timed = self.wrap(phase, name, original)
+        self._patches.append((owner, attribute, original))
+        setattr(owner, attribute, timed)
@@ -4,18 +4,72 @@ Classes and functions that connect the different domain model objects with the a
 and handlers to achieve the program's purpose.
 """
 
+import csv
+import fcntl
+import glob
+import gzip
+import hashlib
+import json
 import logging
+import os
 import re
-from typing import List, Optional
+import time
+import uuid
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager, suppress
+from datetime import datetime, timedelta
+from enum import Enum
+from functools import lru_cache
+from itertools import islice, repeat
+from queue import Queue
+from threading import Thread
+from typing import (
+    Any,
+    BinaryIO,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Pattern,
+    Set,
+    Tuple,
+)
 
-from repository_orm import Repository
+from repository_orm import (
+    EntityNotFoundError,
+    PypikaRepository,
+    Repository,
+    TinyDBRepository,
+)
+from tinydb import Query
 
-from .config import Config
-from .exceptions import ParseError
-from .model import Element
+from .config import Config, DuplicateMode
+from .exceptions import ExportError, MigrationError, ParseError
+from .model import (
+    Decision,
+    Element,
+    ElementCounter,
+    ElementSequence,
+    ElementState,
+    ExportFormat,
+    JournalCompaction,
+    ParseReport,
+)
+from .views import count_elements
 
 log = logging.getLogger(__name__)
 
+ElementKey = Tuple[str, ElementState]
+# Hash of the type and normalized content of an element, and its type.
+ContentKey = Tuple[str, str]
+# Changed element, its (type, state) before the change and the decision.
+QueuedChange = Tuple[Element, ElementKey, Optional[Decision]]
+
+PRIORITY_REGEXP = re.compile(r"\s([h])(?:\s|$)", re.IGNORECASE)
+
 
 def parse(config: Config, text: str) -> List[Element]:
     """Extract Elements from a text.
@@ -27,74 +81,1809 @@ def parse(config: Config, text: str) -> List[Element]:
     Returns:
         List of extracted Elements.
     """
-    elements: List[Element] = []
-    element = None
+    return list(parse_lines(config, text.splitlines()))
 
-    type_regexps = {
-        type_.name: re.compile(rf"^{type_.regexp} ?(.*)", re.IGNORECASE)
-        for type_ in config.types
-    }
-    priority_regexp = re.compile(r"\s([h])(?:\s|$)", re.IGNORECASE)
+
+def parse_lines(config: Config, lines: Iterable[str]) -> Iterator[Element]:
+    """Extract Elements from an iterable of lines.
+
+    The elements are yielded as soon as the next one starts, so the lines can be
+    read lazily, for example iterating over an open file.
+
+    Args:
+        config: pynbox configuration instance.
+        lines: To process.
+
+    Yields:
+        The extracted Elements.
+
+    Raises:
+        ParseError: if the first line doesn't match any element type.
+    """
+    element: Optional[Element] = None
+    body: List[str] = []
+
+    matcher = type_matcher(config)
 
     log.debug("Parsing elements")
-    for line in text.splitlines():
-        for type_, regexp in type_regexps.items():
-            match = regexp.match(line)
-            if match:
-                elements = _register_element(element, elements)
-                element = Element(type_=type_, description=match.groups()[0])
-                if priority_regexp.search(line):
-                    element.description = priority_regexp.sub("", element.description)
-                    element.priority = 5
-                break
+    for line in lines:
+        line = line.rstrip("\r\n")
+        match = matcher.match(line)
+        if match is not None:
+            if element is not None:
+                yield _register_element(element, body)
+                body = []
+            element = Element(type_=match[0], description=match[1])
+            if PRIORITY_REGEXP.search(line):
+                element.description = PRIORITY_REGEXP.sub("", element.description)
+                element.priority = 5
         else:
             if element is None:
                 raise ParseError(f"No element to append the body of line {line}")
-            if element.body is None:
-                element.body = f"{line}"
+            body.append(line)
+
+    if element is not None:
+        yield _register_element(element, body)
+
+
+# Characters that can't be taken as literals at the start of a regular expression.
+_REGEXP_SPECIAL_CHARACTERS = set(".^$*+?{}[]|()\\")
+
+
+def _literal_prefix(regexp: str) -> str:
+    """Extract the literal text that every line matching a regexp starts with.
+
+    The extraction is conservative: it stops at the first construct it doesn't
+    understand, and it returns an empty prefix if the regexp has alternatives.
+
+    Args:
+        regexp: Regular expression of an element type.
+
+    Returns:
+        The lowercase literal prefix, which may be empty.
+    """
+    if "|" in regexp:
+        return ""
+    prefix: List[str] = []
+    index = 1 if regexp.startswith("^") else 0
+    while index < len(regexp):
+        character = regexp[index]
+        width = 1
+        if character == "\\":
+            character = regexp[index + 1 : index + 2]
+            width = 2
+            # Escaped letters and digits are classes or references, like \d or \1.
+            if character == "" or character.isalnum():
+                break
+        elif character in _REGEXP_SPECIAL_CHARACTERS:
+            break
+        # The case insensitive comparison is only safe for ascii characters.
+        if not character.isascii():
+            break
+        if regexp[index + width : index + width + 1] in ("?", "*", "{"):
+            # The character is optional.
+            break
+        prefix.append(character.lower())
+        index += width
+    return "".join(prefix)
+
+
+class _TypeMatcher:
+    """Find the element type of a line.
+
+    Testing every type regexp against each line makes the parsing slower the more
+    types there are, even when they are combined in one alternation, as Python
+    tries its branches from left to right. Most type regexps start with a literal
+    text though, so the candidate types of a line are picked first by looking up
+    the start of the line in a map of literal prefixes, and only their regexps,
+    together with the ones without a literal prefix, are matched.
+
+    The candidates are combined in one alternation in the configured order, so
+    when several types match the same line the first configured type wins, as it
+    did when the regular expressions were tested one by one.
+    """
+
+    def __init__(self, types: Tuple[Tuple[str, str], ...]) -> None:
+        """Index the element types by their literal prefix.
+
+        Args:
+            types: Tuple of (name, regexp) of each element type.
+        """
+        self.types = types
+        self.group_types = {f"_{index}": name for index, (name, _) in enumerate(types)}
+        self.prefixes: Dict[int, Dict[str, Tuple[int, ...]]] = defaultdict(dict)
+        self.wildcards: Tuple[int, ...] = ()
+        for index, (_, regexp) in enumerate(types):
+            prefix = _literal_prefix(regexp)
+            if prefix == "":
+                self.wildcards += (index,)
             else:
-                element.body += f"\n{line}"
+                same_length = self.prefixes[len(prefix)]
+                same_length[prefix] = same_length.get(prefix, ()) + (index,)
+        self.patterns: Dict[Tuple[int, ...], Optional[Pattern[str]]] = {}
 
-    elements = _register_element(element, elements)
-    return elements
+    def match(self, line: str) -> Optional[Tuple[str, str]]:
+        """Find the element type of a line.
+
+        Args:
+            line: Line to match.
+
+        Returns:
+            The type name and the description of the element, or None if the line
+            doesn't match any type.
+        """
+        candidates = self.wildcards
+        for length, prefixes in self.prefixes.items():
+            indexes = prefixes.get(line[:length].casefold())
+            if indexes is not None:
+                candidates += indexes
+        try:
+            pattern = self.patterns[candidates]
+        except KeyError:
+            pattern = self.patterns[candidates] = self._compile(candidates)
+        if pattern is None:
+            return None
+        match = pattern.match(line)
+        if match is None:
+            return None
+        # The description group is the last one to close, so `lastgroup` points at
+        # it even if the type regexp has named groups of its own.
+        group = str(match.lastgroup)
+        return self.group_types[group], match.group(group)
+
+    def _compile(self, candidates: Tuple[int, ...]) -> Optional[Pattern[str]]:
+        """Combine the regular expressions of the candidate types in one alternation.
+
+        Args:
+            candidates: Indexes of the candidate types.
+
+        Returns:
+            The combined regular expression, or None if there are no candidates.
+        """
+        if len(candidates) == 0:
+            return None
+        alternatives = [
+            rf"(?:{self.types[index][1]}) ?(?P<_{index}>.*)"
+            for index in sorted(candidates)
+        ]
+        return re.compile(rf"^(?:{'|'.join(alternatives)})", re.IGNORECASE)
+
+
+def type_matcher(config: Config) -> _TypeMatcher:
+    """Return the matcher that identifies all the element types.
+
+    The matcher is cached, so it's only built once per set of types.
+
+    Args:
+        config: pynbox configuration instance.
+
+    Returns:
+        Matcher of the configured element types.
+    """
+    return _compile_type_matcher(
+        tuple((type_.name, type_.regexp) for type_ in config.types)
+    )
+
+
+@lru_cache(maxsize=None)
+def _compile_type_matcher(types: Tuple[Tuple[str, str], ...]) -> _TypeMatcher:
+    """Build the matcher of the element types.
+
+    Args:
+        types: Tuple of (name, regexp) of each element type.
+
+    Returns:
+        Matcher of the element types.
+    """
+    log.debug("Compiling the element types regular expressions")
+    return _TypeMatcher(types)
 
 
-def _register_element(
-    element: Optional[Element], elements: List[Element]
-) -> List[Element]:
-    """Register an element in a list of elements.
+def _register_element(element: Element, body: List[str]) -> Element:
+    """Set the body of a parsed element.
 
     Args:
         element: Element to register
-        elements: existing elements.
+        body: lines of the body of the element.
 
     Returns:
-        list of elements with the new element introduced.
+        The element with the body.
     """
-    if element is not None:
-        if element.body is not None:
-            element.body = element.body.strip()
-            log.debug(f"{element.type_}: {element.description}\n\n{element.body}")
-        else:
-            log.debug(f"{element.type_}: {element.description}")
-        elements.append(element)
-    return elements
+    if len(body) > 0:
+        element.body = "\n".join(body).strip()
+        log.debug(f"{element.type_}: {element.description}\n\n{element.body}")
+    else:
+        log.debug(f"{element.type_}: {element.description}")
+    return element
 
 
-def parse_file(config: Config, repo: Repository, file_path: str) -> None:
+def parse_file(
+    config: Config,
+    repo: Repository,
+    file_path: str,
+    batch_size: int = 1000,
+    truncate: bool = True,
+) -> ParseReport:
     """Parse the elements from a file.
 
+    The file is read line by line and the elements are stored in batches, so the
+    memory usage doesn't depend on the size of the file.
+
+    After each batch is committed, the byte offset where the next element starts
+    is saved in a checkpoint file next to the parsed one. If the process is
+    interrupted, the next run resumes from that offset instead of adding the
+    already stored elements again. Once all the elements are stored, the file is
+    truncated in place, so the programs that keep it open can go on appending to
+    it. If lines were appended while it was parsed, the file is kept and they are
+    parsed from the checkpoint the next time.
+
     Args:
         config: pynbox configuration instance.
         repo: repository to store the elements
         file_path: Path to file to parse.
+        batch_size: Number of elements to store in the repository at once.
+        truncate: Whether to empty the file once its elements are stored. If
+            False, the checkpoint is kept so the next parse only reads the lines
+            appended since. As the body of the last element of the file may not
+            be written yet, it's not stored until the next element starts, and
+            the checkpoint points to its start.
+
+    Returns:
+        Number of stored and dropped duplicated elements.
     """
-    with open(file_path, "r", encoding="utf-8") as file_descriptor:
-        elements = parse(config, file_descriptor.read())
+    offset = _read_checkpoint(file_path)
+    if offset == os.path.getsize(file_path):
+        # Nothing was appended since the last parse.
+        if truncate:
+            _empty_file(file_path, offset)
+        return ParseReport(elements=0, duplicates=0)
+    if offset > 0:
+        log.info(f"Resuming the parsing of {file_path} from byte {offset}")
 
-    for element in elements:
-        repo.add(element)
+    with open(file_path, "rb") as file_descriptor:
+        file_descriptor.seek(offset)
+        reader = _LineReader(file_descriptor, offset)
+        parsed = _ParsedElements(
+            parse_lines(config, reader), reader, hold_last=not truncate
+        )
+        duplicate_filter = DuplicateFilter(repo, config.duplicates)
+        elements = duplicate_filter.filter(parsed)
+        stored_elements = 0
+        while True:
+            batch = list(islice(elements, batch_size))
+            if len(batch) == 0:
+                break
+            add_elements(repo, batch)
+            duplicate_filter.store_bands()
+            stored_elements += len(batch)
+            repo.commit()
+            _write_checkpoint(file_path, parsed.boundary)
+
+    if truncate:
+        _empty_file(file_path, parsed.boundary)
+    else:
+        _write_checkpoint(file_path, parsed.boundary)
+    return ParseReport(elements=stored_elements, duplicates=duplicate_filter.duplicates)
+
+
+def parse_files(
+    config: Config,
+    repo: Repository,
+    file_paths: List[str],
+    max_workers: Optional[int] = None,
+) -> ParseReport:
+    """Parse the elements of many files and store them in one commit.
+
+    The files are parsed in parallel in a pool of processes, and their elements
+    are stored in the order of file_paths. The files are emptied only after the
+    elements are committed and their checkpoints are written, so if anything
+    fails, they can be parsed again without duplicating the elements.
+
+    Unlike parse_file, the elements of all the files are held in memory at once,
+    use it for many small files, like the ones synced from several devices.
+
+    Args:
+        config: pynbox configuration instance.
+        repo: repository to store the elements
+        file_paths: Paths to files to parse.
+        max_workers: Maximum number of parsing processes, by default the number of
+            CPUs.
+
+    Returns:
+        Number of stored and dropped duplicated elements.
+    """
+    if len(file_paths) == 0:
+        return ParseReport()
+    with ProcessPoolExecutor(
+        max_workers=min(len(file_paths), max_workers or os.cpu_count() or 1)
+    ) as executor:
+        parsed_files = list(executor.map(_parse_path, repeat(config), file_paths))
+        elements: Iterable[Element] = [
+            element for parsed_file, _ in parsed_files for element in parsed_file
+        ]
+
+    duplicate_filter = DuplicateFilter(repo, config.duplicates)
+    elements = add_elements(repo, list(duplicate_filter.filter(elements)))
+    duplicate_filter.store_bands()
     repo.commit()
 
-    with open(file_path, "w", encoding="utf-8") as file_descriptor:
-        file_descriptor.write("")
+    for file_path, (_, end) in zip(file_paths, parsed_files):
+        _write_checkpoint(file_path, end)
+    for file_path, (_, end) in zip(file_paths, parsed_files):
+        _empty_file(file_path, end)
+    return ParseReport(elements=len(elements), duplicates=duplicate_filter.duplicates)
+
+
+def parse_paths(config: Config, repo: Repository, file_paths: List[str]) -> ParseReport:
+    """Parse the elements of one or many files.
+
+    One file is parsed with parse_file, that stores the elements in batches, and
+    many with parse_files, that parses them in parallel.
+
+    Args:
+        config: pynbox configuration instance.
+        repo: repository to store the elements
+        file_paths: Paths to files to parse, for example returned by expand_paths.
+    """
+    if len(file_paths) == 1:
+        return parse_file(config, repo, file_paths[0])
+    return parse_files(config, repo, file_paths)
+
+
+def _parse_path(config: Config, file_path: str) -> Tuple[List[Element], int]:
+    """Parse the elements of a file that are not stored yet.
+
+    If parse_file was interrupted while storing the file, the elements after its
+    checkpoint are parsed.
+
+    Returns:
+        The elements and the byte offset where the parsing ended.
+    """
+    offset = _read_checkpoint(file_path)
+    with open(file_path, "rb") as file_descriptor:
+        file_descriptor.seek(offset)
+        reader = _LineReader(file_descriptor, offset)
+        return list(parse_lines(config, reader)), reader.boundary
+
+
+def expand_paths(paths: Iterable[str]) -> List[str]:
+    """Return the files to parse from a list of files, directories and globs.
+
+    The user home is expanded in the paths. The files of the directories are
+    returned sorted by name, skipping the hidden ones and the parse_file
+    checkpoints. Empty files are ignored.
+
+    Args:
+        paths: Paths to files or directories, or glob patterns.
+    """
+    file_paths: List[str] = []
+    for path in paths:
+        path = os.path.expanduser(path)
+        if os.path.isdir(path):
+            file_paths.extend(
+                os.path.join(path, name)
+                for name in sorted(os.listdir(path))
+                if not name.startswith(".") and not name.endswith(".checkpoint")
+            )
+        elif any(character in path for character in "*?["):
+            file_paths.extend(sorted(glob.glob(path)))
+        elif os.path.exists(path):
+            file_paths.append(path)
+        else:
+            log.warning(f"Skipping {path} as it doesn't exist")
+    return [
+        file_path
+        for file_path in dict.fromkeys(file_paths)
+        if os.path.isfile(file_path) and os.path.getsize(file_path) > 0
+    ]
+
+
+class DuplicateFilter:
+    """Drop the parsed elements that duplicate an open element.
+
+    The elements are indexed by the hash of their normalized type, description and
+    body, so checking an element takes the same time whatever the size of the
+    inbox. The SQL repositories keep the index of the open elements in the
+    elementdigest table, that is updated each time an element is added or
+    changed, so it's queried for each element. For the rest of repositories, that
+    hold all the elements in memory, the index is built from the open elements.
+    The elements that pass the filter are indexed too, so the duplicates inside
+    the parsed text are dropped.
+
+    In near mode, a SimHash of the words of each element is indexed too. Two
+    elements of the same type are near duplicates if their SimHashes differ in at
+    most NEAR_DISTANCE bits. The SimHashes are split in NEAR_DISTANCE + 1 bands,
+    as two near duplicates have at least one equal band, only the elements that
+    share a band are compared. The SQL repositories store the bands in the index,
+    call store_bands once the elements that passed the filter are added to the
+    repository.
+
+    Attributes:
+        duplicates: Number of dropped elements.
+    """
+
+    NEAR_DISTANCE = 3
+
+    def __init__(self, repo: Repository, mode: DuplicateMode) -> None:
+        """Index the open elements of the repository.
+
+        Args:
+            repo: repository where the elements are stored.
+            mode: How to detect the duplicates, if it's off the filter lets all
+                the elements through.
+        """
+        self.duplicates = 0
+        self._repo = repo
+        self._mode = mode
+        self._near = mode == DuplicateMode.NEAR
+        self._digests: Set[str] = set()
+        self._bands: Dict[Tuple[str, int, int], List[int]] = defaultdict(list)
+        self._new_bands: Dict[str, Tuple[int, ...]] = {}
+        if mode == DuplicateMode.OFF:
+            return
+        if isinstance(repo, PypikaRepository):
+            _build_digests(repo)
+            if self._near:
+                self._fill_bands(repo)
+            return
+        for type_, description, body in _open_element_contents(repo):
+            content = _normalize(description, body)
+            self._add(type_, _digest(type_, content), content)
+
+    def filter(self, elements: Iterable[Element]) -> Iterator[Element]:
+        """Yield the elements that are not duplicates.
+
+        Args:
+            elements: Elements to check.
+        """
+        if self._mode == DuplicateMode.OFF:
+            yield from elements
+            return
+        for element in elements:
+            content = _normalize(element.description, element.body)
+            digest = _digest(element.type_, content)
+            if self._is_duplicate(element.type_, digest, content):
+                log.debug(f"Dropping the duplicated element {element.description}")
+                self.duplicates += 1
+                continue
+            bands = self._add(element.type_, digest, content)
+            if self._near and isinstance(self._repo, PypikaRepository):
+                self._new_bands[digest] = bands
+            yield element
+
+    def store_bands(self) -> None:
+        """Store the SimHash bands of the elements that passed the filter.
+
+        It must be called after the elements are added to the repository, so that
+        they are in the index of the SQL repositories.
+        """
+        if len(self._new_bands) == 0 or not isinstance(self._repo, PypikaRepository):
+            return
+        # nosec: B608, the column names are built from the band positions.
+        self._repo.connection.executemany(
+            f"UPDATE elementdigest SET {', '.join(_band_columns(' = ?'))} "  # nosec
+            "WHERE id = ?",
+            ((*bands, digest) for digest, bands in self._new_bands.items()),
+        )
+        self._new_bands = {}
+
+    def _add(self, type_: str, digest: str, content: str) -> Tuple[int, ...]:
+        """Index the content of an element.
+
+        Returns:
+            The bands of its SimHash in near mode.
+        """
+        self._digests.add(digest)
+        if not self._near:
+            return ()
+        simhash = _simhash(content)
+        bands = tuple(self._split_bands(simhash))
+        for position, band in enumerate(bands):
+            self._bands[(type_, position, band)].append(simhash)
+        return bands
+
+    def _is_duplicate(self, type_: str, digest: str, content: str) -> bool:
+        """Check if the content of an element is already indexed."""
+        if digest in self._digests or self._is_stored(digest):
+            return True
+        if not self._near:
+            return False
+        simhash = _simhash(content)
+        bands = tuple(self._split_bands(simhash))
+        candidates = [
+            indexed
+            for position, band in enumerate(bands)
+            for indexed in self._bands.get((type_, position, band), [])
+        ]
+        candidates.extend(self._stored_candidates(type_, bands))
+        return any(
+            bin(simhash ^ indexed).count("1") <= self.NEAR_DISTANCE
+            for indexed in candidates
+        )
+
+    def _is_stored(self, digest: str) -> bool:
+        """Check if an open element of the SQL repository has the content."""
+        if not isinstance(self._repo, PypikaRepository):
+            return False
+        return (
+            self._repo.connection.execute(
+                "SELECT 1 FROM elementdigest WHERE id = ?", (digest,)
+            ).fetchone()
+            is not None
+        )
+
+    def _stored_candidates(self, type_: str, bands: Tuple[int, ...]) -> List[int]:
+        """Return the SimHashes of the SQL repository that share a band."""
+        if not isinstance(self._repo, PypikaRepository):
+            return []
+        conditions = " OR ".join(
+            f"(type_ = ? AND {column} = ?)" for column in _band_columns()
+        )
+        # nosec: B608, the column names are built from the band positions.
+        rows = self._repo.connection.execute(
+            f"SELECT {', '.join(_band_columns())} FROM elementdigest "  # nosec
+            f"WHERE {conditions}",
+            [value for band in bands for value in (type_, band)],
+        ).fetchall()
+        return [_join_bands(row) for row in rows if row[0] is not None]
+
+    def _fill_bands(self, repo: PypikaRepository) -> None:
+        """Compute the bands of the indexed contents that don't have them yet.
+
+        They are the contents of the elements added without looking for near
+        duplicates, so the open elements are only read if there are any.
+        """
+        missing = {
+            digest
+            for (digest,) in repo.connection.execute(
+                "SELECT id FROM elementdigest WHERE band_0 IS NULL"
+            )
+        }
+        if len(missing) == 0:
+            return
+        log.debug(f"Computing the SimHash of {len(missing)} open elements")
+        for type_, description, body in _open_element_contents(repo):
+            content = _normalize(description, body)
+            digest = _digest(type_, content)
+            if digest in missing:
+                self._new_bands[digest] = tuple(self._split_bands(_simhash(content)))
+        self.store_bands()
+
+    def _split_bands(self, simhash: int) -> Iterator[int]:
+        """Return the value of each band of a SimHash."""
+        bands = self.NEAR_DISTANCE + 1
+        width = 64 // bands
+        for position in range(bands):
+            yield (simhash >> (position * width)) & ((1 << width) - 1)
+
+
+def _band_columns(suffix: str = "") -> List[str]:
+    """Return the columns of the elementdigest table with the SimHash bands.
+
+    Args:
+        suffix: Text to append to each column name.
+    """
+    return [
+        f"band_{position}{suffix}"
+        for position in range(DuplicateFilter.NEAR_DISTANCE + 1)
+    ]
+
+
+def _join_bands(bands: Iterable[int]) -> int:
+    """Return the SimHash made of its bands."""
+    width = 64 // (DuplicateFilter.NEAR_DISTANCE + 1)
+    return sum(band << (position * width) for position, band in enumerate(bands))
+
+
+def _open_element_contents(
+    repo: Repository,
+) -> Iterable[Tuple[str, str, Optional[str]]]:
+    """Return the type, description and body of the open elements."""
+    if isinstance(repo, PypikaRepository):
+        return repo.connection.execute(
+            "SELECT type_, description, body FROM element WHERE state = ?",
+            (ElementState.OPEN.value,),
+        ).fetchall()
+    if isinstance(repo, TinyDBRepository):
+        return [
+            (document["type_"], document["description"], document["body"])
+            for document in repo.db_.search(
+                (Query().model_type_ == "element")
+                & (Query().state == ElementState.OPEN.value)
+            )
+        ]
+    return [
+        (element.type_, element.description, element.body)
+        for element in repo.all(Element)
+        if element.state == ElementState.OPEN
+    ]
+
+
+def _normalize(description: str, body: Optional[str]) -> str:
+    """Return the lowercase words of the description and body of an element."""
+    return " ".join(f"{description} {body or ''}".lower().split())
+
+
+def _digest(type_: str, content: str) -> str:
+    """Return the hash of the normalized content of an element."""
+    return hashlib.blake2b(f"{type_}\0{content}".encode(), digest_size=16).hexdigest()
+
+
+def _content_key(type_: str, description: str, body: Optional[str]) -> ContentKey:
+    """Return the key of an element in the content index."""
+    return _digest(type_, _normalize(description, body)), type_
+
+
+@lru_cache(maxsize=2**16)
+def _simhash(content: str) -> int:
+    """Return the 64 bit SimHash of the word pairs of a text.
+
+    The SimHashes are cached, as the repositories that don't store them compute
+    the ones of the open elements on each parse.
+    """
+    words = content.split()
+    shingles = [" ".join(pair) for pair in zip(words, words[1:])] or words
+    weights = [0] * 64
+    for shingle in shingles:
+        shingle_hash = int.from_bytes(
+            hashlib.blake2b(shingle.encode(), digest_size=8).digest(), "big"
+        )
+        for bit in range(64):
+            weights[bit] += 1 if shingle_hash >> bit & 1 else -1
+    return sum(1 << bit for bit, weight in enumerate(weights) if weight > 0)
+
+
+def add_elements(repo: Repository, elements: List[Element]) -> List[Element]:
+    """Add a batch of new elements to the repository in one operation.
+
+    The ids of the elements that don't have one are assigned at once from the
+    last id of the repository, instead of querying it for each element.
+
+    For the TinyDB and SQLite backends the new elements are inserted with a single
+    write, for the rest, they are added one by one. Elements that already have an
+    id are always added one by one so that they are updated if they exist.
+
+    As with `repo.add`, the changes need to be committed by the caller, although
+    the TinyDB backend writes the new elements to disk right away, in the same
+    write as the changes already added to the repository, like the counters, so
+    that the elements are never stored without them.
+
+    Args:
+        repo: repository to store the elements.
+        elements: Elements to add.
+
+    Returns:
+        The added elements with their ids set.
+    """
+    new_elements = []
+    next_id = None
+    for element in elements:
+        if isinstance(element.id_, int) and element.id_ < 0:
+            if next_id is None:
+                next_id = _next_element_id(repo)
+            element.id_ = next_id
+            next_id += 1
+            new_elements.append(element)
+        else:
+            repo.add(element)
+
+    if len(new_elements) == 0:
+        return elements
+    log.debug(f"Adding {len(new_elements)} new elements")
+    _update_counters(
+        repo, Counter((element.type_, element.state) for element in new_elements)
+    )
+    _update_digests(
+        repo,
+        Counter(
+            _content_key(element.type_, element.description, element.body)
+            for element in new_elements
+            if element.state == ElementState.OPEN
+        ),
+    )
+    _insert_elements(repo, new_elements)
+    return elements
+
+
+def _insert_elements(repo: Repository, elements: List[Element]) -> None:
+    """Insert elements that are not yet in the repository in one operation.
+
+    Args:
+        repo: repository to store the elements.
+        elements: Elements to insert, with their ids already set.
+    """
+    if isinstance(repo, TinyDBRepository):
+        _write_tinydb(repo, elements)
+    elif isinstance(repo, PypikaRepository):
+        columns = _sql_columns()
+        # nosec: B608, the column names are defined by the model, not by the user.
+        repo.connection.executemany(
+            f"INSERT INTO element ({', '.join(columns)}) "  # nosec
+            f"VALUES ({', '.join('?' * len(columns))})",
+            (_sql_row(element) for element in elements),
+        )
+    else:
+        repo.add(elements)
+
+
+def _write_tinydb(repo: TinyDBRepository, elements: List[Element]) -> None:
+    """Insert new elements and the entities added to the repository in one write.
+
+    TinyDBRepository.commit upserts the added entities one by one, and each upsert
+    rewrites the whole database file. Instead, the file is written once with the
+    new elements and the added entities, that are then removed from the entities
+    to commit.
+
+    Args:
+        repo: repository to store the elements.
+        elements: Elements to insert, with their ids already set.
+    """
+    staged = {
+        (entity.model_name.lower(), entity.id_): {
+            **entity.dict(),
+            "model_type_": entity.model_name.lower(),
+        }
+        for entity in repo.staged["add"]
+    }
+    table = repo.db_.table(repo.db_.default_table_name)
+    # W0212: TinyDB's insert_multiple uses it too to assign the document ids.
+    next_doc_id: Callable[[], int] = table._get_next_id  # noqa: W0212
+
+    def updater(documents: Dict[int, Any]) -> None:
+        for doc_id, document in documents.items():
+            key = (document.get("model_type_"), document.get("id_"))
+            if key in staged:
+                documents[doc_id] = staged.pop(key)
+        for document in staged.values():
+            documents[next_doc_id()] = document
+        for element in elements:
+            documents[next_doc_id()] = {**dict(element), "model_type_": "element"}
+
+    # W0212: It's the only way to update and insert documents in one write.
+    table._update_table(updater)  # noqa: W0212
+    repo.staged["add"].clear()
+
+
+def save_element(repo: Repository, element: Element, previous: ElementKey) -> None:
+    """Store the changes of an element and update the element counters.
+
+    Args:
+        repo: repository where the element is stored.
+        element: Changed element.
+        previous: (type, state) of the element before the change.
+    """
+    save_elements(repo, [(element, previous)])
+
+
+def save_elements(
+    repo: Repository, changes: Iterable[Tuple[Element, ElementKey]]
+) -> None:
+    """Store the changes of some elements and update the element counters.
+
+    The counters and the content index are changed in the same transaction as the
+    elements, so the caller only needs to commit once. The description and body
+    of the elements are expected to be unchanged.
+
+    Args:
+        repo: repository where the elements are stored.
+        changes: Changed elements with their (type, state) before the change.
+    """
+    deltas: "Counter[ElementKey]" = Counter()
+    content_deltas: "Counter[ContentKey]" = Counter()
+    renames: Dict[str, str] = {}
+    elements = []
+    for element, previous in changes:
+        deltas[previous] -= 1
+        deltas[(element.type_, element.state)] += 1
+        previous_key = _content_key(previous[0], element.description, element.body)
+        key = _content_key(element.type_, element.description, element.body)
+        if previous[1] == ElementState.OPEN:
+            content_deltas[previous_key] -= 1
+        if element.state == ElementState.OPEN:
+            content_deltas[key] += 1
+            renames[key[0]] = previous_key[0]
+        elements.append(element)
+
+    _update_counters(repo, deltas)
+    _update_digests(repo, content_deltas, renames)
+    if isinstance(repo, PypikaRepository):
+        # Use a parametrized statement, that sqlite prepares once and caches, instead
+        # of building a new SQL statement for each element.
+        id_column, *columns = _sql_columns()
+        # nosec: B608, the column names are defined by the model, not by the user.
+        repo.connection.executemany(
+            f"UPDATE element SET {', '.join(f'{column} = ?' for column in columns)} "
+            f"WHERE {id_column} = ?",  # nosec
+            (_sql_row(element)[1:] + _sql_row(element)[:1] for element in elements),
+        )
+    elif isinstance(repo, TinyDBRepository):
+        # Update all the documents in one pass, so the database file is rewritten
+        # once instead of once per element.
+        documents = {element.id_: dict(element) for element in elements}
+
+        def update_document(document: Dict[str, Any]) -> None:
+            document.update(documents[document["id_"]])
+
+        repo.db_.update(
+            update_document,
+            (Query().model_type_ == "element") & Query().id_.one_of(list(documents)),
+        )
+    else:
+        for element in elements:
+            repo.add(element)
+
+
+def record_element(repo: Repository, element: Element, previous: ElementKey) -> None:
+    """Persist the change of an element made while processing the inbox.
+
+    TinyDB rewrites the whole database file on each commit, so for it the change is
+    appended to a journal instead, which takes the same time whatever the size of
+    the database. The journal is applied to the database with compact_journal. The
+    rest of backends store the change and commit it.
+
+    Args:
+        repo: repository where the element is stored.
+        element: Changed element.
+        previous: (type, state) of the element before the change.
+    """
+    if not isinstance(repo, TinyDBRepository):
+        save_element(repo, element, previous)
+        repo.commit()
+        return
+    record = {
+        "previous": [previous[0], previous[1].value],
+        "element": json.loads(element.json()),
+    }
+    journal_path = _journal_path(repo)
+    with _journal_lock(journal_path, exclusive=False):
+        with open(journal_path, "a", encoding="utf-8") as journal:
+            journal.write(json.dumps(record) + "\n")
+            journal.flush()
+            os.fsync(journal.fileno())
+
+
+def compact_journal(repo: Repository) -> int:
+    """Apply the changes recorded in the journal to the repository and commit them.
+
+    The journal is moved aside, to a file named after the id of the compaction,
+    before reading it, so the changes recorded while it's compacted go to a new
+    journal. The id is committed with the changes, so if the compaction is
+    interrupted before removing the file, the next one knows whether its changes
+    were applied. If they weren't, the journal is appended to the file left
+    behind instead of moving it aside. The whole compaction holds the journal
+    lock, so two processes don't compact the same journal at once.
+
+    The records that can't be read or don't define a valid element are moved to
+    the rejected journal, so they don't prevent the rest from being applied.
+
+    Args:
+        repo: repository where the elements are stored.
+
+    Returns:
+        Number of changed elements.
+    """
+    if not isinstance(repo, TinyDBRepository):
+        return 0
+    journal_path = _journal_path(repo)
+    with _journal_lock(journal_path, exclusive=True):
+        compacting_path = _compacting_journal(repo, journal_path)
+        if compacting_path is None:
+            return 0
+        with open(compacting_path, "r", encoding="utf-8") as journal:
+            lines = journal.readlines()
+
+        changes: Dict[Any, Tuple[Element, ElementKey]] = {}
+        rejected: List[str] = []
+        for line in lines:
+            try:
+                record = json.loads(line)
+                element = Element.parse_obj(record["element"])
+                previous_type, previous_state = record["previous"]
+                previous = (previous_type, ElementState(previous_state))
+            except (ValueError, KeyError, TypeError) as error:
+                # The last record may be half written if the program was killed,
+                # and the older versions could record elements without type.
+                log.warning(
+                    f"Ignoring the corrupt journal record {line.strip()}: {error}"
+                )
+                rejected.append(line if line.endswith("\n") else f"{line}\n")
+                continue
+            # The counters need the element state before the first recorded change.
+            if element.id_ in changes:
+                previous = changes[element.id_][1]
+            changes[element.id_] = (element, previous)
+
+        log.debug(f"Compacting {len(changes)} changed elements from the journal")
+        if len(rejected) > 0:
+            with open(f"{journal_path}.rejected", "a", encoding="utf-8") as quarantine:
+                quarantine.writelines(rejected)
+        save_elements(repo, changes.values())
+        compaction = JournalCompaction(
+            id_="journal", compaction_id=_compaction_id(journal_path, compacting_path)
+        )
+        repo.cache.remove(compaction)
+        repo.add(compaction)
+        repo.commit()
+        os.remove(compacting_path)
+    return len(changes)
+
+
+def _compacting_journal(repo: TinyDBRepository, journal_path: str) -> Optional[str]:
+    """Return the path of the journal to compact.
+
+    The journal left by an interrupted compaction is removed if its changes were
+    committed, or else the journal is appended to it.
+
+    Args:
+        repo: repository where the elements are stored.
+        journal_path: Path to the journal with the newest records.
+
+    Returns:
+        The path or None if there is nothing to compact.
+    """
+    try:
+        applied = repo.get("journal", JournalCompaction).compaction_id
+    except EntityNotFoundError:
+        applied = None
+    for compacting_path in sorted(
+        glob.glob(f"{glob.escape(journal_path)}.*.compacting")
+    ):
+        if _compaction_id(journal_path, compacting_path) == applied:
+            log.debug(f"Removing the already applied journal {compacting_path}")
+            os.remove(compacting_path)
+            continue
+        _append_journal(journal_path, compacting_path)
+        return compacting_path
+    compacting_path = f"{journal_path}.{uuid.uuid4().hex}.compacting"
+    try:
+        os.replace(journal_path, compacting_path)
+    except FileNotFoundError:
+        return None
+    return compacting_path
+
+
+def _compaction_id(journal_path: str, compacting_path: str) -> str:
+    """Return the id of a compaction from the path of its journal."""
+    return compacting_path[len(journal_path) + 1 : -len(".compacting")]
+
+
+@contextmanager
+def _journal_lock(journal_path: str, exclusive: bool) -> Iterator[None]:
+    """Hold the lock of a journal.
+
+    The compactions take it exclusively, and the writers shared, so they can
+    append at the same time but not while the journal is being compacted.
+
+    Args:
+        journal_path: Path to the journal.
+        exclusive: Whether to take the lock exclusively.
+    """
+    with open(f"{journal_path}.lock", "a", encoding="utf-8") as lock:
+        fcntl.flock(lock.fileno(), fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock.fileno(), fcntl.LOCK_UN)
+
+
+def _append_journal(journal_path: str, compacting_path: str) -> None:
+    """Move the records of the journal to the end of the compacting one.
+
+    Args:
+        journal_path: Path to the journal with the newest records.
+        compacting_path: Path to the journal left by an interrupted compaction.
+    """
+    try:
+        with open(journal_path, "rb") as journal:
+            content = journal.read()
+    except FileNotFoundError:
+        return
+    with open(compacting_path, "rb+") as compacting:
+        end = compacting.seek(0, os.SEEK_END)
+        # Don't join the first record to a half written one.
+        if end > 0:
+            compacting.seek(end - 1)
+            if compacting.read(1) != b"\n":
+                compacting.write(b"\n")
+        compacting.write(content)
+        compacting.flush()
+        os.fsync(compacting.fileno())
+    os.remove(journal_path)
+
+
+def _journal_path(repo: TinyDBRepository) -> str:
+    """Return the path of the journal of a TinyDB repository."""
+    return f"{repo.database_file}.journal"
+
+
+def record_decisions(metrics_path: Optional[str], decisions: List[Decision]) -> None:
+    """Append the decisions taken while processing the inbox to the metrics file.
+
+    The file is not synced to disk so that recording them is cheap, the last
+    decisions may be lost if the system crashes.
+
+    Args:
+        metrics_path: Path to the metrics file, if None the decisions are not
+            recorded.
+        decisions: Decisions to record.
+    """
+    if metrics_path is None:
+        return
+    metrics_path = os.path.expanduser(metrics_path)
+    os.makedirs(os.path.dirname(os.path.abspath(metrics_path)), exist_ok=True)
+    with open(metrics_path, "a", encoding="utf-8") as metrics_file:
+        metrics_file.writelines(decision.json() + "\n" for decision in decisions)
+
+
+class WriteBehindQueue:
+    """Store the element changes in a background thread.
+
+    The changes are recorded with record_element in the order they were queued,
+    so the caller doesn't wait for the disk. The thread opens its own repository
+    with repo_factory, as SQLite connections can't be shared between threads.
+    If the change comes with its decision, the time taken to record it is added
+    to the decision, and the decision is appended to the metrics file.
+
+    Attributes:
+        errors: Exceptions raised while storing the changes.
+    """
+
+    def __init__(
+        self,
+        repo_factory: Callable[[], Repository],
+        metrics_path: Optional[str] = None,
+    ) -> None:
+        """Start the thread that stores the changes.
+
+        Args:
+            repo_factory: Function that returns the repository to store the
+                changes.
+            metrics_path: Path to the file to record the decisions.
+        """
+        self.errors: List[Exception] = []
+        self.metrics_path = metrics_path
+        self._repo_factory = repo_factory
+        self._queue: "Queue[Optional[QueuedChange]]" = Queue()
+        self._thread = Thread(target=self._store_changes, daemon=True)
+        self._thread.start()
+
+    def put(
+        self,
+        element: Element,
+        previous: ElementKey,
+        decision: Optional[Decision] = None,
+    ) -> None:
+        """Queue the change of an element to be stored.
+
+        Args:
+            element: Changed element, it's copied so it can still be changed.
+            previous: (type, state) of the element before the change.
+            decision: Decision that changed the element.
+        """
+        self._queue.put((element.copy(), previous, decision))
+
+    def flush(self) -> List[Exception]:
+        """Wait until the queued changes are stored and stop the thread.
+
+        Returns:
+            Exceptions raised while storing the changes.
+        """
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+        return self.errors
+
+    def _store_changes(self) -> None:
+        """Record the queued changes until flush is called."""
+        try:
+            repo = self._repo_factory()
+        except Exception as error:  # noqa: W0703
+            self.errors.append(error)
+            return
+        while True:
+            change = self._queue.get()
+            if change is None:
+                break
+            element, previous, decision = change
+            try:
+                start = time.perf_counter()
+                record_element(repo, element, previous)
+                if decision is not None:
+                    decision.storage_time = time.perf_counter() - start
+                    record_decisions(self.metrics_path, [decision])
+            except Exception as error:  # noqa: W0703
+                log.debug(f"Could not store the change of element {element.id_}")
+                self.errors.append(error)
+        repo.close()
+
+
+def migrate_elements(
+    source_repo: Repository, repo: Repository, batch_size: int = 10000
+) -> int:
+    """Copy the elements of a repository into another empty one.
+
+    It's meant to move the elements to a different storage backend, for example
+    from TinyDB to SQLite. The element ids are kept, and the counters are built in
+    the destination repository. The caller needs to commit the changes.
+
+    Args:
+        source_repo: repository to copy the elements from.
+        repo: empty repository to store the elements.
+        batch_size: Number of elements to insert at once.
+
+    Returns:
+        Number of migrated elements.
+
+    Raises:
+        MigrationError: if the destination repository already has elements.
+    """
+    if _next_element_id(repo) != 0:
+        raise MigrationError(
+            "The destination repository already has elements, refusing to migrate"
+        )
+    elements = source_repo.all(Element)
+    log.info(f"Migrating {len(elements)} elements")
+    for start in range(0, len(elements), batch_size):
+        _insert_elements(repo, elements[start : start + batch_size])
+    last_id = _last_element_id(source_repo)
+    if last_id >= 0:
+        _store_last_element_id(repo, last_id)
+    rebuild_counters(repo)
+    return len(elements)
+
+
+def rebuild_counters(repo: Repository) -> None:
+    """Recompute the element counters and the content index from the stored elements.
+
+    Use it if the counters drift from the real number of elements, for example if
+    the elements were changed by other programs. The caller needs to commit the
+    changes.
+
+    Args:
+        repo: repository where the elements are stored.
+    """
+    log.info("Rebuilding the element counters")
+    counts = count_elements(repo)
+    for counter in repo.all(ElementCounter):
+        counts.setdefault((counter.type_, counter.state), 0)
+    for key, count in counts.items():
+        _store_counter(repo, key, count)
+    if isinstance(repo, PypikaRepository):
+        repo.connection.execute("DELETE FROM elementdigest")
+        _build_digests(repo)
+
+
+def archive_elements(repo: Repository, archive_path: str, days: int) -> int:
+    """Move the closed and deleted elements older than some days to the archive.
+
+    The elements are written to a new gzip compressed JSON lines segment in the
+    archive directory, and then removed from the repository, so that it only holds
+    the elements that are still useful. The archived elements keep their ids, and
+    the highest id given is stored so that new elements don't reuse them. The
+    caller needs to commit the changes.
+
+    Args:
+        repo: repository where the elements are stored.
+        archive_path: Directory to store the archive segments.
+        days: Minimum number of days since the elements were closed or deleted.
+
+    Returns:
+        Number of archived elements.
+    """
+    elements = _closed_elements(repo, datetime.now() - timedelta(days=days))
+    if len(elements) == 0:
+        return 0
+
+    log.info(f"Archiving {len(elements)} elements")
+    _write_archive_segment(os.path.expanduser(archive_path), elements)
+    _store_last_element_id(repo, _next_element_id(repo) - 1)
+    deltas: "Counter[ElementKey]" = Counter()
+    for element in elements:
+        deltas[(element.type_, element.state)] -= 1
+    _update_counters(repo, deltas)
+    ids = [element.id_ for element in elements]
+    if isinstance(repo, TinyDBRepository):
+        repo.db_.remove((Query().model_type_ == "element") & Query().id_.one_of(ids))
+    elif isinstance(repo, PypikaRepository):
+        repo.connection.executemany(
+            "DELETE FROM element WHERE id = ?", ((id_,) for id_ in ids)
+        )
+    else:
+        for element in elements:
+            repo.delete(element)
+    return len(elements)
+
+
+def archived_elements(archive_path: str) -> Iterator[Element]:
+    """Read the elements of the archive, from the oldest segment to the newest.
+
+    Args:
+        archive_path: Directory where the archive segments are stored.
+    """
+    archive_path = os.path.expanduser(archive_path)
+    if not os.path.isdir(archive_path):
+        return
+    for segment in sorted(os.listdir(archive_path)):
+        if not segment.endswith(".jsonl.gz"):
+            continue
+        with gzip.open(os.path.join(archive_path, segment), "rt") as segment_file:
+            for line in segment_file:
+                yield Element.parse_raw(line)
+
+
+def _closed_elements(repo: Repository, limit: datetime) -> List[Element]:
+    """Return the closed and deleted elements of the repository older than limit.
+
+    The elements without closing date are compared by their creation date.
+    """
+    if isinstance(repo, PypikaRepository):
+        cursor = repo.connection.execute(
+            "SELECT * FROM element WHERE state != ? AND COALESCE(closed, created) < ?",
+            (ElementState.OPEN.value, limit.isoformat()),
+        )
+        columns = [
+            "id_" if column[0] == "id" else column[0] for column in cursor.description
+        ]
+        return [Element(**dict(zip(columns, row))) for row in cursor.fetchall()]
+
+    if isinstance(repo, TinyDBRepository):
+        elements = [
+            Element(**row)
+            for row in repo.db_.search(
+                (Query().model_type_ == "element")
+                & (Query().state != ElementState.OPEN.value)
+            )
+        ]
+    else:
+        elements = [
+            element
+            for element in repo.all(Element)
+            if element.state != ElementState.OPEN
+        ]
+    return [
+        element for element in elements if (element.closed or element.created) < limit
+    ]
+
+
+def _write_archive_segment(archive_path: str, elements: List[Element]) -> None:
+    """Write the elements to a new archive segment.
+
+    The segment is written to a temporary file and then renamed, so a segment is
+    never left half written.
+    """
+    os.makedirs(archive_path, exist_ok=True)
+    segment = os.path.join(
+        archive_path, f"elements-{datetime.now().strftime('%Y%m%dT%H%M%S%f')}.jsonl.gz"
+    )
+    with gzip.open(f"{segment}.tmp", "wt") as segment_file:
+        for element in elements:
+            segment_file.write(element.json() + "\n")
+    os.replace(f"{segment}.tmp", segment)
+
+
+def export_elements(
+    repo: Repository,
+    file_path: str,
+    format_: ExportFormat = ExportFormat.CSV,
+    chunk_size: int = 10000,
+) -> int:
+    """Write all the elements of the repository to a file, ordered by id.
+
+    The elements are read and written in chunks, so the memory use doesn't grow
+    with the size of the repository. The parquet and arrow formats store each
+    chunk as a row group or record batch, and need the pyarrow package. The file
+    is written to a temporary file and then renamed, so it's never left half
+    written.
+
+    Args:
+        repo: repository where the elements are stored.
+        file_path: Path of the file to write.
+        format_: Format of the file.
+        chunk_size: Number of elements to read and write at once.
+
+    Raises:
+        ExportError: If the format needs a package that is not installed.
+
+    Returns:
+        Number of exported elements.
+    """
+    columns = _sql_columns()
+    chunks = _element_row_chunks(repo, chunk_size)
+    if format_ == ExportFormat.CSV:
+        exported_elements = _write_csv(f"{file_path}.tmp", columns, chunks)
+    else:
+        exported_elements = _write_arrow(f"{file_path}.tmp", columns, chunks, format_)
+    os.replace(f"{file_path}.tmp", file_path)
+    return exported_elements
+
+
+def _element_row_chunks(
+    repo: Repository, chunk_size: int
+) -> Iterator[List[Tuple[Any, ...]]]:
+    """Yield the values of the elements ordered by id in chunks.
+
+    The values are in the order of _sql_columns, with the dates as ISO 8601
+    strings.
+    """
+    if isinstance(repo, PypikaRepository):
+        # nosec: B608, the columns are not defined by the user.
+        cursor = repo.connection.execute(
+            f"SELECT {', '.join(_sql_columns())} FROM element ORDER BY id"  # nosec
+        )
+        yield from iter(lambda: cursor.fetchmany(chunk_size), [])
+        return
+
+    if isinstance(repo, TinyDBRepository):
+        documents = repo.db_.search(Query().model_type_ == "element")
+        documents.sort(key=lambda document: document["id_"])
+        rows: Iterator[Tuple[Any, ...]] = (
+            tuple(
+                _isoformat(document[field])
+                if field in ("created", "closed")
+                else document[field]
+                for field in Element.__fields__
+            )
+            for document in documents
+        )
+    else:
+        elements: List[Element] = []
+        with suppress(EntityNotFoundError):
+            elements = sorted(repo.all(Element), key=lambda element: element.id_)
+        rows = (_sql_row(element) for element in elements)
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if len(chunk) == 0:
+            return
+        yield chunk
+
+
+def _isoformat(value: Any) -> Optional[str]:
+    """Return a date stored by TinyDB as an ISO 8601 string.
+
+    TinyDB keeps the datetime objects of the documents added in the session, and
+    stores them separating the date from the time with a space.
+    """
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value.replace(" ", "T", 1)
+
+
+def _write_csv(
+    file_path: str, columns: List[str], chunks: Iterator[List[Tuple[Any, ...]]]
+) -> int:
+    """Write the chunks of rows to a CSV file with a header.
+
+    Returns:
+        Number of written rows.
+    """
+    written_rows = 0
+    with open(file_path, "w", newline="", encoding="utf-8") as file_descriptor:
+        writer = csv.writer(file_descriptor)
+        writer.writerow(columns)
+        for chunk in chunks:
+            writer.writerows(chunk)
+            written_rows += len(chunk)
+    return written_rows
+
+
+def _write_arrow(
+    file_path: str,
+    columns: List[str],
+    chunks: Iterator[List[Tuple[Any, ...]]],
+    format_: ExportFormat,
+) -> int:
+    """Write the chunks of rows to a parquet or arrow IPC file.
+
+    Raises:
+        ExportError: If pyarrow is not installed.
+
+    Returns:
+        Number of written rows.
+    """
+    try:
+        # C0415: Imported here as it's an optional dependency.
+        import pyarrow  # noqa: C0415
+        import pyarrow.ipc  # noqa: C0415
+        import pyarrow.parquet  # noqa: C0415
+    except ImportError as error:
+        raise ExportError(
+            f"Exporting to {format_.value} needs pyarrow, "
+            "install it with `pip install pynbox[analytics]`"
+        ) from error
+
+    types = {
+        "id": pyarrow.int64(),
+        "priority": pyarrow.int64(),
+        "skips": pyarrow.int64(),
+        "created": pyarrow.timestamp("us"),
+        "closed": pyarrow.timestamp("us"),
+    }
+    schema = pyarrow.schema(
+        [(column, types.get(column, pyarrow.string())) for column in columns]
+    )
+    if format_ == ExportFormat.PARQUET:
+        writer = pyarrow.parquet.ParquetWriter(file_path, schema)
+    else:
+        writer = pyarrow.ipc.new_file(file_path, schema)
+    written_rows = 0
+    try:
+        for chunk in chunks:
+            arrays = []
+            for field, values in zip(schema, zip(*chunk)):
+                if pyarrow.types.is_timestamp(field.type):
+                    # The ISO 8601 strings are parsed by arrow, not row by row.
+                    array = pyarrow.array(values, pyarrow.string()).cast(field.type)
+                else:
+                    array = pyarrow.array(values, field.type)
+                arrays.append(array)
+            writer.write_table(pyarrow.Table.from_arrays(arrays, schema=schema))
+            written_rows += len(chunk)
+    finally:
+        writer.close()
+    return written_rows
+
+
+def _update_counters(repo: Repository, deltas: "Counter[ElementKey]") -> None:
+    """Apply the changes of the number of elements to the counters.
+
+    If the repository doesn't yet have counters, for example because it was
+    created with an older version of pynbox, they are first computed from the
+    stored elements. It must be called before storing the changed elements so
+    that they aren't counted twice.
+
+    Args:
+        repo: repository where the elements are stored.
+        deltas: Change of the number of elements for each (type, state).
+    """
+    counts = {
+        (counter.type_, counter.state): counter.count
+        for counter in repo.all(ElementCounter)
+    }
+    changed_keys = {key for key, delta in deltas.items() if delta != 0}
+    if len(counts) == 0:
+        log.debug("Initializing the element counters")
+        counts = count_elements(repo)
+        changed_keys.update(counts.keys())
+
+    for key in changed_keys:
+        counts[key] = counts.get(key, 0) + deltas[key]
+        _store_counter(repo, key, counts[key])
+
+
+def _store_counter(repo: Repository, key: ElementKey, count: int) -> None:
+    """Store the number of elements of a type and state.
+
+    The repository skips the entities that are equal to the first version it
+    loaded, which would drop the update of a counter that goes back to its
+    original value, so the counter is removed from the cache first.
+
+    Args:
+        repo: repository where the elements are stored.
+        key: (type, state) of the counted elements.
+        count: Number of elements.
+    """
+    type_, state = key
+    counter = ElementCounter(
+        id_=f"{type_}:{state.value}", type_=type_, state=state, count=count
+    )
+    repo.cache.remove(counter)
+    repo.add(counter)
+
+
+def _update_digests(
+    repo: Repository,
+    deltas: "Counter[ContentKey]",
+    renames: Optional[Dict[str, str]] = None,
+) -> None:
+    """Apply the changes of the number of open elements to the content index.
+
+    Only the SQL repositories keep the index. If it's empty, for example because
+    the repository was created with an older version of pynbox, it's first built
+    from the open elements. As _update_counters, it must be called before storing
+    the changed elements. The contents that are no longer open are removed.
+
+    Args:
+        repo: repository where the elements are stored.
+        deltas: Change of the number of open elements for each content.
+        renames: Digest of the content before the change, by digest after the
+            change, of the elements whose type may have changed. The SimHash
+            bands only depend on the description and body, so they are copied.
+    """
+    if not isinstance(repo, PypikaRepository):
+        return
+    _build_digests(repo)
+    repo.connection.executemany(
+        "INSERT INTO elementdigest (id, type_, count) VALUES (?, ?, ?) "
+        "ON CONFLICT (id) DO UPDATE SET count = count + excluded.count",
+        (
+            (digest, type_, delta)
+            for (digest, type_), delta in deltas.items()
+            if delta != 0
+        ),
+    )
+    # nosec: B608, the column names are built from the band positions.
+    repo.connection.executemany(
+        f"UPDATE elementdigest SET ({', '.join(_band_columns())}) = ("  # nosec
+        f"SELECT {', '.join(_band_columns())} FROM elementdigest WHERE id = ?"
+        ") WHERE id = ? AND band_0 IS NULL",
+        (
+            (previous, digest)
+            for digest, previous in (renames or {}).items()
+            if digest != previous
+        ),
+    )
+    repo.connection.executemany(
+        "DELETE FROM elementdigest WHERE id = ? AND count <= 0",
+        ((digest,) for (digest, _), delta in deltas.items() if delta < 0),
+    )
+
+
+def _build_digests(repo: PypikaRepository) -> None:
+    """Build the content index from the open elements if it's empty.
+
+    Args:
+        repo: repository where the elements are stored.
+    """
+    if repo.connection.execute("SELECT 1 FROM elementdigest LIMIT 1").fetchone():
+        return
+    counts = Counter(_content_key(*content) for content in _open_element_contents(repo))
+    if len(counts) == 0:
+        return
+    log.debug(f"Indexing the content of {sum(counts.values())} open elements")
+    repo.connection.executemany(
+        "INSERT INTO elementdigest (id, type_, count) VALUES (?, ?, ?)",
+        ((digest, type_, count) for (digest, type_), count in counts.items()),
+    )
+
+
+def _next_element_id(repo: Repository) -> int:
+    """Return the id of the next element to add to the repository.
+
+    The backends that support it get it without building all the stored elements.
+    The ids of the archived elements are never given again.
+
+    Args:
+        repo: repository where the elements are stored.
+    """
+    if isinstance(repo, TinyDBRepository):
+        ids = [
+            document["id_"]
+            for document in repo.db_.search(Query().model_type_ == "element")
+        ]
+        last_id = max(ids, default=-1)
+    elif isinstance(repo, PypikaRepository):
+        last_id = repo.connection.execute("SELECT MAX(id) FROM element").fetchone()[0]
+        if last_id is None:
+            last_id = -1
+    else:
+        try:
+            last_id = repo.last(Element).id_
+        except EntityNotFoundError:
+            last_id = -1
+    return max(int(last_id), _last_element_id(repo)) + 1
+
+
+def _last_element_id(repo: Repository) -> int:
+    """Return the highest id given to an element before archiving it.
+
+    Args:
+        repo: repository where the elements are stored.
+
+    Returns:
+        The stored id or -1 if no element was archived.
+    """
+    try:
+        return repo.get("element", ElementSequence).last_id
+    except EntityNotFoundError:
+        return -1
+
+
+def _store_last_element_id(repo: Repository, last_id: int) -> None:
+    """Store the highest id given to an element.
+
+    As with the counters, the sequence is removed from the cache first so that the
+    repository doesn't skip the update.
+
+    Args:
+        repo: repository where the elements are stored.
+        last_id: Highest id given to an element.
+    """
+    sequence = ElementSequence(id_="element", last_id=last_id)
+    repo.cache.remove(sequence)
+    repo.add(sequence)
+
+
+def _sql_columns() -> List[str]:
+    """Return the names of the columns of the element table.
+
+    They are in the same order as the values returned by _sql_row.
+    """
+    return ["id" if field == "id_" else field for field in Element.__fields__]
+
+
+def _sql_row(element: Element) -> Tuple[Any, ...]:
+    """Convert an element into the values of a SQL row.
+
+    The values are stored in the same format as the PypikaRepository does.
+
+    Args:
+        element: Element to convert.
+    """
+    row = []
+    # Iterating the model is a shallow and much faster version of element.dict()
+    for _, value in element:
+        if isinstance(value, datetime):
+            value = value.isoformat()
+        elif isinstance(value, Enum):
+            value = value.value
+        row.append(value)
+    return tuple(row)
+
+
+class _LineReader:
+    """Iterate over the lines of a binary file keeping track of their offsets.
+
+    Attributes:
+        boundary: Byte offset of the start of the last line read, or of the end of
+            the file once it's exhausted. As `parse_lines` yields an element when
+            it reads the first line of the next one, when an element is yielded,
+            it's the offset where the element ends.
+    """
+
+    def __init__(self, file_descriptor: BinaryIO, offset: int) -> None:
+        """Initialize the reader.
+
+        Args:
+            file_descriptor: file opened in binary mode.
+            offset: current position of the file descriptor.
+        """
+        self.file_descriptor = file_descriptor
+        self.boundary = offset
+
+    def __iter__(self) -> Iterator[str]:
+        """Yield the decoded lines of the file."""
+        position = self.boundary
+        for line in self.file_descriptor:
+            self.boundary = position
+            position += len(line)
+            yield line.decode("utf-8")
+        self.boundary = position
+
+
+class _ParsedElements:
+    """Iterate over the elements parsed from a file keeping track of where they end.
+
+    Attributes:
+        boundary: Byte offset where the last yielded element ends, that is where
+            the parsing has to resume from.
+    """
+
+    def __init__(
+        self, elements: Iterable[Element], reader: _LineReader, hold_last: bool
+    ) -> None:
+        """Initialize the iterator.
+
+        Args:
+            elements: Elements parsed from the lines of reader.
+            reader: Lines of the parsed file.
+            hold_last: Whether to skip the last element of the file, for example
+                because its body may not be written yet.
+        """
+        self.elements = elements
+        self.reader = reader
+        self.hold_last = hold_last
+        self.boundary = reader.boundary
+
+    def __iter__(self) -> Iterator[Element]:
+        """Yield the parsed elements."""
+        if not self.hold_last:
+            for element in self.elements:
+                self.boundary = self.reader.boundary
+                yield element
+            self.boundary = self.reader.boundary
+            return
+        # An element is parsed when the next one starts, so the reader is at its
+        # end, and it's yielded once it's known that it's not the last one.
+        previous: Optional[Tuple[Element, int]] = None
+        for element in self.elements:
+            if previous is not None:
+                self.boundary = previous[1]
+                yield previous[0]
+            previous = (element, self.reader.boundary)
+        if previous is not None:
+            log.debug(f"Waiting for the end of the element {previous[0].description}")
+
+
+def _checkpoint_path(file_path: str) -> str:
+    """Return the path of the checkpoint file of a parsed file."""
+    return f"{file_path}.checkpoint"
+
+
+def _read_checkpoint(file_path: str) -> int:
+    """Return the offset from where to resume the parsing of a file.
+
+    The checkpoint is ignored if it belongs to another file. For example, if the
+    file was emptied after the last batch, but the process was interrupted before
+    removing the checkpoint, or if it was replaced by a file that reused its inode.
+
+    Args:
+        file_path: Path to the parsed file.
+    """
+    try:
+        with open(_checkpoint_path(file_path), "r", encoding="utf-8") as checkpoint:
+            data = json.load(checkpoint)
+        offset = int(data["offset"])
+    except (FileNotFoundError, ValueError, KeyError, TypeError):
+        return 0
+    file_stat = os.stat(file_path)
+    if (
+        data.get("inode") != file_stat.st_ino
+        or offset > file_stat.st_size
+        or data.get("fingerprint") != _fingerprint(file_path, offset)
+    ):
+        return 0
+    return offset
+
+
+def _write_checkpoint(file_path: str, offset: int) -> None:
+    """Atomically store the offset from where to resume the parsing of a file.
+
+    Args:
+        file_path: Path to the parsed file.
+        offset: Byte offset of the first element that is not yet stored.
+    """
+    checkpoint_path = _checkpoint_path(file_path)
+    with open(f"{checkpoint_path}.tmp", "w", encoding="utf-8") as checkpoint:
+        json.dump(
+            {
+                "inode": os.stat(file_path).st_ino,
+                "offset": offset,
+                "fingerprint": _fingerprint(file_path, offset),
+            },
+            checkpoint,
+        )
+        checkpoint.flush()
+        os.fsync(checkpoint.fileno())
+    os.replace(f"{checkpoint_path}.tmp", checkpoint_path)
+
+
+def _fingerprint(file_path: str, offset: int, window: int = 4096) -> str:
+    """Return the hash of the parsed content of a file.
+
+    Only the first and last window bytes before offset are hashed, so the cost
+    doesn't grow with the size of the file, while a different file that reused the
+    inode of the parsed one is still detected.
+
+    Args:
+        file_path: Path to the parsed file.
+        offset: Byte offset where the parsed content ends.
+        window: Number of bytes to hash from each end of the parsed content.
+    """
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as file_descriptor:
+        digest.update(file_descriptor.read(min(offset, window)))
+        file_descriptor.seek(max(0, offset - window))
+        digest.update(file_descriptor.read(offset - file_descriptor.tell()))
+    return digest.hexdigest()
+
+
+def _empty_file(file_path: str, offset: int) -> None:
+    """Truncate a file whose elements are stored and remove its checkpoint.
+
+    The file is truncated in place instead of replaced, so the programs that keep
+    it open append the next lines to it. If lines were appended after offset, the
+    file is kept, and its checkpoint lets the next parse start from them.
+
+    Args:
+        file_path: Path to the file to empty.
+        offset: Byte offset where the stored content ends.
+    """
+    with open(file_path, "rb+") as file_descriptor:
+        if os.fstat(file_descriptor.fileno()).st_size != offset:
+            log.debug(f"Keeping {file_path} as lines were appended while parsing it")
+            return
+        file_descriptor.truncate(0)
+    with suppress(FileNotFoundError):
+        os.remove(_checkpoint_path(file_path))
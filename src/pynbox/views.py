@@ -1,54 +1,368 @@
 """Define the views of the program."""
 
+import heapq
+import logging
 import operator
+import os
+import re
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import suppress
-from typing import Dict, List, Optional
+from datetime import date, datetime
+from itertools import islice
+from sqlite3 import Cursor
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
 
-from repository_orm import EntityNotFoundError, Repository
+from pydantic import ValidationError
+from repository_orm import (
+    EntityNotFoundError,
+    PypikaRepository,
+    Repository,
+    TinyDBRepository,
+)
+from tinydb import Query
 
 from .config import Config
-from .model import Element
+from .model import (
+    Decision,
+    DecisionMetrics,
+    Element,
+    ElementCounter,
+    ElementOrder,
+    ElementRecord,
+    ElementState,
+    ElementStats,
+    MetricsReport,
+)
+
+log = logging.getLogger(__name__)
 
 
 def get_elements(
-    repo: Repository, config: Config, type_: Optional[str] = None, newest: bool = False
-) -> List[Element]:
+    repo: Repository,
+    config: Config,
+    type_: Optional[str] = None,
+    newest: bool = False,
+    page_size: int = 50,
+    order: ElementOrder = ElementOrder.TYPE,
+) -> Iterator[Element]:
     """Fetch and order the elements to process.
 
+    The Element objects are built lazily a page at a time. While a page is being
+    consumed, the next one is built in a background thread.
+
+    With the type and newest orders, the elements are grouped by the order of the
+    types in the configuration. With the priority order, they are ordered by their
+    priority_score. The SQL repositories order the elements in the query and fetch
+    them a page at a time, so the time to get the first element doesn't depend on
+    the size of the inbox. The rest of repositories fetch all the open elements at
+    once, and keep them in a heap by their priority_score, so getting the first K
+    elements of N takes O(N + K log N) instead of sorting all of them.
+
+    Args:
+        repo: Repository where the elements live.
+        type_: type of element to process.
+        newest: Whether to show newest items first, the same as the newest order.
+        page_size: Number of elements to build at once.
+        order: Order of the elements.
+
+    Returns:
+        Iterator over the ordered elements to process.
+    """
+    if newest:
+        order = ElementOrder.NEWEST
+    return _build_elements(
+        _ordered_rows(repo, config, type_, order, page_size), page_size
+    )
+
+
+def get_element_records(
+    repo: Repository,
+    config: Config,
+    type_: Optional[str] = None,
+    order: ElementOrder = ElementOrder.TYPE,
+) -> Iterator[ElementRecord]:
+    """Fetch and order the elements to process as read only records.
+
+    It's like get_elements, but the records are built without validation, so they
+    are cheaper to build and take less memory. Use ElementRecord.to_element to get
+    the Element of the records that need to be changed.
+
     Args:
         repo: Repository where the elements live.
         type_: type of element to process.
-        newest: Whether to show newest items first
+        order: Order of the elements.
 
     Returns:
-        Ordered list of elements to process.
+        Iterator over the ordered records of the elements to process.
+    """
+    return map(ElementRecord.from_row, _ordered_rows(repo, config, type_, order))
+
+
+def _ordered_rows(
+    repo: Repository,
+    config: Config,
+    type_: Optional[str],
+    order: ElementOrder,
+    page_size: int = 1000,
+) -> Iterator[Dict[str, Any]]:
+    """Fetch the raw data of the open elements to process in order.
+
+    Args:
+        repo: Repository where the elements live.
+        type_: type of element to process.
+        order: Order of the elements.
+        page_size: Number of rows to fetch at once from the SQL repositories.
     """
     if type_ is None:
-        types = [type_.name for type_ in config.types]
+        types = {type_.name: type_.priority for type_ in config.types}
     else:
-        types = [type_]
+        types = {
+            element_type.name: element_type.priority
+            for element_type in config.types
+            if element_type.name == type_
+        } or {type_: 3}
 
-    elements = []
-    for element_type in types:
-        with suppress(EntityNotFoundError):
-            new_elements = repo.search(
-                {"state": "open", "type_": element_type}, Element
+    if isinstance(repo, PypikaRepository):
+        return _ordered_sql_rows(repo, types, order, page_size)
+    rows = _open_element_rows(repo, order == ElementOrder.NEWEST)
+    if order == ElementOrder.PRIORITY:
+        return _pop_by_priority(rows, types)
+
+    rows_by_type: Dict[str, List[Dict[str, Any]]] = {
+        element_type: [] for element_type in types
+    }
+    for row in rows:
+        with suppress(KeyError):
+            rows_by_type[row["type_"]].append(row)
+
+    return (row for type_rows in rows_by_type.values() for row in type_rows)
+
+
+def priority_score(
+    type_priority: int,
+    priority: int,
+    created: datetime,
+    skips: int,
+    now: Optional[datetime] = None,
+) -> float:
+    """Return how soon an element should be processed, the higher the sooner.
+
+    The type and element priorities weigh the most, each priority point is worth
+    ten days of age. The age stops counting after 30 days, and each skip takes
+    five days away, so the old elements that are always skipped don't take over
+    the queue.
+
+    Args:
+        type_priority: Priority of the element type.
+        priority: Priority of the element.
+        created: Creation date of the element.
+        skips: Number of times the element was skipped.
+        now: Date to compute the age from, by default the current date.
+    """
+    age = ((now or datetime.now()) - created).total_seconds() / 86400
+    return 10 * (type_priority + priority) + min(age, 30) - 5 * skips
+
+
+def _pop_by_priority(
+    rows: List[Dict[str, Any]], types: Dict[str, int]
+) -> Iterator[Dict[str, Any]]:
+    """Yield the rows of the types from the highest priority_score to the lowest.
+
+    The ties are broken by id.
+    """
+    now = datetime.now()
+    heap = []
+    for row in rows:
+        type_priority = types.get(row["type_"])
+        if type_priority is None:
+            continue
+        created = row["created"]
+        if isinstance(created, str):
+            created = datetime.fromisoformat(created)
+        score = priority_score(
+            type_priority, row["priority"], created, row["skips"], now
+        )
+        heap.append((-score, row["id_"], row))
+    heapq.heapify(heap)
+    while heap:
+        yield heapq.heappop(heap)[2]
+
+
+def _ordered_sql_rows(
+    repo: PypikaRepository,
+    types: Dict[str, int],
+    order: ElementOrder,
+    page_size: int,
+) -> Iterator[Dict[str, Any]]:
+    """Fetch the raw data of the open elements of a SQL repository in order.
+
+    The elements are ordered by the queries, the same way _ordered_rows does for
+    the rest of repositories, and they are fetched a page at a time. With the type
+    and newest orders, the elements of each type are read with their own query
+    from the element indexes, so the first page is returned without reading the
+    rest. The priority order needs the score of all of them, so it's computed and
+    sorted by the database.
+
+    Args:
+        repo: Repository where the elements live.
+        types: Priority of the types to fetch, in the order of the configuration.
+        order: Order of the elements.
+        page_size: Number of rows to fetch at once.
+
+    Yields:
+        The attributes of each element.
+    """
+    if order != ElementOrder.PRIORITY:
+        order_by = "created DESC, id" if order == ElementOrder.NEWEST else "id"
+        for type_ in types:
+            # nosec: B608, the order is not defined by the user.
+            yield from _fetch_rows(
+                repo.connection.execute(
+                    "SELECT * FROM element WHERE state = ? AND type_ = ? "  # nosec
+                    f"ORDER BY {order_by}",
+                    (ElementState.OPEN.value, type_),
+                ),
+                page_size,
             )
-            if newest:
-                elements.extend(
-                    sorted(
-                        new_elements, key=operator.attrgetter("created"), reverse=True
-                    ),
-                )
-            else:
-                elements.extend(new_elements)
+        return
+    if len(types) == 0:
+        return
+    # Same formula as priority_score.
+    score = (
+        f"10 * (CASE type_ {' '.join('WHEN ? THEN ?' for _ in types)} END + priority)"
+        " + MIN(julianday(?) - julianday(created), 30) - 5 * skips"
+    )
+    # nosec: B608, the query is built from placeholders, not from user values.
+    yield from _fetch_rows(
+        repo.connection.execute(
+            "SELECT * FROM element "  # nosec
+            f"WHERE state = ? AND type_ IN ({', '.join('?' for _ in types)}) "
+            f"ORDER BY {score} DESC, id",
+            [
+                ElementState.OPEN.value,
+                *types,
+                *(value for item in types.items() for value in item),
+                datetime.now().isoformat(),
+            ],
+        ),
+        page_size,
+    )
+
+
+def _fetch_rows(cursor: Cursor, page_size: int) -> Iterator[Dict[str, Any]]:
+    """Yield the rows of a query on the element table a page at a time.
+
+    Args:
+        cursor: Cursor of the executed query.
+        page_size: Number of rows to fetch at once.
+    """
+    columns = [
+        "id_" if column[0] == "id" else column[0] for column in cursor.description
+    ]
+    while True:
+        rows = cursor.fetchmany(page_size)
+        if len(rows) == 0:
+            return
+        for row in rows:
+            yield dict(zip(columns, row))
+
+
+def _open_element_rows(repo: Repository, newest: bool) -> List[Dict[str, Any]]:
+    """Fetch the raw data of the open elements without building the models.
+
+    Args:
+        repo: Repository where the elements live, except the SQL ones, that
+            are read with _ordered_sql_rows.
+        newest: Whether to order them by creation date, newest first, instead of
+            by id.
 
+    Returns:
+        The attributes of each element.
+    """
+    if isinstance(repo, TinyDBRepository):
+        rows: List[Dict[str, Any]] = repo.db_.search(
+            (Query().model_type_ == "element")
+            & (Query().state == ElementState.OPEN.value)
+        )
+    else:
+        rows = []
+        with suppress(EntityNotFoundError):
+            rows = [
+                element.dict()
+                for element in repo.search({"state": ElementState.OPEN.value}, Element)
+            ]
+    rows.sort(key=operator.itemgetter("id_"))
+    if newest:
+        rows.sort(key=operator.itemgetter("created"), reverse=True)
+    return rows
+
+
+def _build_elements(
+    rows: Iterable[Dict[str, Any]], page_size: int
+) -> Iterator[Element]:
+    """Build the Element objects of the rows a page at a time.
+
+    The next page is built in a background thread while the current one is
+    consumed.
+
+    Args:
+        rows: Attributes of the elements, they are consumed a page at a time.
+        page_size: Number of elements to build at once.
+
+    Yields:
+        The built elements.
+    """
+    rows = iter(rows)
+    page_rows = list(islice(rows, page_size))
+    if len(page_rows) == 0:
+        return
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        page = executor.submit(_build_page, page_rows)
+        while True:
+            elements = page.result()
+            page_rows = list(islice(rows, page_size))
+            if len(page_rows) > 0:
+                page = executor.submit(_build_page, page_rows)
+            yield from elements
+            if len(page_rows) == 0:
+                return
+
+
+def _build_page(rows: List[Dict[str, Any]]) -> List[Element]:
+    """Build the Element objects of a page of rows."""
+    elements = []
+    for row in rows:
+        element = Element(**row)
+        # Mimic the elements returned by the repository
+        element.clear_defined_values()
+        elements.append(element)
     return elements
 
 
+def count_open_elements(
+    repo: Repository, config: Config, type_: Optional[str] = None
+) -> int:
+    """Get the number of open elements of the configured types.
+
+    It uses the element counters, so it doesn't need to load the elements.
+
+    Args:
+        repo: Repository where the elements live.
+        type_: Count only the elements of this type.
+    """
+    element_status = status(repo, config)
+    if type_ is None:
+        return sum(element_status.values())
+    return element_status.get(type_, 0)
+
+
 def status(repo: Repository, config: Config) -> Dict[str, int]:
     """Get the number of open elements per type.
 
+    The numbers are read from the element counters. If the repository doesn't
+    have them yet, the elements are counted instead.
+
     Args:
         repo: Repository where the elements live.
         type_: type of element to process.
@@ -56,10 +370,314 @@ def status(repo: Repository, config: Config) -> Dict[str, int]:
     Returns:
         Number of open tasks per type
     """
+    counts = {
+        (counter.type_, counter.state): counter.count
+        for counter in repo.all(ElementCounter)
+    }
+    if len(counts) == 0:
+        counts = count_elements(repo)
+
     element_status = {}
     for type_ in config.types:
-        with suppress(EntityNotFoundError):
-            elements = len(repo.search({"state": "open", "type_": type_.name}, Element))
-            if elements > 0:
-                element_status[type_.name] = elements
+        open_elements = counts.get((type_.name, ElementState.OPEN), 0)
+        if open_elements > 0:
+            element_status[type_.name] = open_elements
     return element_status
+
+
+def count_elements(repo: Repository) -> Dict[Tuple[str, ElementState], int]:
+    """Count the elements of each type and state stored in the repository.
+
+    The elements are counted with one query. The SQL backends do the count in the
+    database and the TinyDB one without building the Element objects.
+
+    Args:
+        repo: Repository where the elements live.
+
+    Returns:
+        Number of elements for each (type, state).
+    """
+    if isinstance(repo, PypikaRepository):
+        rows = repo.connection.execute(
+            "SELECT type_, state, COUNT(*) FROM element GROUP BY type_, state"
+        ).fetchall()
+        return {(type_, ElementState(state)): count for type_, state, count in rows}
+    if isinstance(repo, TinyDBRepository):
+        documents = repo.db_.search(Query().model_type_ == "element")
+        counts = Counter(
+            (document["type_"], ElementState(document["state"]))
+            for document in documents
+        )
+    else:
+        counts = Counter(
+            (element.type_, element.state) for element in repo.all(Element)
+        )
+    return dict(counts)
+
+
+def element_stats(repo: Repository) -> ElementStats:
+    """Aggregate the history of the elements stored in the repository.
+
+    The SQL backends do the aggregations in the database. The rest read the
+    attributes as columns without building the Element objects, and count them
+    at once.
+
+    Args:
+        repo: Repository where the elements live.
+    """
+    if isinstance(repo, PypikaRepository):
+        created_rows = repo.connection.execute(
+            "SELECT type_, substr(created, 1, 10), COUNT(*) FROM element "
+            "GROUP BY 1, 2"
+        ).fetchall()
+        closed_rows = repo.connection.execute(
+            "SELECT type_, substr(closed, 1, 10), COUNT(*) FROM element "
+            "WHERE state = ? AND closed IS NOT NULL GROUP BY 1, 2",
+            (ElementState.CLOSED.value,),
+        ).fetchall()
+        durations: List[Tuple[str, float]] = repo.connection.execute(
+            "SELECT type_, julianday(closed) - julianday(created) FROM element "
+            "WHERE state = ? AND closed IS NOT NULL ORDER BY 1, 2",
+            (ElementState.CLOSED.value,),
+        ).fetchall()
+        skips = dict(
+            repo.connection.execute(
+                "SELECT skips, COUNT(*) FROM element GROUP BY skips"
+            ).fetchall()
+        )
+    else:
+        types, states, created, closed, skip_counts = _history_columns(repo)
+        created_rows = [
+            (type_, day, count)
+            for (type_, day), count in Counter(
+                zip(types, (str(date_)[:10] for date_ in created))
+            ).items()
+        ]
+        closed_elements = [
+            (type_, created_date, closed_date)
+            for type_, state, created_date, closed_date in zip(
+                types, states, created, closed
+            )
+            if state == ElementState.CLOSED and closed_date is not None
+        ]
+        closed_rows = [
+            (type_, day, count)
+            for (type_, day), count in Counter(
+                (type_, str(closed_date)[:10])
+                for type_, _, closed_date in closed_elements
+            ).items()
+        ]
+        durations = sorted(
+            (
+                type_,
+                (_to_datetime(closed_date) - _to_datetime(created_date)).total_seconds()
+                / 86400,
+            )
+            for type_, created_date, closed_date in closed_elements
+        )
+        skips = dict(Counter(skip_counts))
+
+    stats = ElementStats(skips=skips)
+    for attribute, rows in (("created", created_rows), ("closed", closed_rows)):
+        per_day: Dict[str, Dict[date, int]] = defaultdict(dict)
+        for type_, day, count in rows:
+            per_day[type_][date.fromisoformat(day)] = count
+        setattr(stats, attribute, dict(per_day))
+    durations_per_type: Dict[str, List[float]] = defaultdict(list)
+    for type_, days in durations:
+        durations_per_type[type_].append(days)
+    for type_, type_durations in durations_per_type.items():
+        stats.median_time_to_close[type_] = _percentile(type_durations, 50)
+        stats.p90_time_to_close[type_] = _percentile(type_durations, 90)
+    return stats
+
+
+def _history_columns(
+    repo: Repository,
+) -> Tuple[Tuple[Any, ...], ...]:
+    """Read the type, state, creation and closing date and skips of the elements.
+
+    Returns:
+        One tuple of values per attribute, the dates may be datetime objects or
+        ISO 8601 strings.
+    """
+    if isinstance(repo, TinyDBRepository):
+        documents = repo.db_.search(Query().model_type_ == "element")
+        rows = [
+            (
+                document["type_"],
+                ElementState(document["state"]),
+                document["created"],
+                document["closed"],
+                document["skips"],
+            )
+            for document in documents
+        ]
+    else:
+        rows = [
+            (
+                element.type_,
+                element.state,
+                element.created,
+                element.closed,
+                element.skips,
+            )
+            for element in repo.all(Element)
+        ]
+    if len(rows) == 0:
+        return ((), (), (), (), ())
+    return tuple(zip(*rows))
+
+
+def _to_datetime(value: Any) -> datetime:
+    """Return the datetime of a stored date."""
+    if isinstance(value, str):
+        return datetime.fromisoformat(value)
+    return value
+
+
+def _percentile(values: List[float], percentile: float) -> float:
+    """Return a percentile of the sorted values.
+
+    Args:
+        values: Sorted values.
+        percentile: Percentile to compute, between 0 and 100.
+    """
+    return values[min(len(values) - 1, int(len(values) * percentile / 100))]
+
+
+def decision_metrics(
+    metrics_path: Optional[str], percentiles: Tuple[int, ...] = (50, 90, 99)
+) -> MetricsReport:
+    """Compute the percentiles of the decisions recorded while processing.
+
+    Args:
+        metrics_path: Path to the metrics file.
+        percentiles: Percentiles to compute, between 0 and 100.
+    """
+    if metrics_path is None:
+        return MetricsReport()
+    metrics_path = os.path.expanduser(metrics_path)
+    think_times: Dict[Tuple[str, str], List[float]] = defaultdict(list)
+    storage_times: Dict[Tuple[str, str], List[float]] = defaultdict(list)
+    session_ends: Dict[datetime, datetime] = {}
+    try:
+        with open(metrics_path, "r", encoding="utf-8") as metrics_file:
+            for line in metrics_file:
+                try:
+                    decision = Decision.parse_raw(line)
+                except ValidationError:
+                    log.warning(f"Ignoring the corrupt decision {line.strip()}")
+                    continue
+                think_times[(decision.type_, decision.action)].append(
+                    decision.think_time
+                )
+                storage_times[(decision.type_, decision.action)].append(
+                    decision.storage_time
+                )
+                session_ends[decision.session] = max(
+                    decision.date, session_ends.get(decision.session, decision.date)
+                )
+    except FileNotFoundError:
+        return MetricsReport()
+
+    report = MetricsReport(sessions=len(session_ends))
+    for (type_, action), type_think_times in sorted(think_times.items()):
+        type_think_times.sort()
+        type_storage_times = sorted(storage_times[(type_, action)])
+        report.metrics.append(
+            DecisionMetrics(
+                type_=type_,
+                action=action,
+                decisions=len(type_think_times),
+                think_time={
+                    percentile: _percentile(type_think_times, percentile)
+                    for percentile in percentiles
+                },
+                storage_time={
+                    percentile: _percentile(type_storage_times, percentile)
+                    for percentile in percentiles
+                },
+            )
+        )
+    session_times = sorted(
+        (end - start).total_seconds() for start, end in session_ends.items()
+    )
+    if len(session_times) > 0:
+        report.session_time = {
+            percentile: _percentile(session_times, percentile)
+            for percentile in percentiles
+        }
+    return report
+
+
+def search(
+    repo: Repository,
+    query: str,
+    state: Optional[ElementState] = None,
+    type_: Optional[str] = None,
+) -> List[Element]:
+    """Find the elements whose description or body contain the words of the query.
+
+    Each word of the query must match the start of a word of the element, case
+    insensitively. The SQL backends use the full text search index kept up to date
+    by the database, and return the best matches first. The rest check the words of
+    each element, and return them ordered by id.
+
+    Args:
+        repo: Repository where the elements live.
+        query: Words to search.
+        state: Return only the elements in this state.
+        type_: Return only the elements of this type.
+    """
+    tokens = _tokenize(query)
+    if len(tokens) == 0:
+        return []
+
+    if isinstance(repo, PypikaRepository):
+        conditions = ["element_search MATCH ?"]
+        # Quote the tokens so that they are not parsed as FTS5 operators.
+        parameters: List[Any] = [" ".join(f'"{token}"*' for token in tokens)]
+        if state is not None:
+            conditions.append("element.state = ?")
+            parameters.append(state.value)
+        if type_ is not None:
+            conditions.append("element.type_ = ?")
+            parameters.append(type_)
+        # nosec: B608, the conditions are not defined by the user.
+        cursor = repo.connection.execute(
+            "SELECT element.* FROM element_search "  # nosec
+            "JOIN element ON element.id = element_search.rowid "
+            f"WHERE {' AND '.join(conditions)} "
+            "ORDER BY element_search.rank, element.id",
+            parameters,
+        )
+        columns = [
+            "id_" if column[0] == "id" else column[0] for column in cursor.description
+        ]
+        return _build_page([dict(zip(columns, row)) for row in cursor.fetchall()])
+
+    if isinstance(repo, TinyDBRepository):
+        rows: List[Dict[str, Any]] = repo.db_.search(Query().model_type_ == "element")
+    else:
+        rows = [element.dict() for element in repo.all(Element)]
+    rows = [
+        row
+        for row in rows
+        if (state is None or row["state"] == state.value)
+        and (type_ is None or row["type_"] == type_)
+        and _matches(tokens, f"{row['description']} {row['body'] or ''}")
+    ]
+    rows.sort(key=operator.itemgetter("id_"))
+    return _build_page(rows)
+
+
+def _tokenize(text: str) -> List[str]:
+    """Split a text in lowercase words."""
+    return re.findall(r"\w+", text.lower())
+
+
+def _matches(tokens: List[str], text: str) -> bool:
+    """Check if each token is the start of a word of the text."""
+    words = _tokenize(text)
+    return all(any(word.startswith(token) for word in words) for token in tokens)
@@ -0,0 +1,297 @@
+"""Ingest the elements appended to the inbox files as soon as they are written.
+
+Classes:
+    InotifyWatcher: Detect the file changes with the Linux inotify API.
+    PollingWatcher: Detect the file changes checking their size and modification
+        time periodically.
+    WatchStats: Gather the latency and throughput of the ingestion.
+
+Functions:
+    watch: Ingest the inbox files each time they change.
+"""
+
+import ctypes
+import ctypes.util
+import logging
+import os
+import select
+import time
+from threading import Event
+from typing import Dict, List, Optional, Tuple, Union
+
+from repository_orm import Repository
+
+from . import services
+from .config import Config
+from .exceptions import ParseError
+from .model import ParseReport
+
+log = logging.getLogger(__name__)
+
+# Events of inotify(7) that mean that the files of a directory have changed.
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+
+
+class InotifyWatcher:
+    """Detect the file changes with the Linux inotify API.
+
+    The directories that contain the paths are watched, so new files and files
+    replaced by a sync program are detected too.
+    """
+
+    def __init__(self, paths: List[str]) -> None:
+        """Start watching the directories of the paths.
+
+        Args:
+            paths: Files, directories or glob patterns to watch.
+
+        Raises:
+            OSError: If inotify is not available.
+        """
+        libc_name = ctypes.util.find_library("c")
+        if libc_name is None:
+            raise OSError("The C library is not available")
+        libc = ctypes.CDLL(libc_name, use_errno=True)
+        if not hasattr(libc, "inotify_init1"):
+            raise OSError("inotify is not available")
+        self.file_descriptor = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.file_descriptor < 0:
+            raise OSError(ctypes.get_errno(), "Could not initialize inotify")
+        for directory in _watched_directories(paths):
+            watch_descriptor = libc.inotify_add_watch(
+                self.file_descriptor,
+                directory.encode(),
+                IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE,
+            )
+            if watch_descriptor < 0:
+                os.close(self.file_descriptor)
+                raise OSError(ctypes.get_errno(), f"Could not watch {directory}")
+
+    def wait(self, timeout: float) -> bool:
+        """Wait until the files change.
+
+        Args:
+            timeout: Maximum seconds to wait.
+
+        Returns:
+            Whether the files changed.
+        """
+        ready, _, _ = select.select([self.file_descriptor], [], [], timeout)
+        if not ready:
+            return False
+        # Drain the events, as any of them means that the files need to be checked.
+        while True:
+            try:
+                os.read(self.file_descriptor, 65536)
+            except BlockingIOError:
+                return True
+
+    def close(self) -> None:
+        """Stop watching the files."""
+        os.close(self.file_descriptor)
+
+
+class PollingWatcher:
+    """Detect the file changes checking their size and modification time."""
+
+    def __init__(self, paths: List[str], interval: float = 1.0) -> None:
+        """Take the first snapshot of the files.
+
+        Args:
+            paths: Files, directories or glob patterns to watch.
+            interval: Seconds between checks.
+        """
+        self.paths = paths
+        self.interval = interval
+        self._snapshot = self._take_snapshot()
+
+    def wait(self, timeout: float) -> bool:
+        """Wait until the files change.
+
+        Args:
+            timeout: Maximum seconds to wait.
+
+        Returns:
+            Whether the files changed.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            time.sleep(max(0.0, min(self.interval, deadline - time.monotonic())))
+            snapshot = self._take_snapshot()
+            if snapshot != self._snapshot:
+                self._snapshot = snapshot
+                return True
+            if time.monotonic() >= deadline:
+                return False
+
+    def close(self) -> None:
+        """Stop watching the files."""
+
+    def _take_snapshot(self) -> Dict[str, Tuple[int, int]]:
+        """Return the size and modification time of the watched files."""
+        snapshot = {}
+        for file_path in services.expand_paths(self.paths):
+            file_stat = os.stat(file_path)
+            snapshot[file_path] = (file_stat.st_size, file_stat.st_mtime_ns)
+        return snapshot
+
+
+Watcher = Union[InotifyWatcher, PollingWatcher]
+
+
+class WatchStats:
+    """Gather the latency and throughput of the ingestion.
+
+    Attributes:
+        elements: Number of stored elements.
+        duplicates: Number of dropped duplicated elements.
+        latencies: Seconds from the last write of the files to the end of each
+            ingestion.
+    """
+
+    def __init__(self) -> None:
+        """Start counting."""
+        self.start = time.monotonic()
+        self.elements = 0
+        self.duplicates = 0
+        self.latencies: List[float] = []
+
+    def record(self, report: ParseReport, latency: float) -> None:
+        """Add the result of an ingestion.
+
+        Args:
+            report: Stored and duplicated elements.
+            latency: Seconds from the last write of the files to the end of the
+                ingestion.
+        """
+        self.elements += report.elements
+        self.duplicates += report.duplicates
+        self.latencies.append(latency)
+
+    def throughput(self) -> float:
+        """Return the stored elements per minute since the watch started."""
+        return self.elements / max(time.monotonic() - self.start, 1e-9) * 60
+
+    def latency(self, percentile: float) -> float:
+        """Return a percentile of the ingestion latencies in seconds.
+
+        Args:
+            percentile: Percentile to compute, between 0 and 100.
+        """
+        if len(self.latencies) == 0:
+            return 0.0
+        latencies = sorted(self.latencies)
+        return latencies[
+            min(len(latencies) - 1, int(len(latencies) * percentile / 100))
+        ]
+
+    def summary(self) -> str:
+        """Return the counters as a human readable text."""
+        return (
+            f"Ingested {self.elements} elements in {len(self.latencies)} batches, "
+            f"merged {self.duplicates} duplicates, "
+            f"{self.throughput():.1f} elements per minute, "
+            f"latency p50 {self.latency(50) * 1000:.0f}ms, "
+            f"p95 {self.latency(95) * 1000:.0f}ms"
+        )
+
+
+def create_watcher(paths: List[str], polling: bool = False) -> Watcher:
+    """Return the best available file watcher.
+
+    Args:
+        paths: Files, directories or glob patterns to watch.
+        polling: Whether to use the polling watcher even if inotify is available.
+    """
+    if not polling:
+        try:
+            return InotifyWatcher(paths)
+        except (OSError, AttributeError) as error:
+            log.debug(f"Falling back to polling the files: {error}")
+    return PollingWatcher(paths)
+
+
+def watch(
+    config: Config,
+    repo: Repository,
+    paths: List[str],
+    stop: Event,
+    stats: Optional[WatchStats] = None,
+    polling: bool = False,
+    debounce: float = 0.2,
+) -> WatchStats:
+    """Ingest the inbox files each time they change until stop is set.
+
+    The files are parsed one by one with services.parse_file without emptying
+    them, so the programs that keep them open can go on appending to them. Their
+    checkpoints keep the offset where the last ingestion ended, so each ingestion
+    only reads the lines written since. As the body of the last element of a file
+    may be written later, it's stored once the next element starts. Once a change
+    is detected, the ingestion waits until the files are debounce seconds without
+    changes, so that the elements are not split while they are being written.
+
+    Args:
+        config: pynbox configuration instance.
+        repo: repository to store the elements, it's kept open.
+        paths: Files, directories or glob patterns to watch.
+        stop: Event to end the watch.
+        stats: Counters to update.
+        polling: Whether to use the polling watcher even if inotify is available.
+        debounce: Seconds without changes to wait before the ingestion.
+
+    Returns:
+        The updated counters.
+    """
+    stats = stats or WatchStats()
+    watcher = create_watcher(paths, polling)
+    log.info(f"Watching {', '.join(paths)} with {type(watcher).__name__}")
+    try:
+        while not stop.is_set():
+            _ingest(config, repo, paths, stats)
+            while not watcher.wait(timeout=0.5):
+                if stop.is_set():
+                    return stats
+            while watcher.wait(timeout=debounce):
+                pass
+    finally:
+        watcher.close()
+    return stats
+
+
+def _ingest(
+    config: Config, repo: Repository, paths: List[str], stats: WatchStats
+) -> None:
+    """Store the elements appended to the inbox files since the last ingestion.
+
+    The files are ingested apart, so one that can't be parsed doesn't block the
+    rest.
+    """
+    for file_path in services.expand_paths(paths):
+        last_write = os.stat(file_path).st_mtime
+        try:
+            report = services.parse_file(config, repo, file_path, truncate=False)
+        except ParseError as error:
+            log.error(f"Could not parse {file_path}: {error}")
+            continue
+        if report.elements + report.duplicates == 0:
+            continue
+        stats.record(report, time.time() - last_write)
+        log.debug(f"Ingested {report.elements} elements from {file_path}")
+
+
+def _watched_directories(paths: List[str]) -> List[str]:
+    """Return the directories that contain the paths."""
+    directories = []
+    for path in paths:
+        if os.path.isdir(path):
+            directories.append(path)
+        else:
+            directories.append(os.path.dirname(os.path.abspath(path)))
+    return [
+        directory
+        for directory in dict.fromkeys(directories)
+        if os.path.isdir(directory)
+    ]
@@ -0,0 +1,56 @@
+"""Configure the fixtures used by the benchmarks."""
+
+from itertools import count
+from pathlib import Path
+from typing import Callable
+
+import pytest
+from repository_orm import Repository
+
+from pynbox import services
+from pynbox.config import Config
+from pynbox.entrypoints import get_repo
+
+from .generators import generate_inbox, generate_types
+
+
+@pytest.fixture(name="benchmark_config")
+def fixture_benchmark_config(config: Config, tmp_path: Path) -> Config:
+    """Configure the program with two synthetic types.
+
+    The elements are stored in the temporary directory.
+    """
+    config.types = generate_types(2)
+    config.metrics_path = str(tmp_path / "metrics.jsonl")
+    return config
+
+
+@pytest.fixture(name="make_repo")
+def fixture_make_repo(
+    benchmark_config: Config, tmp_path: Path
+) -> Callable[[str, int], Repository]:
+    """Return a function that builds a repository with open elements.
+
+    The function receives the backend and the number of elements, and leaves the
+    database_url of the configuration pointing to the repository. Each call
+    builds a new database, so the benchmarks that change it can start afresh
+    each round.
+    """
+
+    databases = count()
+
+    def make_repo(backend: str, elements: int) -> Repository:
+        database = tmp_path / f"{backend}-{elements}-{next(databases)}.db"
+        benchmark_config.database_url = f"{backend}:///{database}"
+        repo = get_repo(benchmark_config)
+        services.add_elements(
+            repo,
+            services.parse(
+                benchmark_config,
+                generate_inbox(elements, types=2, body_lines=1),
+            ),
+        )
+        repo.commit()
+        return repo
+
+    return make_repo
@@ -0,0 +1,43 @@
+"""Generate synthetic inboxes for the benchmarks."""
+
+import random
+from typing import List
+
+from pynbox.model import ElementType
+
+WORDS = (
+    "buy bread call mom review pull request book flight renew passport water "
+    "plants read paper fix bike learn python write post clean desk pay rent"
+).split()
+
+
+def generate_types(types: int) -> List[ElementType]:
+    """Return the configuration of a number of element types.
+
+    The regular expression of each type is its index followed by a dot.
+    """
+    return [
+        ElementType(name=f"type{index}", regexp=rf"t{index}\.", priority=index % 5)
+        for index in range(types)
+    ]
+
+
+def generate_inbox(elements: int, types: int, body_lines: int, seed: int = 0) -> str:
+    """Return the text of an inbox file.
+
+    Args:
+        elements: Number of elements of the file.
+        types: Number of different element types, see generate_types.
+        body_lines: Number of lines of the body of each element.
+        seed: Seed of the random generator, so the inboxes are reproducible.
+    """
+    generator = random.Random(seed)
+    lines = []
+    for index in range(elements):
+        description = " ".join(generator.choices(WORDS, k=6))
+        priority = " h" if index % 10 == 0 else ""
+        lines.append(f"t{index % types}. {description} {index}{priority}")
+        lines.extend(
+            " ".join(generator.choices(WORDS, k=12)) for _ in range(body_lines)
+        )
+    return "".join(f"{line}\n" for line in lines)
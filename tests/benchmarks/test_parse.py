@@ -0,0 +1,77 @@
+"""Benchmark the parsing of inbox texts and files."""
+
+from itertools import count
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Callable, Dict, Tuple
+
+import pytest
+from repository_orm import Repository
+
+from pynbox import services
+from pynbox.config import Config
+
+from .generators import generate_inbox, generate_types
+
+if TYPE_CHECKING:
+    from pytest_benchmark.fixture import BenchmarkFixture
+
+pytest.importorskip("pytest_benchmark")
+
+
+@pytest.mark.slow()
+@pytest.mark.parametrize("elements", [1000, 10000])
+@pytest.mark.parametrize("types", [2, 20])
+@pytest.mark.parametrize("body_lines", [0, 5])
+def test_parse(
+    benchmark: "BenchmarkFixture",
+    benchmark_config: Config,
+    elements: int,
+    types: int,
+    body_lines: int,
+) -> None:
+    """
+    Given: A synthetic inbox text
+    When: it's parsed
+    Then: all its elements are returned.
+    """
+    benchmark_config.types = generate_types(types)
+    text = generate_inbox(elements, types, body_lines)
+
+    result = benchmark(services.parse, benchmark_config, text)
+
+    assert len(result) == elements
+
+
+@pytest.mark.slow()
+@pytest.mark.parametrize("backend", ["tinydb", "sqlite"])
+@pytest.mark.parametrize("elements", [1000, 10000])
+@pytest.mark.parametrize("stored_elements", [0, 10000])
+def test_parse_file(
+    benchmark: "BenchmarkFixture",
+    benchmark_config: Config,
+    make_repo: Callable[[str, int], Repository],
+    tmp_path: Path,
+    backend: str,
+    elements: int,
+    stored_elements: int,
+) -> None:
+    """
+    Given: A repository with some elements and a synthetic inbox file
+    When: the file is parsed into the repository
+    Then: all its elements are stored.
+
+    Each round writes an inbox with different elements, so that they are not
+    dropped as duplicates of the ones stored by the previous rounds.
+    """
+    repo = make_repo(backend, stored_elements)
+    file_path = tmp_path / "inbox.pynbox"
+    seeds = count(1)
+
+    def write_inbox() -> Tuple[Tuple[Any, ...], Dict[str, Any]]:
+        file_path.write_text(generate_inbox(elements, 2, 1, seed=next(seeds)))
+        return (benchmark_config, repo, str(file_path)), {}
+
+    result = benchmark.pedantic(services.parse_file, setup=write_inbox, rounds=5)
+
+    assert result.elements == elements
+    repo.close()
@@ -0,0 +1,121 @@
+"""Benchmark the process loop without a terminal.
+
+The questionary prompts are answered by a script, so the benchmark measures the
+time pynbox takes to show, change and store the elements, without the think
+time of a human.
+"""
+
+import json
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import pytest
+import questionary
+from _pytest.monkeypatch import MonkeyPatch
+from click.testing import CliRunner
+from repository_orm import Repository
+
+from pynbox.config import Config
+from pynbox.entrypoints.cli import Choices, cli
+
+if TYPE_CHECKING:
+    from pytest_benchmark.fixture import BenchmarkFixture
+
+pytest.importorskip("pytest_benchmark")
+
+
+class ScriptedSelect:
+    """Replace questionary.select answering its prompts with a script.
+
+    When the script runs out it answers None, as questionary does when the user
+    presses Ctrl-C, so the process loop ends.
+
+    Attributes:
+        prompts: Number of prompts shown.
+    """
+
+    def __init__(self, answers: Iterable[str]) -> None:
+        """Set the answers of the prompts."""
+        self.answers = iter(answers)
+        self.prompts = 0
+
+    def __call__(self, *args: Any, **kwargs: Any) -> "ScriptedSelect":
+        """Show a prompt."""
+        self.prompts += 1
+        return self
+
+    def ask(self) -> Optional[str]:
+        """Return the next answer of the script."""
+        return next(self.answers, None)
+
+
+def drive_process(
+    config: Config,
+    tmp_path: Path,
+    monkeypatch: MonkeyPatch,
+    answers: List[str],
+) -> int:
+    """Run `pynbox process` answering the prompts with a script.
+
+    Args:
+        config: Configuration whose types and storage paths are used.
+        tmp_path: Directory to write the configuration file.
+        monkeypatch: Fixture to replace questionary.select.
+        answers: Answers to the prompts.
+
+    Returns:
+        Number of prompts shown.
+    """
+    config_path = tmp_path / "config.json"
+    config_path.write_text(
+        json.dumps({"types": [type_.dict() for type_ in config.types]})
+    )
+    monkeypatch.setenv("DATABASE_URL", config.database_url)
+    monkeypatch.setenv("METRICS_PATH", str(config.metrics_path))
+    select = ScriptedSelect(answers)
+    monkeypatch.setattr(questionary, "select", select)
+
+    result = CliRunner(mix_stderr=False).invoke(
+        cli, ["-c", str(config_path), "process"]
+    )
+
+    assert result.exit_code == 0, result.stderr
+    return select.prompts
+
+
+@pytest.mark.slow()
+@pytest.mark.parametrize("backend", ["tinydb", "sqlite"])
+@pytest.mark.parametrize("stored_elements", [200, 10000])
+@pytest.mark.parametrize("action", [Choices.DONE, Choices.SKIP])
+def test_process(
+    benchmark: "BenchmarkFixture",
+    benchmark_config: Config,
+    make_repo: Callable[[str, int], Repository],
+    tmp_path: Path,
+    monkeypatch: MonkeyPatch,
+    backend: str,
+    stored_elements: int,
+    action: Choices,
+) -> None:
+    """
+    Given: A repository with open elements
+    When: 200 of them are processed with the same action
+    Then: a prompt is shown for each of them.
+
+    Each round starts with a new repository.
+    """
+
+    def new_repository() -> Tuple[Tuple[Any, ...], Dict[str, Any]]:
+        make_repo(backend, stored_elements).close()
+        return (), {}
+
+    result = benchmark.pedantic(
+        lambda: drive_process(
+            benchmark_config, tmp_path, monkeypatch, [action.value] * 200
+        ),
+        setup=new_repository,
+        rounds=3,
+    )
+
+    # With more elements than answers, the loop ends at the next prompt.
+    assert result == (200 if stored_elements == 200 else 201)
@@ -0,0 +1,114 @@
+"""Benchmark the views used to show and process the inbox."""
+
+from itertools import islice
+from typing import TYPE_CHECKING, Callable
+
+import pytest
+from repository_orm import Repository
+
+from pynbox import views
+from pynbox.config import Config
+from pynbox.model import ElementOrder
+
+if TYPE_CHECKING:
+    from pytest_benchmark.fixture import BenchmarkFixture
+
+pytest.importorskip("pytest_benchmark")
+
+
+@pytest.mark.slow()
+@pytest.mark.parametrize("backend", ["tinydb", "sqlite"])
+@pytest.mark.parametrize("stored_elements", [1000, 10000])
+@pytest.mark.parametrize("order", [ElementOrder.TYPE, ElementOrder.PRIORITY])
+def test_get_elements_first_page(
+    benchmark: "BenchmarkFixture",
+    benchmark_config: Config,
+    make_repo: Callable[[str, int], Repository],
+    backend: str,
+    stored_elements: int,
+    order: ElementOrder,
+) -> None:
+    """
+    Given: A repository with open elements
+    When: the first page of elements to process is built
+    Then: it has the page size elements.
+    """
+    repo = make_repo(backend, stored_elements)
+
+    result = benchmark(
+        lambda: list(
+            islice(views.get_elements(repo, benchmark_config, order=order), 50)
+        )
+    )
+
+    assert len(result) == 50
+    repo.close()
+
+
+@pytest.mark.slow()
+@pytest.mark.parametrize("backend", ["tinydb", "sqlite"])
+@pytest.mark.parametrize("stored_elements", [1000, 10000])
+def test_get_elements_all(
+    benchmark: "BenchmarkFixture",
+    benchmark_config: Config,
+    make_repo: Callable[[str, int], Repository],
+    backend: str,
+    stored_elements: int,
+) -> None:
+    """
+    Given: A repository with open elements
+    When: all the elements to process are built
+    Then: all the open elements are returned.
+    """
+    repo = make_repo(backend, stored_elements)
+
+    result = benchmark(lambda: list(views.get_elements(repo, benchmark_config)))
+
+    assert len(result) == stored_elements
+    repo.close()
+
+
+@pytest.mark.slow()
+@pytest.mark.parametrize("backend", ["tinydb", "sqlite"])
+@pytest.mark.parametrize("stored_elements", [1000, 10000])
+def test_get_element_records_all(
+    benchmark: "BenchmarkFixture",
+    benchmark_config: Config,
+    make_repo: Callable[[str, int], Repository],
+    backend: str,
+    stored_elements: int,
+) -> None:
+    """
+    Given: A repository with open elements
+    When: the records of all the elements to process are built
+    Then: all the open elements are returned.
+    """
+    repo = make_repo(backend, stored_elements)
+
+    result = benchmark(lambda: list(views.get_element_records(repo, benchmark_config)))
+
+    assert len(result) == stored_elements
+    repo.close()
+
+
+@pytest.mark.slow()
+@pytest.mark.parametrize("backend", ["tinydb", "sqlite"])
+@pytest.mark.parametrize("stored_elements", [1000, 10000])
+def test_status(
+    benchmark: "BenchmarkFixture",
+    benchmark_config: Config,
+    make_repo: Callable[[str, int], Repository],
+    backend: str,
+    stored_elements: int,
+) -> None:
+    """
+    Given: A repository with open elements
+    When: the status is computed
+    Then: the open elements of each type are returned.
+    """
+    repo = make_repo(backend, stored_elements)
+
+    result = benchmark(views.status, repo, benchmark_config)
+
+    assert sum(result.values()) == stored_elements
+    repo.close()
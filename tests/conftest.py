@@ -15,6 +15,8 @@ def fixture_config(tmp_path: Path) -> Config:
     """Configure the Config object for the tests."""
     tinydb_file_path = str(tmp_path / "tinydb.db")
     os.environ["DATABASE_URL"] = f"tinydb:///{tinydb_file_path}"
+    os.environ["XDG_CACHE_HOME"] = str(tmp_path / "cache")
+    os.environ["METRICS_PATH"] = str(tmp_path / "metrics.jsonl")
 
     config = Config()
     config.load("tests/assets/config.yaml")
@@ -1,11 +1,15 @@
 """Test the command line interface."""
 
+import io
+import json
 import logging
 import os
+import pstats
 import re
 import subprocess
 import sys
 import time
+from datetime import datetime
 from pathlib import Path
 from typing import Any, Generator
 
@@ -16,9 +20,10 @@ from _pytest.logging import LogCaptureFixture
 from click.testing import CliRunner
 from repository_orm import Repository, load_repository
 
+from pynbox import views
 from pynbox.config import Config
 from pynbox.entrypoints.cli import cli
-from pynbox.model import Element, ElementState
+from pynbox.model import Element, ElementCounter, ElementState
 from pynbox.version import __version__
 
 log = logging.getLogger(__name__)
@@ -145,6 +150,29 @@ def test_do_element(config: Config, repo: Repository) -> None:
     assert element.closed is not None
 
 
+def test_process_records_the_decisions(
+    runner: CliRunner, config: Config, repo: Repository
+) -> None:
+    """
+    Given: An element in the repository
+    When: it's processed and then the metrics command is called
+    Then: the decision is recorded and shown in the metrics.
+    """
+    repo.add(Element(type_="task", description="Task title"))
+    repo.commit()
+    tui = pexpect.spawn(f"pynbox -c {CONFIG_PATH} process", timeout=5)
+    tui.logfile = sys.stdout.buffer
+    tui.expect(".*Quit.*")
+    tui.sendline("d")
+    tui.expect_exact(pexpect.EOF)
+
+    result = runner.invoke(cli, ["metrics"])
+
+    assert result.exit_code == 0
+    assert re.search(r"Task.*done.*1.*s.*ms", result.stdout)
+    assert "1 sessions" in result.stdout
+
+
 def test_delete_element(config: Config, repo: Repository) -> None:
     """
     Given: An element in the repository
@@ -412,3 +440,389 @@ def test_copy_text_to_clipboard(config: Config, repo: Repository) -> None:
     )
     tui.sendline("q")
     tui.expect_exact(pexpect.EOF)
+
+
+def test_status_can_rebuild_the_counters(
+    runner: CliRunner, config: Config, repo: Repository
+) -> None:
+    """
+    Given: A repository whose element counters don't match the stored elements
+    When: The status command is called with the rebuild flag
+    Then: The counters are recomputed before showing the status.
+    """
+    repo.add(Element(type_="task", description="Task title"))
+    repo.add(
+        ElementCounter(id_="idea:open", type_="idea", state=ElementState.OPEN, count=3)
+    )
+    repo.commit()
+
+    result = runner.invoke(cli, ["status", "--rebuild"])
+
+    assert result.exit_code == 0
+    assert re.search(r"Task.*1", result.stdout)
+    assert "Idea" not in result.stdout
+
+
+def test_process_updates_the_counters(config: Config, repo: Repository) -> None:
+    """
+    Given: An open element in the repository
+    When: it's marked as done with the process command
+    Then: the element counters are updated.
+    """
+    repo.add(Element(type_="task", description="Task title"))
+    repo.commit()
+    tui = pexpect.spawn(f"pynbox -c {CONFIG_PATH} process", timeout=5)
+    tui.logfile = sys.stdout.buffer
+    tui.expect(".*Quit.*")
+
+    tui.sendline("d")  # act
+
+    tui.expect_exact(pexpect.EOF)
+    counters = {
+        (counter.type_, counter.state): counter.count
+        for counter in repo.all(ElementCounter)
+    }
+    assert counters[("task", ElementState.OPEN)] == 0
+    assert counters[("task", ElementState.CLOSED)] == 1
+
+
+def test_parse_doesnt_open_the_repository_if_file_is_empty(
+    runner: CliRunner, config: Config, tmp_path: Path
+) -> None:
+    """
+    Given: A configured program and an empty file to parse
+    When: parse command line is used
+    Then: the command ends without initializing the repository.
+    """
+    parse_file = tmp_path / "parse.pynbox"
+    parse_file.write_text("")
+
+    result = runner.invoke(cli, ["parse", str(parse_file)])
+
+    assert result.exit_code == 0
+    assert not (tmp_path / "tinydb.db").exists()
+
+
+def test_migrate_copies_the_elements_to_the_configured_repository(
+    runner: CliRunner, config: Config, repo: Repository, tmp_path: Path
+) -> None:
+    """
+    Given: A tinydb repository with an element and an sqlite configured database
+    When: the migrate command is called with the tinydb url
+    Then: the element is copied to the sqlite database.
+    """
+    repo.add(Element(type_="task", description="Task title"))
+    repo.commit()
+    sqlite_url = f"sqlite:///{tmp_path / 'database.db'}"
+
+    result = runner.invoke(
+        cli, ["migrate", config.database_url], env={"DATABASE_URL": sqlite_url}
+    )
+
+    assert result.exit_code == 0
+    sqlite_repo = load_repository(database_url=sqlite_url)
+    assert sqlite_repo.all(Element) == repo.all(Element)
+
+
+def test_migrate_fails_if_the_configured_repository_has_elements(
+    runner: CliRunner, config: Config, repo: Repository, caplog: LogCaptureFixture
+) -> None:
+    """
+    Given: A configured repository that already has elements
+    When: the migrate command is called
+    Then: an error is shown and the command fails.
+    """
+    repo.add(Element(type_="task", description="Task title"))
+    repo.commit()
+
+    result = runner.invoke(cli, ["migrate", "fake://"])
+
+    assert result.exit_code == 1
+    assert (
+        "pynbox.entrypoints.cli",
+        logging.ERROR,
+        "The destination repository already has elements, refusing to migrate",
+    ) in caplog.record_tuples
+
+
+def test_process_stores_the_decisions_on_ctrl_c(
+    config: Config, repo: Repository
+) -> None:
+    """
+    Given: Two open elements
+    When: the first is marked as done and Ctrl-C is pressed on the second
+    Then: the first decision is stored and the second element is left open.
+    """
+    repo.add(Element(type_="task", description="Task title"))
+    repo.add(Element(type_="task", description="Second task"))
+    repo.commit()
+    tui = pexpect.spawn(f"pynbox -c {CONFIG_PATH} process", timeout=5)
+    tui.logfile = sys.stdout.buffer
+    tui.expect(".*Quit.*")
+    tui.sendline("d")
+    tui.expect(".*Second task.*Quit.*")
+
+    tui.sendcontrol("c")  # act
+
+    tui.expect_exact(pexpect.EOF)
+    assert repo.get(0, Element).state == ElementState.CLOSED
+    assert repo.get(1, Element).state == ElementState.OPEN
+
+
+def test_process_keeps_the_type_on_ctrl_c_while_changing_it(
+    config: Config, repo: Repository
+) -> None:
+    """
+    Given: An open element
+    When: the change type action is chosen and Ctrl-C is pressed on the type prompt
+    Then: the session ends, the element keeps its type and no invalid change is
+        recorded.
+    """
+    repo.add(Element(type_="task", description="Task title"))
+    repo.commit()
+    tui = pexpect.spawn(f"pynbox -c {CONFIG_PATH} process", timeout=5)
+    tui.logfile = sys.stdout.buffer
+    tui.expect(".*Quit.*")
+    tui.sendline("t")
+    tui.expect(".*Select the new type.*")
+
+    tui.sendcontrol("c")  # act
+
+    tui.expect_exact(pexpect.EOF)
+    tui.close()
+    assert tui.exitstatus == 0
+    assert b"corrupt journal record" not in tui.before
+    element = repo.get(0, Element)
+    assert element.type_ == "task"
+    assert element.state == ElementState.OPEN
+
+
+def test_process_batch_closes_the_selected_elements(
+    config: Config, repo: Repository
+) -> None:
+    """
+    Given: Three open elements
+    When: the batch mode is used to select the first and the last, and mark them as
+        done
+    Then: the selected elements are closed and the other is left open.
+    """
+    for description in ["First task", "Second task", "Third task"]:
+        repo.add(Element(type_="task", description=description))
+    repo.commit()
+    tui = pexpect.spawn(f"pynbox -c {CONFIG_PATH} process --batch", timeout=5)
+    tui.logfile = sys.stdout.buffer
+    tui.expect(".*Third task.*")
+    tui.send(" ")
+    tui.send("j")
+    tui.send("j")
+    tui.send(" ")
+    tui.send("\r")
+    tui.expect(".*Quit.*")
+
+    tui.sendline("d")  # act
+
+    tui.expect(".*Second task.*")
+    tui.send("\r")
+    tui.expect_exact(pexpect.EOF)
+    assert repo.get(0, Element).state == ElementState.CLOSED
+    assert repo.get(1, Element).state == ElementState.OPEN
+    assert repo.get(2, Element).state == ElementState.CLOSED
+
+
+def test_archive_moves_the_closed_elements_to_the_archive(
+    runner: CliRunner, config: Config, repo: Repository, tmp_path: Path
+) -> None:
+    """
+    Given: A closed and an open element
+    When: the archive command is called for the elements closed before now
+    Then: the closed element is moved to the archive directory.
+    """
+    element = Element(type_="task", description="Closed task")
+    element.close()
+    repo.add(element)
+    repo.add(Element(type_="task", description="Open task"))
+    repo.commit()
+    archive_path = tmp_path / "archive"
+
+    result = runner.invoke(
+        cli, ["archive", "--days", "0"], env={"ARCHIVE_PATH": str(archive_path)}
+    )
+
+    assert result.exit_code == 0
+    assert [element.description for element in repo.all(Element)] == ["Open task"]
+    assert len(list(archive_path.glob("*.jsonl.gz"))) == 1
+
+
+def test_export_writes_the_elements_to_a_file(
+    runner: CliRunner, config: Config, repo: Repository, tmp_path: Path
+) -> None:
+    """
+    Given: Two elements
+    When: the export command is called
+    Then: a csv file with a row per element is written.
+    """
+    repo.add(Element(type_="task", description="Buy bread"))
+    repo.add(Element(type_="idea", description="Learn python"))
+    repo.commit()
+    file_path = tmp_path / "elements.csv"
+
+    result = runner.invoke(cli, ["export", str(file_path), "--format", "csv"])
+
+    assert result.exit_code == 0
+    assert len(file_path.read_text().splitlines()) == 3
+
+
+def test_stats_shows_the_history_of_the_elements(
+    runner: CliRunner, config: Config, repo: Repository
+) -> None:
+    """
+    Given: A closed element created and closed today and a skipped one
+    When: the stats command is called
+    Then: the elements per type and day, and the skips are shown.
+    """
+    element = Element(type_="task", description="Buy bread")
+    element.close()
+    repo.add(element)
+    repo.add(Element(type_="idea", description="Learn python", skips=1))
+    repo.commit()
+
+    result = runner.invoke(cli, ["stats"])
+
+    assert result.exit_code == 0
+    assert re.search(r"Task.*1.*1.*0\.0", result.stdout)
+    assert re.search(r"Idea.*1.*0.*-", result.stdout)
+    assert re.search(rf"{datetime.now().date().isoformat()}.*Task.*1.*1", result.stdout)
+
+
+def test_profile_shows_the_time_of_each_phase(
+    runner: CliRunner, config: Config, repo: Repository
+) -> None:
+    """
+    Given: An element in the repository
+    When: the status command is called with the profile flag
+    Then: the time of the configuration loading and the views is shown.
+    """
+    repo.add(Element(type_="task", description="Buy bread"))
+    repo.commit()
+
+    result = runner.invoke(cli, ["--profile", "status"])
+
+    assert result.exit_code == 0
+    assert re.search(r"config.*load_config.*1.*ms", result.stderr)
+    assert re.search(r"views.*views\.status.*1.*ms", result.stderr)
+    assert not hasattr(views.status, "__wrapped__")
+
+
+@pytest.mark.parametrize("file_name", ["profile.json", "profile.prof"])
+def test_profile_output_writes_the_profile(
+    runner: CliRunner, config: Config, tmp_path: Path, file_name: str
+) -> None:
+    """
+    Given: A configured program
+    When: the status command is called with a profile output
+    Then: a speedscope profile is written for json files, and a cProfile one for
+        the rest.
+    """
+    file_path = tmp_path / file_name
+
+    result = runner.invoke(cli, ["--profile-output", str(file_path), "status"])
+
+    assert result.exit_code == 0
+    if file_name.endswith(".json"):
+        profile = json.loads(file_path.read_text())
+        assert {"name": "load_config"} in profile["shared"]["frames"]
+    else:
+        output = io.StringIO()
+        pstats.Stats(str(file_path), stream=output).print_stats()
+        assert "load_config" in output.getvalue()
+
+
+def test_search_shows_the_matching_elements(
+    runner: CliRunner, config: Config, repo: Repository
+) -> None:
+    """
+    Given: Two elements
+    When: the search command is called with a word of one of them
+    Then: only the matching element is shown.
+    """
+    repo.add(Element(type_="task", description="Buy bread"))
+    repo.add(Element(type_="idea", description="Learn python"))
+    repo.commit()
+
+    result = runner.invoke(cli, ["search", "bread", "--state", "open"])
+
+    assert result.exit_code == 0
+    assert re.search(r"0.*Task.*open.*Buy bread", result.stdout)
+    assert "Learn python" not in result.stdout
+
+
+def test_parse_stores_the_elements_of_a_directory(
+    runner: CliRunner, config: Config, repo: Repository, tmp_path: Path
+) -> None:
+    """
+    Given: A directory with two files with elements
+    When: parse command line is used with the directory
+    Then: the elements of both files are stored and the files are emptied.
+    """
+    inbox = tmp_path / "inbox"
+    inbox.mkdir()
+    (inbox / "laptop.pynbox").write_text("t. Laptop task\n")
+    (inbox / "phone.pynbox").write_text("i. Phone idea\n")
+
+    result = runner.invoke(cli, ["parse", str(inbox)])
+
+    assert result.exit_code == 0
+    assert [element.description for element in repo.all(Element)] == [
+        "Laptop task",
+        "Phone idea",
+    ]
+    assert (inbox / "phone.pynbox").read_text() == ""
+
+
+def test_watch_ingests_the_files_until_interrupted(
+    config: Config, repo: Repository, tmp_path: Path
+) -> None:
+    """
+    Given: A watched inbox directory
+    When: two elements are written and the command is interrupted
+    Then: the first element is stored and the ingestion counters are shown.
+    """
+    inbox = tmp_path / "inbox"
+    inbox.mkdir()
+    tui = pexpect.spawn(f"pynbox -c {CONFIG_PATH} watch {inbox}", timeout=5)
+    tui.logfile = sys.stdout.buffer
+    tui.expect("Watching")
+    (inbox / "phone.pynbox").write_text("t. Task title\nt. Next task\n")
+    deadline = time.monotonic() + 5
+    while (
+        not (inbox / "phone.pynbox.checkpoint").exists() and time.monotonic() < deadline
+    ):
+        time.sleep(0.05)
+
+    tui.sendintr()  # act
+
+    tui.expect("Ingested 1 elements in 1 batches")
+    tui.expect_exact(pexpect.EOF)
+    assert repo.all(Element)[0].description == "Task title"
+
+
+def test_process_can_order_the_elements_by_priority(
+    config: Config, repo: Repository
+) -> None:
+    """
+    Given: A normal and a high priority element
+    When: the process command is used with the priority order
+    Then: the high priority element is shown first.
+    """
+    repo.add(Element(type_="task", description="Normal task"))
+    repo.add(Element(type_="task", description="Important task", priority=5))
+    repo.commit()
+
+    tui = pexpect.spawn(
+        f"pynbox -c {CONFIG_PATH} process --order priority", timeout=5
+    )  # act
+
+    tui.logfile = sys.stdout.buffer
+    tui.expect(".*Important task.*")
+    tui.sendline("q")
+    tui.expect_exact(pexpect.EOF)
@@ -0,0 +1,72 @@
+"""Benchmark the bulk ingestion of elements."""
+
+import time
+from pathlib import Path
+from typing import List
+
+import pytest
+
+from pynbox import services
+from pynbox.config import Config
+from pynbox.entrypoints import get_repo
+from pynbox.model import Element
+
+
+def _build_elements(number: int) -> List[Element]:
+    """Create a number of new elements."""
+    return [
+        Element(type_="task", description=f"Task {index}", body="Task body")
+        for index in range(number)
+    ]
+
+
+@pytest.mark.slow()
+@pytest.mark.parametrize("backend", ["tinydb", "sqlite"])
+def test_add_elements_imports_100k_elements(
+    config: Config, tmp_path: Path, backend: str
+) -> None:
+    """
+    Given: An empty repository and 100k elements
+    When: they are added in one batch
+    Then: they are all stored in less than 30 seconds.
+    """
+    config.database_url = f"{backend}:///{tmp_path / 'database.db'}"
+    repo = get_repo(config)
+    elements = _build_elements(100000)
+    start = time.perf_counter()
+
+    services.add_elements(repo, elements)
+
+    repo.commit()
+    assert time.perf_counter() - start < 30
+    assert elements[-1].id_ == 99999
+    repo.close()
+
+
+@pytest.mark.slow()
+@pytest.mark.parametrize("backend", ["tinydb", "sqlite"])
+def test_add_elements_is_faster_than_adding_one_by_one(
+    config: Config, tmp_path: Path, backend: str
+) -> None:
+    """
+    Given: Two empty repositories
+    When: 300 elements are added one by one in one and in a batch in the other
+    Then: the batch is at least five times faster.
+    """
+    config.database_url = f"{backend}:///{tmp_path / 'one_by_one.db'}"
+    repo = get_repo(config)
+    start = time.perf_counter()
+    for element in _build_elements(300):
+        repo.add(element)
+    repo.commit()
+    one_by_one_time = time.perf_counter() - start
+    repo.close()
+    config.database_url = f"{backend}:///{tmp_path / 'batch.db'}"
+    repo = get_repo(config)
+    start = time.perf_counter()
+
+    services.add_elements(repo, _build_elements(300))
+
+    repo.commit()
+    assert time.perf_counter() - start < one_by_one_time / 5
+    repo.close()
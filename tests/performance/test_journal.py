@@ -0,0 +1,45 @@
+"""Benchmark the storage of the decisions taken while processing the inbox."""
+
+import time
+from pathlib import Path
+
+import pytest
+
+from pynbox import services
+from pynbox.config import Config
+from pynbox.entrypoints import get_repo
+from pynbox.model import Element, ElementState
+
+
+@pytest.mark.slow()
+def test_record_element_is_faster_than_rewriting_the_database(
+    config: Config, tmp_path: Path
+) -> None:
+    """
+    Given: A tinydb repository with 50k elements
+    When: 20 decisions are recorded
+    Then: it takes less than a single commit, which rewrites the whole file.
+    """
+    config.database_url = f"tinydb:///{tmp_path / 'database.tinydb'}"
+    repo = get_repo(config)
+    elements = services.add_elements(
+        repo,
+        [
+            Element(type_="task", description=f"Task {index}", body="Task body")
+            for index in range(50000)
+        ],
+    )
+    elements[0].close()
+    repo.add(elements[0])
+    start = time.perf_counter()
+    repo.commit()
+    commit_time = time.perf_counter() - start
+    start = time.perf_counter()
+
+    for element in elements[1:21]:
+        element.close()
+        services.record_element(repo, element, ("task", ElementState.OPEN))
+
+    result = time.perf_counter() - start
+    repo.close()
+    assert result < commit_time
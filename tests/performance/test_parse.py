@@ -0,0 +1,60 @@
+"""Benchmark the parsing of the inbox files."""
+
+import time
+from typing import List
+
+import pytest
+
+from pynbox import services
+from pynbox.config import Config
+from pynbox.model import ElementType
+
+
+def _build_types(types: int) -> List[ElementType]:
+    """Create a number of element types whose prefix is t<index>."""
+    return [
+        ElementType(name=f"type_{index}", regexp=rf"t{index}\.")
+        for index in range(types)
+    ]
+
+
+def _time_parse(config: Config, text: str, rounds: int = 5) -> float:
+    """Return the best time to parse a text out of a number of rounds."""
+    times = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        services.parse(config, text)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+@pytest.mark.slow()
+def test_parse_time_does_not_grow_with_the_number_of_types(config: Config) -> None:
+    """
+    Given: Two configurations, one with 2 types and another with 200
+    When: the same number of lines are parsed, all of them matching the last type
+    Then: parsing with 200 types doesn't take much longer than with 2.
+    """
+    lines = 2000
+    config.types = _build_types(2)
+    few_types_time = _time_parse(config, "\n".join(["t1. Element title"] * lines))
+    config.types = _build_types(200)
+
+    result = _time_parse(config, "\n".join(["t199. Element title"] * lines))
+
+    assert result < few_types_time * 1.5
+
+
+@pytest.mark.slow()
+def test_parse_time_grows_linearly_with_the_number_of_lines(config: Config) -> None:
+    """
+    Given: A configuration with 40 types
+    When: texts of 2000 and 8000 lines are parsed
+    Then: the time grows proportionally with the number of lines.
+    """
+    config.types = _build_types(40)
+    small_time = _time_parse(config, "\n".join(["t39. Element title"] * 2000))
+
+    result = _time_parse(config, "\n".join(["t39. Element title"] * 8000))
+
+    assert 2 * small_time < result < 8 * small_time
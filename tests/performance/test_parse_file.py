@@ -0,0 +1,40 @@
+"""Benchmark the memory usage of parsing big inbox files."""
+
+import tracemalloc
+from pathlib import Path
+
+import pytest
+
+from pynbox import services
+from pynbox.config import Config
+
+
+def _peak_memory(config: Config, file_path: Path) -> int:
+    """Return the peak memory used while iterating the elements of a file."""
+    tracemalloc.start()
+    with open(file_path, "r", encoding="utf-8") as file_descriptor:
+        for _ in services.parse_lines(config, file_descriptor):
+            pass
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak
+
+
+@pytest.mark.slow()
+def test_parse_lines_memory_does_not_grow_with_file_size(
+    config: Config, tmp_path: Path
+) -> None:
+    """
+    Given: Two inbox files, one 10 times bigger than the other
+    When: their elements are iterated
+    Then: the peak memory is roughly the same.
+    """
+    small_file = tmp_path / "small.pynbox"
+    small_file.write_text("t. Task title\nTask body\n" * 2000)
+    big_file = tmp_path / "big.pynbox"
+    big_file.write_text("t. Task title\nTask body\n" * 20000)
+    small_peak = _peak_memory(config, small_file)
+
+    result = _peak_memory(config, big_file)
+
+    assert result < small_peak * 1.5
@@ -0,0 +1,44 @@
+"""Benchmark the full text search of the elements."""
+
+import os
+import time
+from pathlib import Path
+
+import pytest
+
+from pynbox import services, views
+from pynbox.config import Config
+from pynbox.entrypoints import get_repo
+from pynbox.model import Element
+
+large = pytest.mark.skipif(
+    "PYNBOX_LARGE_BENCHMARKS" not in os.environ,
+    reason="Set PYNBOX_LARGE_BENCHMARKS to benchmark the large repositories",
+)
+
+
+@pytest.mark.slow()
+@pytest.mark.parametrize("size", [100000, pytest.param(1000000, marks=large)])
+def test_search_is_fast_on_sqlite(config: Config, tmp_path: Path, size: int) -> None:
+    """
+    Given: A sqlite repository with many elements
+    When: an element is searched by a word of its body
+    Then: it takes less than 50 milliseconds.
+    """
+    config.database_url = f"sqlite:///{tmp_path / 'database.db'}"
+    repo = get_repo(config)
+    services.add_elements(
+        repo,
+        [
+            Element(type_="task", description=f"Task {index}", body=f"body{index}")
+            for index in range(size)
+        ],
+    )
+    repo.commit()
+    start = time.perf_counter()
+
+    result = views.search(repo, f"body{size // 2}")
+
+    assert time.perf_counter() - start < 0.05
+    assert len(result) == 1
+    repo.close()
@@ -0,0 +1,82 @@
+"""Benchmark the SQLite backend against the TinyDB one.
+
+The 100k and 1M element repositories take minutes to build, so they are only
+benchmarked if the PYNBOX_LARGE_BENCHMARKS environment variable is set.
+"""
+
+import os
+import time
+from pathlib import Path
+from typing import Dict
+
+import pytest
+
+from pynbox import services, views
+from pynbox.config import Config
+from pynbox.entrypoints import get_repo
+from pynbox.model import Element
+
+large = pytest.mark.skipif(
+    "PYNBOX_LARGE_BENCHMARKS" not in os.environ,
+    reason="Set PYNBOX_LARGE_BENCHMARKS to benchmark the large repositories",
+)
+
+
+def _measure(
+    config: Config, tmp_path: Path, backend: str, size: int
+) -> Dict[str, float]:
+    """Measure the time of the common operations on a repository of size elements.
+
+    Three quarters of the elements are closed, as happens in a long used inbox.
+    """
+    config.database_url = f"{backend}:///{tmp_path / f'{backend}.db'}"
+    repo = get_repo(config)
+    elements = [
+        Element(type_="task", description=f"Task {index}", body="Task body")
+        for index in range(size)
+    ]
+    for element in elements[: size * 3 // 4]:
+        element.close()
+    services.add_elements(repo, elements)
+    repo.commit()
+    repo.close()
+    times = {}
+
+    start = time.perf_counter()
+    repo = get_repo(config)
+    views.status(repo, config)
+    times["status"] = time.perf_counter() - start
+    start = time.perf_counter()
+    element = next(views.get_elements(repo, config))
+    times["first_element"] = time.perf_counter() - start
+    start = time.perf_counter()
+    previous = (element.type_, element.state)
+    element.close()
+    services.save_element(repo, element, previous)
+    repo.commit()
+    times["save_element"] = time.perf_counter() - start
+    repo.close()
+
+    return times
+
+
+@pytest.mark.slow()
+@pytest.mark.parametrize(
+    "size",
+    [10000, pytest.param(100000, marks=large), pytest.param(1000000, marks=large)],
+)
+def test_sqlite_is_faster_than_tinydb(
+    config: Config, tmp_path: Path, size: int
+) -> None:
+    """
+    Given: A TinyDB and a SQLite repository with the same elements
+    When: the status is shown, the first element is fetched and it's closed
+    Then: SQLite is faster fetching and saving, and the status is instant in both.
+    """
+    tinydb_times = _measure(config, tmp_path, "tinydb", size)
+
+    sqlite_times = _measure(config, tmp_path, "sqlite", size)  # act
+
+    assert sqlite_times["first_element"] < tinydb_times["first_element"]
+    assert sqlite_times["save_element"] < tinydb_times["save_element"] / 5
+    assert sqlite_times["status"] < 0.5
@@ -0,0 +1,87 @@
+"""Benchmark the start up time of the command line."""
+
+import os
+import re
+import subprocess
+import sys
+from pathlib import Path
+from typing import Dict, List
+
+import pytest
+from tests.e2e.test_cli import CONFIG_PATH
+
+# Maximum cumulative microseconds that can take to import the modules required by
+# a command. It's generous to avoid false positives in slow environments, what
+# matters is that the heavy libraries are not loaded.
+IMPORT_TIME_BUDGET = 1500000
+# Modules that are not needed by the commands that don't show a TUI, once the
+# configuration is cached.
+UNNEEDED_MODULES = ["questionary", "prompt_toolkit", "ruamel"]
+
+
+def _import_times(arguments: List[str], tmp_path: Path) -> Dict[str, int]:
+    """Run a pynbox command and return the import time of each module.
+
+    The time of each module is the cumulative one, so the time of the whole
+    command is the sum of the times of the modules imported at the top level.
+
+    Args:
+        arguments: Arguments of the pynbox command.
+        tmp_path: Directory to store the database.
+    """
+    process = subprocess.run(
+        [
+            sys.executable,
+            "-X",
+            "importtime",
+            "-c",
+            "from pynbox.entrypoints.cli import cli; cli()",
+            "-c",
+            CONFIG_PATH,
+            *arguments,
+        ],
+        env={
+            **os.environ,
+            "DATABASE_URL": f"tinydb:///{tmp_path / 'database.db'}",
+            "XDG_CACHE_HOME": str(tmp_path / "cache"),
+        },
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times = {}
+    for line in process.stderr.splitlines():
+        match = re.match(r"import time: +\d+ \| +(\d+) \| ( *)(\S+)", line)
+        if match:
+            times[f"{match.group(2)}{match.group(3)}"] = int(match.group(1))
+    return times
+
+
+@pytest.mark.slow()
+@pytest.mark.parametrize(
+    ("arguments", "forbidden_modules"),
+    [
+        (["add", "t.", "Task", "title"], [*UNNEEDED_MODULES, "rich"]),
+        (["status"], UNNEEDED_MODULES),
+    ],
+)
+def test_commands_dont_import_unneeded_libraries(
+    tmp_path: Path, arguments: List[str], forbidden_modules: List[str]
+) -> None:
+    """
+    Given: A configured program
+    When: The commands that don't need the TUI are run
+    Then: The unneeded libraries are not imported and the import time is under budget.
+
+    The command is run twice so that the configuration is loaded from the cache,
+    and the YAML parser is not imported either.
+    """
+    _import_times(arguments, tmp_path)
+
+    result = _import_times(arguments, tmp_path)
+
+    modules = {module.strip() for module in result}
+    for module in forbidden_modules:
+        assert module not in modules
+    top_level_modules = [module for module in result if not module.startswith(" ")]
+    assert sum(result[module] for module in top_level_modules) < IMPORT_TIME_BUDGET
@@ -0,0 +1,145 @@
+"""Benchmark the views of the program."""
+
+import time
+import tracemalloc
+from collections import Counter
+from datetime import date
+from pathlib import Path
+from typing import Dict, Tuple
+
+import pytest
+
+from pynbox import services, views
+from pynbox.config import Config
+from pynbox.entrypoints import get_repo
+from pynbox.model import Element, ElementOrder
+
+
+@pytest.mark.slow()
+def test_get_elements_returns_the_first_element_fast(
+    config: Config, tmp_path: Path
+) -> None:
+    """
+    Given: A repository with 20k open elements
+    When: the first element to process is requested
+    Then: it takes much less than building all the elements.
+    """
+    config.database_url = f"sqlite:///{tmp_path / 'database.db'}"
+    repo = get_repo(config)
+    services.add_elements(
+        repo,
+        [Element(type_="task", description=f"Task {index}") for index in range(20000)],
+    )
+    repo.commit()
+    start = time.perf_counter()
+    list(views.get_elements(repo, config))
+    all_elements_time = time.perf_counter() - start
+    start = time.perf_counter()
+
+    next(views.get_elements(repo, config))  # act
+
+    assert time.perf_counter() - start < all_elements_time / 5
+    repo.close()
+
+
+@pytest.mark.slow()
+def test_get_elements_by_priority_returns_the_first_element_fast(
+    config: Config, tmp_path: Path
+) -> None:
+    """
+    Given: A repository with 20k open elements
+    When: the first element by priority is requested
+    Then: it takes much less than building all the elements.
+    """
+    config.database_url = f"sqlite:///{tmp_path / 'database.db'}"
+    repo = get_repo(config)
+    services.add_elements(
+        repo,
+        [
+            Element(type_="task", description=f"Task {index}", priority=index % 5)
+            for index in range(20000)
+        ],
+    )
+    repo.commit()
+    start = time.perf_counter()
+    list(views.get_elements(repo, config, order=ElementOrder.PRIORITY))
+    all_elements_time = time.perf_counter() - start
+    start = time.perf_counter()
+
+    next(views.get_elements(repo, config, order=ElementOrder.PRIORITY))  # act
+
+    assert time.perf_counter() - start < all_elements_time / 5
+    repo.close()
+
+
+@pytest.mark.slow()
+def test_element_records_are_lighter_than_elements(
+    config: Config, tmp_path: Path
+) -> None:
+    """
+    Given: A repository with 50k open elements
+    When: all the elements to process are loaded as records and as Elements
+    Then: the records take a fraction of the time and memory of the Elements.
+    """
+    config.database_url = f"sqlite:///{tmp_path / 'database.db'}"
+    repo = get_repo(config)
+    services.add_elements(
+        repo,
+        [
+            Element(type_="task", description=f"Task {index}", body="Task body")
+            for index in range(50000)
+        ],
+    )
+    repo.commit()
+    tracemalloc.start()
+    start = time.perf_counter()
+    elements = list(views.get_elements(repo, config))
+    elements_time = time.perf_counter() - start
+    elements_memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del elements
+    tracemalloc.start()
+    start = time.perf_counter()
+
+    records = list(views.get_element_records(repo, config))  # act
+
+    records_time = time.perf_counter() - start
+    records_memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    assert len(records) == 50000
+    assert records_time < elements_time / 2
+    assert records_memory < elements_memory / 2
+    repo.close()
+
+
+@pytest.mark.slow()
+def test_element_stats_is_faster_than_looping_the_elements(
+    config: Config, tmp_path: Path
+) -> None:
+    """
+    Given: A SQLite repository with 100k elements, most of them closed
+    When: the history stats are computed
+    Then: it's much faster than aggregating the Element objects in Python.
+    """
+    config.database_url = f"sqlite:///{tmp_path / 'database.db'}"
+    repo = get_repo(config)
+    elements = [
+        Element(type_="task", description=f"Task {index}", skips=index % 4)
+        for index in range(100000)
+    ]
+    for element in elements[:75000]:
+        element.close()
+    services.add_elements(repo, elements)
+    repo.commit()
+    start = time.perf_counter()
+    loop_created: Dict[Tuple[str, date], int] = Counter()
+    for element in repo.all(Element):
+        loop_created[(element.type_, element.created.date())] += 1
+    loop_time = time.perf_counter() - start
+    start = time.perf_counter()
+
+    result = views.element_stats(repo)  # act
+
+    assert time.perf_counter() - start < loop_time / 5
+    assert sum(result.created["task"].values()) == 100000
+    repo.close()
@@ -0,0 +1,82 @@
+"""Test the async counterparts of the services and views."""
+
+import asyncio
+from pathlib import Path
+from typing import List
+
+import pytest
+
+from pynbox.aio import AsyncInbox
+from pynbox.config import Config
+from pynbox.entrypoints import get_repo
+from pynbox.model import Element, ElementState
+
+
+@pytest.mark.parametrize("backend", ["tinydb", "sqlite"])
+def test_async_inbox_parses_processes_and_counts_elements(
+    config: Config, tmp_path: Path, backend: str
+) -> None:
+    """
+    Given: A file with three elements
+    When: it's parsed, and the elements are closed, deleted and retyped with the
+        async inbox
+    Then: the changes are stored and the status reflects them.
+    """
+    config.database_url = f"{backend}:///{tmp_path / 'database.db'}"
+    file_path = tmp_path / "inbox.pynbox"
+    file_path.write_text("t. First task\nt. Second task\nt. Third task\n")
+
+    async def use_inbox() -> List[Element]:
+        async with AsyncInbox(config, lambda: get_repo(config)) as inbox:
+            report = await inbox.parse_file(str(file_path))
+            assert report.elements == 3
+            elements = [element async for element in inbox.get_elements(page_size=2)]
+            await inbox.close(elements[0])
+            await inbox.delete(elements[1])
+            await inbox.change_type(elements[2], "idea")
+            await inbox.skip(elements[2])
+            assert await inbox.status() == {"idea": 1}
+            return elements
+
+    elements = asyncio.run(use_inbox())
+
+    repo = get_repo(config)
+    assert [element.state for element in repo.all(Element)] == [
+        ElementState.CLOSED,
+        ElementState.DELETED,
+        ElementState.OPEN,
+    ]
+    assert repo.get(elements[2].id_, Element).type_ == "idea"
+    assert repo.get(elements[2].id_, Element).skips == 1
+    repo.close()
+
+
+def test_async_inbox_doesnt_block_the_event_loop(
+    config: Config, tmp_path: Path
+) -> None:
+    """
+    Given: A file with many elements
+    When: it's parsed with the async inbox while another task runs
+    Then: the other task keeps running during the parse.
+    """
+    config.database_url = f"sqlite:///{tmp_path / 'database.db'}"
+    file_path = tmp_path / "inbox.pynbox"
+    file_path.write_text("".join(f"t. Task {index}\n" for index in range(20000)))
+    ticks = []
+
+    async def tick() -> None:
+        while True:
+            ticks.append(1)
+            await asyncio.sleep(0.001)
+
+    async def parse() -> None:
+        async with AsyncInbox(config, lambda: get_repo(config)) as inbox:
+            ticker = asyncio.create_task(tick())
+            await asyncio.sleep(0)
+            ticks.clear()
+            await inbox.parse_file(str(file_path))
+            ticker.cancel()
+
+    asyncio.run(parse())
+
+    assert len(ticks) > 5
@@ -0,0 +1,119 @@
+"""Test the configuration of the program."""
+
+from pathlib import Path
+from typing import Any, Dict
+
+import pytest
+from _pytest.monkeypatch import MonkeyPatch
+from pydantic import BaseSettings
+
+from pynbox import config as config_module
+from pynbox.config import Config
+
+
+@pytest.fixture(name="config_file")
+def fixture_config_file(tmp_path: Path, monkeypatch: MonkeyPatch) -> Path:
+    """Create a configuration file with one type."""
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    monkeypatch.delenv("max_time", raising=False)
+    monkeypatch.delenv("MAX_TIME", raising=False)
+    config_file = tmp_path / "config.yaml"
+    config_file.write_text("max_time: 60\ntypes:\n  - name: task\n    regexp: t\\.\n")
+    return config_file
+
+
+def _load(config_file: Path) -> Config:
+    """Load a configuration file."""
+    config = Config()
+    config.load(str(config_file))
+    return config
+
+
+def _unparsable_source(settings: BaseSettings) -> Dict[str, Any]:
+    """Fail if the configuration file is parsed."""
+    raise AssertionError("The configuration file was parsed")
+
+
+def test_load_uses_the_cache_the_second_time(
+    config_file: Path, monkeypatch: MonkeyPatch
+) -> None:
+    """
+    Given: A configuration file that has already been loaded
+    When: it's loaded again
+    Then: the values are taken from the cache instead of parsing the file.
+    """
+    _load(config_file)
+    monkeypatch.setattr(
+        config_module, "file_config_settings_source", _unparsable_source
+    )
+
+    result = _load(config_file)
+
+    assert result.max_time == 60
+    assert result.types[0].name == "task"
+    assert result.types[0].regexp == r"t\."
+
+
+def test_load_ignores_the_cache_if_the_file_changes(config_file: Path) -> None:
+    """
+    Given: A configuration file that has already been loaded
+    When: the file is changed and loaded again
+    Then: the new values are loaded.
+    """
+    _load(config_file)
+    config_file.write_text("max_time: 30\ntypes:\n  - name: idea\n    regexp: i\\.\n")
+
+    result = _load(config_file)
+
+    assert result.max_time == 30
+    assert result.types[0].name == "idea"
+
+
+def test_environment_takes_precedence_over_the_cache(
+    config_file: Path, monkeypatch: MonkeyPatch
+) -> None:
+    """
+    Given: A configuration file that has already been loaded
+    When: it's loaded again with an environment variable that overrides a value
+    Then: the value of the environment variable is used.
+    """
+    _load(config_file)
+    monkeypatch.setenv("MAX_TIME", "10")
+
+    result = _load(config_file)
+
+    assert result.max_time == 10
+
+
+def test_load_rebuilds_a_corrupt_cache(config_file: Path, tmp_path: Path) -> None:
+    """
+    Given: A configuration file whose cache is corrupt
+    When: it's loaded
+    Then: the values are loaded from the file and the cache is fixed.
+    """
+    _load(config_file)
+    cache_file = next((tmp_path / "cache" / "pynbox").iterdir())
+    cache_file.write_bytes(b"corrupt")
+
+    result = _load(config_file)
+
+    assert result.max_time == 60
+    assert cache_file.read_bytes() != b"corrupt"
+
+
+def test_load_ignores_the_cache_of_other_pynbox_version(
+    config_file: Path, monkeypatch: MonkeyPatch
+) -> None:
+    """
+    Given: A configuration file that has already been loaded
+    When: it's loaded again with another version of pynbox
+    Then: the file is parsed again instead of using the cache.
+    """
+    _load(config_file)
+    monkeypatch.setattr(config_module, "__version__", "0.0.0")
+    monkeypatch.setattr(
+        config_module, "file_config_settings_source", _unparsable_source
+    )
+
+    with pytest.raises(AssertionError, match="was parsed"):
+        _load(config_file)
@@ -0,0 +1,136 @@
+"""Test the measure of the time taken by the phases of the program."""
+
+import json
+import time
+from pathlib import Path
+from typing import Iterator
+
+from repository_orm import FakeRepository
+
+from pynbox import services, views
+from pynbox.config import Config
+from pynbox.model import Element, ElementRecord
+from pynbox.profiling import Profiler
+
+
+def test_span_self_time_excludes_the_nested_spans() -> None:
+    """
+    Given: A profiler
+    When: a span is opened inside another one
+    Then: the self time of the outer span doesn't include the inner one, and the
+        phases add up the self times.
+    """
+    profiler = Profiler()
+
+    with profiler.span("views", "outer"):
+        time.sleep(0.01)
+        with profiler.span("commit", "inner"):
+            time.sleep(0.05)
+
+    spans = {span.name: span for span in profiler.spans()}
+    assert spans["outer"].total >= 0.06
+    assert spans["outer"].self_time < 0.05
+    assert spans["inner"].self_time >= 0.05
+    assert list(profiler.phases()) == ["commit", "views"]
+
+
+def test_wrap_measures_the_generators_while_they_are_consumed() -> None:
+    """
+    Given: A generator function that takes time to yield each value
+    When: it's wrapped and consumed
+    Then: a span is measured each time it's advanced, with the time it took.
+    """
+    profiler = Profiler()
+
+    def slow_values() -> Iterator[int]:
+        for value in range(2):
+            time.sleep(0.02)
+            yield value
+
+    timed = profiler.wrap("parse", "slow_values", slow_values)
+
+    result = list(timed())
+
+    assert result == [0, 1]
+    span = profiler.spans()[0]
+    assert span.calls == 3
+    assert span.total >= 0.04
+
+
+def test_install_measures_the_hot_paths_until_uninstalled(config: Config) -> None:
+    """
+    Given: A profiler
+    When: it's installed, the program is used and it's uninstalled
+    Then: the parsing, views, hydration and commits are measured, and the original
+        functions are restored.
+    """
+    original_parse = services.parse
+    original_status = views.status
+    original_from_row = ElementRecord.from_row
+    profiler = Profiler()
+    profiler.install()
+    repo = FakeRepository()
+    services.add_elements(repo, services.parse(config, "t. Task\ni. Idea"))
+    repo.commit()
+    views.status(repo, config)
+    records = list(views.get_element_records(repo, config))
+    records[0].to_element()
+
+    profiler.uninstall()  # act
+
+    assert services.parse == original_parse
+    assert views.status == original_status
+    assert ElementRecord.from_row == original_from_row
+    assert set(profiler.phases()) == {
+        "parse",
+        "storage",
+        "views",
+        "hydration",
+        "commit",
+    }
+    spans = {span.name: span for span in profiler.spans()}
+    assert spans["ElementRecord.from_row"].calls == 2
+    assert spans["FakeRepository.commit"].calls == 1
+
+
+def test_dump_speedscope_writes_an_evented_profile(tmp_path: Path) -> None:
+    """
+    Given: A profiler with nested spans
+    When: the speedscope dump is written
+    Then: the file has the frames and the open and close events of the spans.
+    """
+    profiler = Profiler()
+    with profiler.span("views", "outer"):
+        with profiler.span("commit", "inner"):
+            pass
+    profiler.uninstall()
+    file_path = tmp_path / "profile.speedscope.json"
+
+    profiler.dump_speedscope(str(file_path))  # act
+
+    profile = json.loads(file_path.read_text())
+    assert profile["shared"]["frames"] == [{"name": "outer"}, {"name": "inner"}]
+    events = profile["profiles"][0]["events"]
+    assert [(event["type"], event["frame"]) for event in events] == [
+        ("O", 0),
+        ("O", 1),
+        ("C", 1),
+        ("C", 0),
+    ]
+    assert events == sorted(events, key=lambda event: event["at"])
+    assert profile["profiles"][0]["endValue"] >= events[-1]["at"]
+
+
+def test_the_program_is_not_measured_without_profiler(config: Config) -> None:
+    """
+    Given: No installed profiler
+    When: the hot paths are used
+    Then: they are the original functions, so there is no overhead.
+    """
+    repo = FakeRepository()
+
+    services.add_elements(repo, [Element(type_="task", description="Task")])  # act
+
+    assert not hasattr(services.add_elements, "__wrapped__")
+    assert not hasattr(views.get_element_records, "__wrapped__")
+    assert not hasattr(FakeRepository.commit, "__wrapped__")
@@ -1,12 +1,33 @@
 """Tests the service layer."""
 
+import csv
+import json
+import os
+import sys
+from datetime import datetime
+from pathlib import Path
 from textwrap import dedent
+from threading import Thread
+from types import ModuleType
+from typing import Any, Dict, List, Tuple, cast
 
 import pytest
+from _pytest.monkeypatch import MonkeyPatch
+from repository_orm import Repository, load_repository
 
 from pynbox import services
-from pynbox.config import Config
-from pynbox.exceptions import ParseError
+from pynbox.config import Config, DuplicateMode
+from pynbox.entrypoints import get_repo
+from pynbox.exceptions import ExportError, MigrationError, ParseError
+from pynbox.model import (
+    Decision,
+    Element,
+    ElementCounter,
+    ElementState,
+    ElementType,
+    ExportFormat,
+    ParseReport,
+)
 
 
 def test_parse_processes_one_element(config: Config) -> None:
@@ -121,3 +142,1427 @@ def test_parse_extracts_priority_from_description(config: Config) -> None:
     assert result[0].type_ == "task"
     assert result[0].description == "Task title"
     assert result[0].priority == 5
+
+
+def test_parse_uses_the_first_matching_type(config: Config) -> None:
+    """
+    Given: Two types whose regular expressions match the same line
+    When: it's parsed
+    Then: the element gets the type that is defined first in the configuration.
+    """
+    config.types = [
+        ElementType(name="task", regexp=r"t\."),
+        ElementType(name="tip", regexp=r"t\.?"),
+    ]
+
+    result = services.parse(config, "t. Task title")
+
+    assert result[0].type_ == "task"
+    assert result[0].description == "Task title"
+
+
+def test_parse_supports_types_with_alternations(config: Config) -> None:
+    """
+    Given: A type whose regular expression has an alternation
+    When: it's parsed
+    Then: both alternatives are understood as the type.
+    """
+    config.types = [
+        ElementType(name="task", regexp=r"t\.|task:"),
+        ElementType(name="idea", regexp=r"i\."),
+    ]
+    text = dedent(
+        """\
+        task: Task title
+        i. Idea title
+        """
+    )
+
+    result = services.parse(config, text)
+
+    assert len(result) == 2
+    assert result[0].type_ == "task"
+    assert result[0].description == "Task title"
+    assert result[1].type_ == "idea"
+
+
+def test_type_matcher_is_cached(config: Config) -> None:
+    """
+    Given: A configuration
+    When: the type matcher is requested twice
+    Then: the same matcher is returned.
+    """
+    first = services.type_matcher(config)
+
+    result = services.type_matcher(config)
+
+    assert result is first
+
+
+def test_parse_uses_the_first_matching_type_with_a_longer_prefix(
+    config: Config,
+) -> None:
+    """
+    Given: A type without a literal prefix, and two types whose literal prefixes
+        are one the start of the other, all of them matching the same line
+    When: it's parsed
+    Then: the element gets the type that is defined first in the configuration.
+    """
+    config.types = [
+        ElementType(name="note", regexp=r"\w+:"),
+        ElementType(name="task", regexp=r"t\."),
+        ElementType(name="tip", regexp=r"T\.x"),
+    ]
+    text = dedent(
+        """        T.x Tip title
+        Tip: Note title
+        """
+    )
+
+    result = services.parse(config, text)
+
+    assert [element.type_ for element in result] == ["task", "note"]
+    assert result[0].description == "x Tip title"
+    assert result[1].description == "Note title"
+
+
+@pytest.mark.parametrize(
+    ("regexp", "prefix"),
+    [
+        (r"^T1\.", "t1."),
+        (r"\*\*", "**"),
+        (r"ta?\.", "t"),
+        (r"ab{2}", "a"),
+        (r"ab+", "ab"),
+        (r"\d\.", ""),
+        (r"t\.|task:", ""),
+        (r"(?i)t", ""),
+    ],
+)
+def test_literal_prefix_extracts_only_the_text_every_match_starts_with(
+    regexp: str, prefix: str
+) -> None:
+    """
+    Given: A type regular expression
+    When: its literal prefix is extracted
+    Then: only the characters that every matching line starts with are returned.
+    """
+    result = services._literal_prefix(regexp)  # noqa: W0212
+
+    assert result == prefix
+
+
+def test_parse_lines_yields_elements_lazily(config: Config) -> None:
+    """
+    Given: An iterator of lines with two elements
+    When: the first element is requested
+    Then: it's returned without consuming the lines of the second element body.
+    """
+    lines = iter(["t. Task title", "Task body", "i. Idea title", "Idea body"])
+
+    result = next(services.parse_lines(config, lines))
+
+    assert result.description == "Task title"
+    assert result.body == "Task body"
+    assert next(lines) == "Idea body"
+
+
+def test_parse_file_stores_elements_in_batches(
+    config: Config, repo: Repository, tmp_path: Path
+) -> None:
+    """
+    Given: A file with more elements than the batch size
+    When: the file is parsed
+    Then: all the elements are stored in the repository and the file is emptied.
+    """
+    file_path = tmp_path / "inbox.pynbox"
+    file_path.write_text(
+        "\n".join(f"t. Task {index}\nbody {index}" for index in range(5)) + "\n"
+    )
+
+    services.parse_file(config, repo, str(file_path), batch_size=2)  # act
+
+    elements = repo.all(Element)
+    assert len(elements) == 5
+    assert elements[4].description == "Task 4"
+    assert elements[4].body == "body 4"
+    assert file_path.read_text() == ""
+
+
+def test_parse_file_resumes_from_the_last_committed_batch(
+    config: Config, tmp_path: Path, monkeypatch: MonkeyPatch
+) -> None:
+    """
+    Given: A file whose parsing was interrupted after storing the first batch
+    When: the file is parsed again
+    Then: the parsing is resumed from the first not stored element, so there are
+        no duplicates, the file is emptied and the checkpoint is removed.
+    """
+    database_url = f"tinydb:///{tmp_path / 'database.json'}"
+    file_path = tmp_path / "inbox.pynbox"
+    file_path.write_text("t. Task 0\nbody 0\nt. Task 1\nt. Task 2\nbody 2\n")
+    repo = load_repository(database_url)
+    add_elements = services.add_elements
+    batches: List[List[Element]] = []
+
+    def interrupted_add_elements(repo: Repository, elements: List[Element]) -> None:
+        if len(batches) == 1:
+            raise KeyboardInterrupt()
+        batches.append(elements)
+        add_elements(repo, elements)
+
+    monkeypatch.setattr(services, "add_elements", interrupted_add_elements)
+    with pytest.raises(KeyboardInterrupt):
+        services.parse_file(config, repo, str(file_path), batch_size=2)
+    monkeypatch.undo()
+    repo.close()
+    repo = load_repository(database_url)
+
+    services.parse_file(config, repo, str(file_path), batch_size=2)  # act
+
+    elements = repo.all(Element)
+    assert [element.description for element in elements] == [
+        "Task 0",
+        "Task 1",
+        "Task 2",
+    ]
+    assert elements[2].body == "body 2"
+    assert file_path.read_text() == ""
+    assert not (tmp_path / "inbox.pynbox.checkpoint").exists()
+    repo.close()
+
+
+def test_parse_file_ignores_checkpoints_of_other_files(
+    config: Config, repo: Repository, tmp_path: Path
+) -> None:
+    """
+    Given: A checkpoint that doesn't belong to the file to parse, for example
+        because the file was replaced after the checkpoint was written
+    When: the file is parsed
+    Then: the checkpoint is ignored and all the file is parsed.
+    """
+    file_path = tmp_path / "inbox.pynbox"
+    file_path.write_text("t. Task 0\nt. Task 1\n")
+    (tmp_path / "inbox.pynbox.checkpoint").write_text('{"inode": -1, "offset": 10}')
+
+    services.parse_file(config, repo, str(file_path))  # act
+
+    assert len(repo.all(Element)) == 2
+
+
+def test_parse_file_ignores_checkpoints_of_a_replaced_file_with_the_same_inode(
+    config: Config, repo: Repository, tmp_path: Path
+) -> None:
+    """
+    Given: A checkpoint of a file that was replaced by another one with the same
+        inode, as the file systems reuse them
+    When: the new file is parsed
+    Then: the checkpoint is ignored and all its elements are stored.
+    """
+    file_path = tmp_path / "inbox.pynbox"
+    file_path.write_text("t. old A\nt. old B\n")
+    services._write_checkpoint(str(file_path), 9)  # noqa: W0212
+    file_path.write_text("t. new A\nt. new B\n")
+
+    services.parse_file(config, repo, str(file_path))  # act
+
+    assert [element.description for element in repo.all(Element)] == [
+        "new A",
+        "new B",
+    ]
+
+
+def test_parse_file_keeps_the_lines_of_writers_that_keep_the_file_open(
+    config: Config, repo: Repository, tmp_path: Path
+) -> None:
+    """
+    Given: A capture tool that keeps the inbox file open to append elements
+    When: the file is parsed after each append
+    Then: all the elements are stored, as the file is truncated in place.
+    """
+    file_path = tmp_path / "inbox.pynbox"
+    with open(file_path, "a", encoding="utf-8") as capture:
+        capture.write("t. Task 0\n")
+        capture.flush()
+        services.parse_file(config, repo, str(file_path))
+        capture.write("t. Task 1\n")
+        capture.flush()
+
+        services.parse_file(config, repo, str(file_path))  # act
+
+    assert [element.description for element in repo.all(Element)] == [
+        "Task 0",
+        "Task 1",
+    ]
+    assert file_path.read_text() == ""
+
+
+def test_parse_file_without_truncate_only_reads_the_appended_lines(
+    config: Config, repo: Repository, tmp_path: Path
+) -> None:
+    """
+    Given: A file parsed without truncating it
+    When: lines are appended and it's parsed again
+    Then: only the new elements are stored, except the last one, whose body may
+        not be written yet, and the file keeps all the lines.
+    """
+    file_path = tmp_path / "inbox.pynbox"
+    file_path.write_text("t. Task 0\nt. Task 1\n")
+    services.parse_file(config, repo, str(file_path), truncate=False)
+    with open(file_path, "a", encoding="utf-8") as capture:
+        capture.write("t. Task 2\n")
+
+    result = services.parse_file(config, repo, str(file_path), truncate=False)
+
+    assert result.elements == 1
+    assert [element.description for element in repo.all(Element)] == [
+        "Task 0",
+        "Task 1",
+    ]
+    assert file_path.read_text() == "t. Task 0\nt. Task 1\nt. Task 2\n"
+
+
+@pytest.mark.parametrize("backend", ["fake", "tinydb", "sqlite"])
+def test_add_elements_stores_a_batch_of_new_elements(
+    config: Config, tmp_path: Path, backend: str
+) -> None:
+    """
+    Given: A repository with one element
+    When: a batch of new elements is added
+    Then: the elements get consecutive ids after the existing one and are stored.
+    """
+    config.database_url = f"{backend}:///{tmp_path / 'database.db'}"
+    repo = get_repo(config)
+    repo.add(Element(type_="task", description="Existing task"))
+    repo.commit()
+    elements = [
+        Element(type_="task", description="Task title", body="Task body"),
+        Element(type_="idea", description="Idea title", priority=5),
+    ]
+
+    result = services.add_elements(repo, elements)
+
+    repo.commit()
+    assert [element.id_ for element in result] == [1, 2]
+    stored = repo.all(Element)
+    assert stored[1:] == elements
+    assert stored[1].created == elements[0].created
+    repo.close()
+
+
+def test_add_elements_updates_elements_with_id(
+    config: Config, repo: Repository
+) -> None:
+    """
+    Given: A stored element
+    When: it's changed and added in a batch with a new element
+    Then: the stored element is updated and the new one gets the next id.
+    """
+    element = Element(type_="task", description="Task title")
+    repo.add(element)
+    repo.commit()
+    element.close()
+
+    result = services.add_elements(
+        repo, [element, Element(type_="idea", description="Idea title")]
+    )
+
+    repo.commit()
+    assert result[1].id_ == 1
+    assert repo.get(0, Element).state == ElementState.CLOSED
+    assert repo.get(1, Element).description == "Idea title"
+
+
+def test_add_elements_writes_the_tinydb_elements_with_their_counters(
+    config: Config, tmp_path: Path
+) -> None:
+    """
+    Given: A tinydb repository with stored elements and counters
+    When: a batch of new elements is added and the program is killed before the
+        commit
+    Then: the database file has the new elements and their counters, and each
+        counter is stored once.
+    """
+    config.database_url = f"tinydb:///{tmp_path / 'database.tinydb'}"
+    repo = get_repo(config)
+    services.add_elements(repo, [Element(type_="task", description="Stored task")])
+    repo.commit()
+
+    services.add_elements(
+        repo,
+        [
+            Element(type_="task", description="Task title"),
+            Element(type_="idea", description="Idea title"),
+        ],
+    )
+
+    stored_repo = load_repository(database_url=config.database_url)
+    assert len(stored_repo.all(Element)) == 3
+    assert _counts(stored_repo) == {
+        ("task", ElementState.OPEN): 2,
+        ("idea", ElementState.OPEN): 1,
+    }
+    assert len(stored_repo.all(ElementCounter)) == 2
+    stored_repo.close()
+    repo.close()
+
+
+def _interrupt(path: str) -> None:
+    """Simulate that the program is killed before removing a file."""
+    raise KeyboardInterrupt()
+
+
+def _counts(repo: Repository) -> Dict[Tuple[str, ElementState], int]:
+    """Return the stored element counters."""
+    return {
+        (counter.type_, counter.state): counter.count
+        for counter in repo.all(ElementCounter)
+        if counter.count != 0
+    }
+
+
+def test_add_elements_updates_the_counters(config: Config, repo: Repository) -> None:
+    """
+    Given: An empty repository
+    When: new elements are added
+    Then: the element counters are updated.
+    """
+    elements = [
+        Element(type_="task", description="Task title"),
+        Element(type_="task", description="Task title 2"),
+        Element(type_="idea", description="Idea title"),
+    ]
+
+    services.add_elements(repo, elements)  # act
+
+    repo.commit()
+    assert _counts(repo) == {
+        ("task", ElementState.OPEN): 2,
+        ("idea", ElementState.OPEN): 1,
+    }
+
+
+def test_save_element_updates_the_counters(config: Config, repo: Repository) -> None:
+    """
+    Given: Two stored open tasks
+    When: one is closed and the other changes its type to idea
+    Then: the element counters are updated.
+    """
+    services.add_elements(
+        repo,
+        [
+            Element(type_="task", description="Task title"),
+            Element(type_="task", description="Task title 2"),
+        ],
+    )
+    repo.commit()
+    first, second = repo.all(Element)
+    previous = (first.type_, first.state)
+    first.close()
+    services.save_element(repo, first, previous)
+    repo.commit()
+    second.type_ = "idea"
+
+    services.save_element(repo, second, ("task", ElementState.OPEN))  # act
+
+    repo.commit()
+    assert _counts(repo) == {
+        ("task", ElementState.CLOSED): 1,
+        ("idea", ElementState.OPEN): 1,
+    }
+    assert repo.get(1, Element).type_ == "idea"
+
+
+def test_save_element_stores_counters_that_go_back_to_their_first_value(
+    config: Config, repo: Repository
+) -> None:
+    """
+    Given: A stored open task
+    When: its type is changed to idea and then back to task
+    Then: the counters reflect that there's an open task.
+    """
+    element = services.add_elements(
+        repo, [Element(type_="task", description="Task title")]
+    )[0]
+    repo.commit()
+    repo.all(ElementCounter)
+    element.type_ = "idea"
+    services.save_element(repo, element, ("task", ElementState.OPEN))
+    repo.commit()
+    element.type_ = "task"
+
+    services.save_element(repo, element, ("idea", ElementState.OPEN))  # act
+
+    repo.commit()
+    assert _counts(repo) == {("task", ElementState.OPEN): 1}
+
+
+def test_counters_are_initialized_from_the_stored_elements(
+    config: Config, repo: Repository
+) -> None:
+    """
+    Given: A repository with elements but without counters
+    When: a new element is added
+    Then: the counters take into account the existing elements.
+    """
+    repo.add(Element(type_="task", description="Task title"))
+    repo.add(Element(type_="idea", description="Idea title", state=ElementState.CLOSED))
+    repo.commit()
+
+    services.add_elements(repo, [Element(type_="task", description="Task title")])
+
+    repo.commit()
+    assert _counts(repo) == {
+        ("task", ElementState.OPEN): 2,
+        ("idea", ElementState.CLOSED): 1,
+    }
+
+
+def test_rebuild_counters_fixes_drifted_counters(
+    config: Config, repo: Repository
+) -> None:
+    """
+    Given: A repository whose counters don't match the stored elements
+    When: the counters are rebuilt
+    Then: the counters match the stored elements.
+    """
+    repo.add(Element(type_="task", description="Task title"))
+    repo.add(ElementCounter(id_="idea:open", type_="idea", state=ElementState.OPEN))
+    repo.commit()
+
+    services.rebuild_counters(repo)  # act
+
+    repo.commit()
+    assert _counts(repo) == {("task", ElementState.OPEN): 1}
+
+
+@pytest.mark.parametrize("backend", ["fake", "tinydb", "sqlite"])
+def test_save_element_updates_the_stored_element(
+    config: Config, tmp_path: Path, backend: str
+) -> None:
+    """
+    Given: A stored element
+    When: it's closed and saved
+    Then: the stored element is updated.
+    """
+    config.database_url = f"{backend}:///{tmp_path / 'database.db'}"
+    repo = get_repo(config)
+    element = services.add_elements(
+        repo, [Element(type_="task", description="Task title")]
+    )[0]
+    repo.commit()
+    previous = (element.type_, element.state)
+    element.close()
+
+    services.save_element(repo, element, previous)  # act
+
+    repo.commit()
+    stored = repo.get(element.id_, Element)
+    assert stored.state == ElementState.CLOSED
+    assert stored.closed == element.closed
+    repo.close()
+
+
+def test_get_repo_indexes_the_sqlite_queries(config: Config, tmp_path: Path) -> None:
+    """
+    Given: A sqlite database url
+    When: the repository is initialized
+    Then: the element queries index exists and the write ahead log is enabled.
+    """
+    config.database_url = f"sqlite:///{tmp_path / 'database.db'}"
+
+    repo = get_repo(config)
+
+    indexes = repo.connection.execute(  # type: ignore
+        "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'element'"
+    ).fetchall()
+    assert ("element_state_type_created",) in indexes
+    journal_mode = repo.connection.execute(  # type: ignore
+        "PRAGMA journal_mode"
+    ).fetchone()
+    assert journal_mode == ("wal",)
+    repo.close()
+
+
+def test_migrate_elements_copies_elements_and_counters(
+    config: Config, tmp_path: Path
+) -> None:
+    """
+    Given: A tinydb repository with elements and an empty sqlite one
+    When: the elements are migrated
+    Then: the sqlite repository has the same elements and their counters.
+    """
+    config.database_url = f"tinydb:///{tmp_path / 'database.tinydb'}"
+    source_repo = get_repo(config)
+    elements = services.add_elements(
+        source_repo,
+        [
+            Element(type_="task", description="Task title", body="Task body"),
+            Element(type_="idea", description="Idea title", priority=5),
+        ],
+    )
+    elements[1].close()
+    services.save_element(source_repo, elements[1], ("idea", ElementState.OPEN))
+    source_repo.commit()
+    config.database_url = f"sqlite:///{tmp_path / 'database.db'}"
+    repo = get_repo(config)
+
+    result = services.migrate_elements(source_repo, repo, batch_size=1)
+
+    repo.commit()
+    assert result == 2
+    assert repo.all(Element) == source_repo.all(Element)
+    assert _counts(repo) == {
+        ("task", ElementState.OPEN): 1,
+        ("idea", ElementState.CLOSED): 1,
+    }
+    source_repo.close()
+    repo.close()
+
+
+def test_migrate_elements_refuses_a_repository_with_elements(
+    config: Config, repo: Repository
+) -> None:
+    """
+    Given: A destination repository that already has elements
+    When: the elements are migrated into it
+    Then: an error is raised and nothing is copied.
+    """
+    source_repo = load_repository(database_url="fake://")
+    source_repo.add(Element(type_="idea", description="Idea title"))
+    repo.add(Element(type_="task", description="Task title"))
+    repo.commit()
+
+    with pytest.raises(MigrationError, match="already has elements"):
+        services.migrate_elements(source_repo, repo)
+
+    assert len(repo.all(Element)) == 1
+
+
+def test_record_element_appends_tinydb_changes_to_the_journal(
+    config: Config, tmp_path: Path
+) -> None:
+    """
+    Given: A tinydb repository with an open element
+    When: the element is closed and recorded
+    Then: the database file is untouched until the journal is compacted.
+    """
+    config.database_url = f"tinydb:///{tmp_path / 'database.tinydb'}"
+    repo = get_repo(config)
+    element = services.add_elements(
+        repo, [Element(type_="task", description="Task title")]
+    )[0]
+    repo.commit()
+    database_content = (tmp_path / "database.tinydb").read_text()
+    element.close()
+
+    services.record_element(repo, element, ("task", ElementState.OPEN))
+
+    assert (tmp_path / "database.tinydb").read_text() == database_content
+    assert (tmp_path / "database.tinydb.journal").exists()
+    assert services.compact_journal(repo) == 1
+    assert not (tmp_path / "database.tinydb.journal").exists()
+    assert repo.get(element.id_, Element).state == ElementState.CLOSED
+    assert _counts(repo) == {("task", ElementState.CLOSED): 1}
+    repo.close()
+
+
+def test_compact_journal_merges_the_changes_of_an_element(
+    config: Config, tmp_path: Path
+) -> None:
+    """
+    Given: A journal with two changes of the same element and a half written record
+    When: the journal is compacted
+    Then: the last change is stored, the counters are right and the corrupt record
+        is ignored.
+    """
+    config.database_url = f"tinydb:///{tmp_path / 'database.tinydb'}"
+    repo = get_repo(config)
+    element = services.add_elements(
+        repo, [Element(type_="task", description="Task title")]
+    )[0]
+    repo.commit()
+    element.type_ = "idea"
+    services.record_element(repo, element, ("task", ElementState.OPEN))
+    element.close()
+    services.record_element(repo, element, ("idea", ElementState.OPEN))
+    with open(tmp_path / "database.tinydb.journal", "a", encoding="utf-8") as journal:
+        journal.write('{"previous": ["idea", ')
+
+    result = services.compact_journal(repo)
+
+    assert result == 1
+    stored = repo.get(element.id_, Element)
+    assert stored.type_ == "idea"
+    assert stored.state == ElementState.CLOSED
+    assert _counts(repo) == {("idea", ElementState.CLOSED): 1}
+    repo.close()
+
+
+def test_compact_journal_quarantines_the_invalid_records(
+    config: Config, tmp_path: Path
+) -> None:
+    """
+    Given: A journal with a valid change and a record of an element without type
+    When: the repository is initialized again
+    Then: the valid change is stored and the invalid record is moved to the
+        rejected journal.
+    """
+    config.database_url = f"tinydb:///{tmp_path / 'database.tinydb'}"
+    repo = get_repo(config)
+    element = services.add_elements(
+        repo, [Element(type_="task", description="Task title")]
+    )[0]
+    repo.commit()
+    element.close()
+    services.record_element(repo, element, ("task", ElementState.OPEN))
+    invalid = {
+        "previous": ["task", "open"],
+        "element": {"id_": element.id_, "type_": None, "description": "Task"},
+    }
+    with open(tmp_path / "database.tinydb.journal", "a", encoding="utf-8") as journal:
+        journal.write(json.dumps(invalid) + "\n")
+    repo.close()
+
+    repo = get_repo(config)
+
+    assert repo.get(element.id_, Element).state == ElementState.CLOSED
+    assert list(tmp_path.glob("*.compacting")) == []
+    rejected = (tmp_path / "database.tinydb.journal.rejected").read_text()
+    assert json.loads(rejected) == invalid
+    repo.close()
+
+
+def test_compact_journal_merges_an_interrupted_compaction(
+    config: Config, tmp_path: Path
+) -> None:
+    """
+    Given: The journal left by an interrupted compaction and a newer journal
+    When: the journal is compacted
+    Then: the changes of both are stored in order.
+    """
+    config.database_url = f"tinydb:///{tmp_path / 'database.tinydb'}"
+    repo = get_repo(config)
+    first, second = services.add_elements(
+        repo,
+        [
+            Element(type_="task", description="First task"),
+            Element(type_="task", description="Second task"),
+        ],
+    )
+    repo.commit()
+    first.close()
+    services.record_element(repo, first, ("task", ElementState.OPEN))
+    journal_path = tmp_path / "database.tinydb.journal"
+    journal_path.rename(tmp_path / "database.tinydb.journal.interrupted.compacting")
+    second.close()
+    services.record_element(repo, second, ("task", ElementState.OPEN))
+    first.state = ElementState.DELETED
+    services.record_element(repo, first, ("task", ElementState.CLOSED))
+
+    result = services.compact_journal(repo)
+
+    assert result == 2
+    assert repo.get(first.id_, Element).state == ElementState.DELETED
+    assert repo.get(second.id_, Element).state == ElementState.CLOSED
+    assert _counts(repo) == {
+        ("task", ElementState.CLOSED): 1,
+        ("task", ElementState.DELETED): 1,
+    }
+    assert not journal_path.exists()
+    assert list(tmp_path.glob("*.compacting")) == []
+    repo.close()
+
+
+def test_compact_journal_doesnt_apply_a_committed_compaction_twice(
+    config: Config, tmp_path: Path, monkeypatch: MonkeyPatch
+) -> None:
+    """
+    Given: A compaction interrupted after committing its changes, before removing
+        its journal
+    When: the journal is compacted again
+    Then: the changes are not applied again, so the counters are right, and the
+        journal left behind is removed.
+    """
+    config.database_url = f"tinydb:///{tmp_path / 'database.tinydb'}"
+    repo = get_repo(config)
+    element = services.add_elements(
+        repo, [Element(type_="task", description="Task title")]
+    )[0]
+    repo.commit()
+    element.close()
+    services.record_element(repo, element, ("task", ElementState.OPEN))
+    with monkeypatch.context() as patch:
+        patch.setattr(os, "remove", _interrupt)
+        with pytest.raises(KeyboardInterrupt):
+            services.compact_journal(repo)
+
+    result = services.compact_journal(repo)
+
+    assert result == 0
+    assert _counts(repo) == {("task", ElementState.CLOSED): 1}
+    assert list(tmp_path.glob("*.compacting")) == []
+    repo.close()
+
+
+def test_compact_journal_waits_for_other_compactions(
+    config: Config, tmp_path: Path
+) -> None:
+    """
+    Given: A journal locked by a compaction of another process
+    When: the journal is compacted
+    Then: it waits until the lock is released before applying the changes.
+    """
+    config.database_url = f"tinydb:///{tmp_path / 'database.tinydb'}"
+    repo = get_repo(config)
+    element = services.add_elements(
+        repo, [Element(type_="task", description="Task title")]
+    )[0]
+    repo.commit()
+    element.close()
+    services.record_element(repo, element, ("task", ElementState.OPEN))
+    journal_path = str(tmp_path / "database.tinydb.journal")
+    results: List[int] = []
+    with services._journal_lock(journal_path, exclusive=True):  # noqa: W0212
+        thread = Thread(target=lambda: results.append(services.compact_journal(repo)))
+        thread.start()  # act
+        thread.join(timeout=0.2)
+        waited = len(results) == 0
+
+    thread.join()
+    assert waited
+    assert results == [1]
+    assert _counts(repo) == {("task", ElementState.CLOSED): 1}
+    repo.close()
+
+
+def test_get_repo_compacts_the_journal_left_behind(
+    config: Config, tmp_path: Path
+) -> None:
+    """
+    Given: A tinydb repository closed with changes in the journal
+    When: the repository is initialized again
+    Then: the changes of the journal are stored.
+    """
+    config.database_url = f"tinydb:///{tmp_path / 'database.tinydb'}"
+    repo = get_repo(config)
+    element = services.add_elements(
+        repo, [Element(type_="task", description="Task title")]
+    )[0]
+    repo.commit()
+    element.close()
+    services.record_element(repo, element, ("task", ElementState.OPEN))
+    repo.close()
+
+    repo = get_repo(config)
+
+    assert repo.get(element.id_, Element).state == ElementState.CLOSED
+    assert not (tmp_path / "database.tinydb.journal").exists()
+    repo.close()
+
+
+def test_record_element_commits_the_changes_of_other_backends(
+    config: Config, tmp_path: Path
+) -> None:
+    """
+    Given: A sqlite repository with an open element
+    When: the element is closed and recorded
+    Then: the change is committed without a journal.
+    """
+    config.database_url = f"sqlite:///{tmp_path / 'database.db'}"
+    repo = get_repo(config)
+    element = services.add_elements(
+        repo, [Element(type_="task", description="Task title")]
+    )[0]
+    repo.commit()
+    element.close()
+
+    services.record_element(repo, element, ("task", ElementState.OPEN))
+
+    repo.close()
+    repo = get_repo(config)
+    assert repo.get(element.id_, Element).state == ElementState.CLOSED
+    assert services.compact_journal(repo) == 0
+    repo.close()
+
+
+def test_write_behind_queue_stores_the_changes_in_the_background(
+    config: Config, tmp_path: Path
+) -> None:
+    """
+    Given: A sqlite repository with two open elements
+    When: their changes are queued and the queue is flushed
+    Then: the changes are stored and there are no errors.
+    """
+    config.database_url = f"sqlite:///{tmp_path / 'database.db'}"
+    repo = get_repo(config)
+    elements = services.add_elements(
+        repo,
+        [
+            Element(type_="task", description="Task title"),
+            Element(type_="idea", description="Idea title"),
+        ],
+    )
+    repo.commit()
+    writer = services.WriteBehindQueue(lambda: get_repo(config))
+    elements[0].close()
+    writer.put(elements[0], ("task", ElementState.OPEN))
+    elements[1].skip()
+    writer.put(elements[1], ("idea", ElementState.OPEN))
+
+    result = writer.flush()
+
+    assert result == []
+    assert repo.get(0, Element).state == ElementState.CLOSED
+    assert repo.get(1, Element).skips == 1
+    assert _counts(repo) == {
+        ("task", ElementState.CLOSED): 1,
+        ("idea", ElementState.OPEN): 1,
+    }
+    repo.close()
+
+
+def test_write_behind_queue_returns_the_storage_errors(
+    config: Config, monkeypatch: MonkeyPatch
+) -> None:
+    """
+    Given: A write behind queue whose changes can't be stored
+    When: a change is queued and the queue is flushed
+    Then: the storage error is returned.
+    """
+
+    def broken_record_element(*args: Any) -> None:
+        raise OSError("Disk full")
+
+    monkeypatch.setattr(services, "record_element", broken_record_element)
+    writer = services.WriteBehindQueue(lambda: load_repository(database_url="fake://"))
+    writer.put(
+        Element(id_=0, type_="task", description="Task title"),
+        ("task", ElementState.OPEN),
+    )
+
+    result = writer.flush()
+
+    assert len(result) == 1
+    assert str(result[0]) == "Disk full"
+
+
+def test_write_behind_queue_records_the_decisions(
+    config: Config, repo: Repository, tmp_path: Path
+) -> None:
+    """
+    Given: A write behind queue with a metrics file
+    When: a change is queued with its decision and the queue is flushed
+    Then: the decision is appended to the metrics file with its storage time.
+    """
+    metrics_path = tmp_path / "metrics" / "metrics.jsonl"
+    writer = services.WriteBehindQueue(
+        lambda: load_repository(database_url="fake://"), str(metrics_path)
+    )
+    decision = Decision(
+        id_=0,
+        type_="task",
+        action="done",
+        think_time=2.5,
+        session=datetime(2021, 1, 1),
+    )
+    writer.put(
+        Element(id_=0, type_="task", description="Task title"),
+        ("task", ElementState.OPEN),
+        decision,
+    )
+
+    result = writer.flush()
+
+    assert result == []
+    recorded = [
+        Decision.parse_raw(line) for line in metrics_path.read_text().splitlines()
+    ]
+    assert len(recorded) == 1
+    assert recorded[0].action == "done"
+    assert recorded[0].think_time == 2.5
+    assert recorded[0].storage_time > 0
+
+
+def test_record_decisions_does_nothing_without_metrics_path() -> None:
+    """
+    Given: A decision
+    When: it's recorded without a metrics path
+    Then: nothing fails, so the metrics can be disabled in the configuration.
+    """
+    decision = Decision(
+        id_=0, type_="task", action="skip", think_time=1, session=datetime.now()
+    )
+
+    services.record_decisions(None, [decision])  # act
+
+
+@pytest.mark.parametrize("backend", ["fake", "tinydb", "sqlite"])
+def test_archive_elements_moves_old_closed_elements_to_the_archive(
+    config: Config, tmp_path: Path, backend: str
+) -> None:
+    """
+    Given: An open element, a recently closed one, and old closed and deleted ones
+    When: the elements older than 30 days are archived
+    Then: the old closed and deleted elements are moved to the archive, and the
+        counters only count the elements left in the repository.
+    """
+    config.database_url = f"{backend}:///{tmp_path / 'database.db'}"
+    repo = get_repo(config)
+    elements = services.add_elements(
+        repo,
+        [
+            Element(type_="task", description="Open task"),
+            Element(type_="task", description="Recent task"),
+            Element(type_="task", description="Old task"),
+            Element(type_="idea", description="Old idea"),
+        ],
+    )
+    repo.commit()
+    elements[1].close()
+    elements[2].close()
+    elements[2].closed = datetime(2020, 1, 1)
+    elements[3].delete()
+    elements[3].closed = datetime(2020, 1, 1)
+    services.save_elements(
+        repo,
+        [(element, ("task", ElementState.OPEN)) for element in elements[1:3]]
+        + [(elements[3], ("idea", ElementState.OPEN))],
+    )
+    repo.commit()
+    archive_path = str(tmp_path / "archive")
+
+    result = services.archive_elements(repo, archive_path, 30)
+
+    repo.commit()
+    assert result == 2
+    assert [element.description for element in repo.all(Element)] == [
+        "Open task",
+        "Recent task",
+    ]
+    assert list(services.archived_elements(archive_path)) == elements[2:]
+    assert _counts(repo) == {
+        ("task", ElementState.OPEN): 1,
+        ("task", ElementState.CLOSED): 1,
+    }
+    repo.close()
+
+
+@pytest.mark.parametrize("backend", ["fake", "tinydb", "sqlite"])
+def test_archive_elements_doesnt_reuse_the_archived_ids(
+    config: Config, tmp_path: Path, backend: str
+) -> None:
+    """
+    Given: A repository whose newest elements were archived
+    When: a new element is added
+    Then: it gets an id that wasn't given to any archived element.
+    """
+    config.database_url = f"{backend}:///{tmp_path / 'database.db'}"
+    repo = get_repo(config)
+    elements = services.add_elements(
+        repo,
+        [
+            Element(type_="task", description="Open task"),
+            Element(type_="task", description="Old task"),
+        ],
+    )
+    repo.commit()
+    elements[1].close()
+    elements[1].closed = datetime(2020, 1, 1)
+    services.save_element(repo, elements[1], ("task", ElementState.OPEN))
+    repo.commit()
+    services.archive_elements(repo, str(tmp_path / "archive"), 30)
+    repo.commit()
+
+    result = services.add_elements(repo, [Element(type_="task", description="New")])
+
+    repo.commit()
+    assert result[0].id_ == 2
+    repo.close()
+
+
+def test_archive_elements_does_nothing_if_there_are_no_old_elements(
+    config: Config, repo: Repository, tmp_path: Path
+) -> None:
+    """
+    Given: A repository with a recently closed element
+    When: the elements older than 30 days are archived
+    Then: no archive segment is written.
+    """
+    element = Element(type_="task", description="Task title")
+    element.close()
+    repo.add(element)
+    repo.commit()
+
+    result = services.archive_elements(repo, str(tmp_path / "archive"), 30)
+
+    assert result == 0
+    assert not (tmp_path / "archive").exists()
+
+
+@pytest.mark.parametrize("backend", ["fake", "tinydb", "sqlite"])
+def test_parse_file_drops_the_duplicated_elements(
+    config: Config, tmp_path: Path, backend: str
+) -> None:
+    """
+    Given: An open and a closed element, and a file that repeats them, with a
+        different case and spacing, and repeats a new element
+    When: the file is parsed
+    Then: the copies of the open element and of the new element are dropped and
+        counted, and the copy of the closed element is stored.
+    """
+    config.database_url = f"{backend}:///{tmp_path / 'database.db'}"
+    repo = get_repo(config)
+    elements = services.add_elements(
+        repo,
+        [
+            Element(type_="task", description="Open task", body="Task body"),
+            Element(type_="task", description="Closed task"),
+        ],
+    )
+    repo.commit()
+    elements[1].close()
+    services.save_element(repo, elements[1], ("task", ElementState.OPEN))
+    repo.commit()
+    file_path = tmp_path / "inbox.pynbox"
+    file_path.write_text(
+        dedent(
+            """\
+            t. open  TASK
+            task body
+            t. Closed task
+            i. Open task
+            task body
+            t. New task
+            t. New task
+            """
+        )
+    )
+
+    result = services.parse_file(config, repo, str(file_path))
+
+    assert result.duplicates == 2
+    assert [
+        (element.type_, element.description) for element in repo.all(Element)[2:]
+    ] == [("task", "Closed task"), ("idea", "Open task"), ("task", "New task")]
+    repo.close()
+
+
+@pytest.mark.parametrize("mode", [DuplicateMode.EXACT, DuplicateMode.NEAR])
+def test_parse_file_uses_the_stored_content_index(
+    config: Config, tmp_path: Path, monkeypatch: MonkeyPatch, mode: DuplicateMode
+) -> None:
+    """
+    Given: A sqlite repository with an open element, another one whose type was
+        changed and a closed one, whose contents have been indexed by a parse
+    When: a file that repeats them is parsed
+    Then: the duplicates of the open elements with their current type are dropped
+        without reading the open elements.
+    """
+    config.database_url = f"sqlite:///{tmp_path / 'database.db'}"
+    config.duplicates = mode
+    repo = get_repo(config)
+    file_path = tmp_path / "inbox.pynbox"
+    file_path.write_text("t. Open task\nt. Changed task\nt. Closed task\n")
+    services.parse_file(config, repo, str(file_path))
+    _, changed, closed = repo.all(Element)
+    changed.type_ = "idea"
+    closed.close()
+    services.save_elements(
+        repo,
+        [(changed, ("task", ElementState.OPEN)), (closed, ("task", ElementState.OPEN))],
+    )
+    repo.commit()
+    monkeypatch.setattr(services, "_open_element_contents", None)
+    file_path.write_text(
+        "t. open task\nt. Changed task\ni. Changed task\nt. Closed task\n"
+    )
+
+    result = services.parse_file(config, repo, str(file_path))
+
+    assert result.duplicates == 2
+    assert [
+        (element.type_, element.description) for element in repo.all(Element)[3:]
+    ] == [("task", "Changed task"), ("task", "Closed task")]
+    repo.close()
+
+
+def test_rebuild_counters_rebuilds_the_content_index(
+    config: Config, tmp_path: Path
+) -> None:
+    """
+    Given: A sqlite repository with an open element added by another program
+    When: the counters are rebuilt and a file that repeats it is parsed
+    Then: the element is indexed, so the copy is dropped.
+    """
+    config.database_url = f"sqlite:///{tmp_path / 'database.db'}"
+    repo = get_repo(config)
+    services.add_elements(repo, [Element(type_="task", description="Task title")])
+    repo.add(Element(id_=1, type_="task", description="Other program task"))
+    repo.commit()
+    file_path = tmp_path / "inbox.pynbox"
+    file_path.write_text("t. Other program task\n")
+    services.rebuild_counters(repo)
+
+    result = services.parse_file(config, repo, str(file_path))
+
+    assert result.duplicates == 1
+    repo.close()
+
+
+def test_parse_file_keeps_the_duplicates_if_disabled(
+    config: Config, repo: Repository, tmp_path: Path
+) -> None:
+    """
+    Given: A file with a repeated element and the duplicate detection disabled
+    When: the file is parsed
+    Then: both elements are stored.
+    """
+    config.duplicates = DuplicateMode.OFF
+    file_path = tmp_path / "inbox.pynbox"
+    file_path.write_text("t. Task title\nt. Task title\n")
+
+    result = services.parse_file(config, repo, str(file_path))
+
+    assert result.elements == 2
+    assert result.duplicates == 0
+    assert len(repo.all(Element)) == 2
+
+
+def test_parse_file_drops_the_near_duplicates(
+    config: Config, repo: Repository, tmp_path: Path
+) -> None:
+    """
+    Given: An open element, and a file with an almost equal one and a different one
+    When: the file is parsed in near duplicates mode
+    Then: only the different element is stored.
+    """
+    config.duplicates = DuplicateMode.NEAR
+    description = (
+        "Read the article about the performance of the search engines in the blog "
+        "of the company, and write a summary of the main ideas for the team meeting"
+    )
+    repo.add(Element(type_="task", description=description))
+    repo.commit()
+    file_path = tmp_path / "inbox.pynbox"
+    file_path.write_text(
+        f"t. {description}.\nt. Call the plumber to fix the kitchen sink\n"
+    )
+
+    result = services.parse_file(config, repo, str(file_path))
+
+    assert result.duplicates == 1
+    assert (
+        repo.all(Element)[1].description == "Call the plumber to fix the kitchen sink"
+    )
+
+
+def test_expand_paths_returns_the_files_to_parse(tmp_path: Path) -> None:
+    """
+    Given: A directory with files, a hidden file, a checkpoint and an empty file,
+        and other files that match a glob
+    When: the paths are expanded
+    Then: the non empty files of the directory and the glob are returned once.
+    """
+    inbox = tmp_path / "inbox"
+    inbox.mkdir()
+    for name in ["phone.pynbox", "laptop.pynbox", ".hidden", "phone.pynbox.checkpoint"]:
+        (inbox / name).write_text("t. Task title\n")
+    (inbox / "empty.pynbox").write_text("")
+    (tmp_path / "tablet.pynbox").write_text("t. Task title\n")
+
+    result = services.expand_paths(
+        [str(inbox), str(tmp_path / "*.pynbox"), str(inbox / "laptop.pynbox")]
+    )
+
+    assert result == [
+        str(inbox / "laptop.pynbox"),
+        str(inbox / "phone.pynbox"),
+        str(tmp_path / "tablet.pynbox"),
+    ]
+
+
+def test_expand_paths_expands_the_user_home(
+    tmp_path: Path, monkeypatch: MonkeyPatch
+) -> None:
+    """
+    Given: A directory and a file in the user home
+    When: the paths are expanded using ~
+    Then: their files are returned.
+    """
+    monkeypatch.setenv("HOME", str(tmp_path))
+    (tmp_path / "inbox").mkdir()
+    (tmp_path / "inbox" / "phone.pynbox").write_text("t. Task title\n")
+    (tmp_path / "laptop.pynbox").write_text("t. Task title\n")
+
+    result = services.expand_paths(["~/inbox", "~/*.pynbox"])
+
+    assert result == [
+        str(tmp_path / "inbox" / "phone.pynbox"),
+        str(tmp_path / "laptop.pynbox"),
+    ]
+
+
+def test_parse_paths_returns_an_empty_report_without_files(
+    config: Config, repo: Repository
+) -> None:
+    """
+    Given: No files to parse, for example because all of them are empty
+    When: the paths are parsed
+    Then: An empty report is returned.
+    """
+    result = services.parse_paths(config, repo, [])
+
+    assert result == ParseReport()
+
+
+@pytest.mark.parametrize("backend", ["fake", "tinydb", "sqlite"])
+def test_parse_files_stores_the_elements_of_all_the_files(
+    config: Config, tmp_path: Path, backend: str
+) -> None:
+    """
+    Given: Three files with elements, one of them partially parsed before
+    When: they are parsed
+    Then: the elements not yet stored are added in the order of the files, and the
+        files are emptied.
+    """
+    config.database_url = f"{backend}:///{tmp_path / 'database.db'}"
+    repo = get_repo(config)
+    file_paths = [tmp_path / f"inbox-{index}.pynbox" for index in range(3)]
+    for index, file_path in enumerate(file_paths):
+        file_path.write_text(f"t. Task {index}\nbody {index}\ni. Idea {index}\n")
+    services._write_checkpoint(  # noqa: W0212
+        str(file_paths[1]), len("t. Task 1\nbody 1\n")
+    )
+
+    result = services.parse_files(
+        config, repo, [str(file_path) for file_path in file_paths], max_workers=2
+    )
+
+    assert result.elements == 5
+    assert [element.description for element in repo.all(Element)] == [
+        "Task 0",
+        "Idea 0",
+        "Idea 1",
+        "Task 2",
+        "Idea 2",
+    ]
+    assert all(file_path.read_text() == "" for file_path in file_paths)
+    assert not (tmp_path / "inbox-1.pynbox.checkpoint").exists()
+    repo.close()
+
+
+def test_parse_files_doesnt_store_anything_if_a_file_fails(
+    config: Config, repo: Repository, tmp_path: Path
+) -> None:
+    """
+    Given: Two files, one of them with invalid markup
+    When: they are parsed
+    Then: the error is raised, no element is stored and the files are untouched.
+    """
+    valid_file = tmp_path / "valid.pynbox"
+    valid_file.write_text("t. Task title\n")
+    invalid_file = tmp_path / "invalid.pynbox"
+    invalid_file.write_text("invalid markup\n")
+
+    with pytest.raises(ParseError):
+        services.parse_files(config, repo, [str(valid_file), str(invalid_file)])
+
+    assert repo.all(Element) == []
+    assert valid_file.read_text() == "t. Task title\n"
+
+
+@pytest.mark.parametrize("backend", ["fake", "tinydb", "sqlite"])
+def test_export_elements_writes_a_csv_file_in_chunks(
+    config: Config, tmp_path: Path, backend: str
+) -> None:
+    """
+    Given: A repository with more elements than the chunk size
+    When: the elements are exported to csv
+    Then: A file with a header and a row per element ordered by id is written.
+    """
+    config.database_url = f"{backend}:///{tmp_path / 'database.db'}"
+    repo = get_repo(config)
+    elements = [
+        Element(
+            type_="task",
+            description=f"Task {index}",
+            created=datetime(2021, 1, 1 + index),
+        )
+        for index in range(5)
+    ]
+    elements[1].close()
+    services.add_elements(repo, elements)
+    repo.commit()
+    file_path = tmp_path / "elements.csv"
+
+    result = services.export_elements(repo, str(file_path), chunk_size=2)
+
+    assert result == 5
+    with open(file_path, newline="", encoding="utf-8") as file_descriptor:
+        rows = list(csv.DictReader(file_descriptor))
+    assert [row["id"] for row in rows] == ["0", "1", "2", "3", "4"]
+    assert rows[0]["description"] == "Task 0"
+    assert rows[0]["created"] == "2021-01-01T00:00:00"
+    assert rows[1]["state"] == "closed"
+    assert not (tmp_path / "elements.csv.tmp").exists()
+    repo.close()
+
+
+@pytest.mark.parametrize("format_", [ExportFormat.PARQUET, ExportFormat.ARROW])
+def test_export_elements_writes_columnar_files(
+    config: Config, repo: Repository, tmp_path: Path, format_: ExportFormat
+) -> None:
+    """
+    Given: A repository with elements
+    When: the elements are exported to a columnar format
+    Then: The file has the elements with the dates as timestamps.
+    """
+    pytest.importorskip("pyarrow")
+    # C0415: pyarrow is an optional dependency.
+    import pyarrow.ipc  # noqa: C0415
+    import pyarrow.parquet  # noqa: C0415
+
+    services.add_elements(
+        repo,
+        [
+            Element(
+                type_="task",
+                description=f"Task {index}",
+                created=datetime(2021, 1, 1 + index),
+            )
+            for index in range(3)
+        ],
+    )
+    repo.commit()
+    file_path = str(tmp_path / f"elements.{format_.value}")
+
+    result = services.export_elements(repo, file_path, format_, chunk_size=2)
+
+    assert result == 3
+    if format_ == ExportFormat.PARQUET:
+        table = pyarrow.parquet.read_table(file_path)
+    else:
+        table = pyarrow.ipc.open_file(file_path).read_all()
+    assert table.column("description").to_pylist() == ["Task 0", "Task 1", "Task 2"]
+    assert table.column("created").to_pylist()[2] == datetime(2021, 1, 3)
+
+
+def test_export_elements_needs_pyarrow_for_columnar_files(
+    repo: Repository, tmp_path: Path, monkeypatch: MonkeyPatch
+) -> None:
+    """
+    Given: A repository with elements and pyarrow not installed
+    When: the elements are exported to parquet
+    Then: An ExportError is raised and no file is written.
+    """
+    # A None module makes its import raise an ImportError.
+    monkeypatch.setitem(sys.modules, "pyarrow", cast(ModuleType, None))
+    services.add_elements(repo, [Element(type_="task", description="Task")])
+    repo.commit()
+    file_path = tmp_path / "elements.parquet"
+
+    with pytest.raises(ExportError, match="needs pyarrow"):
+        services.export_elements(repo, str(file_path), ExportFormat.PARQUET)
+
+    assert not file_path.exists()
@@ -1,12 +1,23 @@
 """Tests the views layer."""
 
-from datetime import datetime
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Optional
 
+import pytest
 from repository_orm import Repository
 
-from pynbox import views
+from pynbox import services, views
 from pynbox.config import Config
-from pynbox.model import Element
+from pynbox.entrypoints import get_repo
+from pynbox.model import (
+    Decision,
+    Element,
+    ElementCounter,
+    ElementOrder,
+    ElementRecord,
+    ElementState,
+)
 
 
 def test_elements_returns_ordered_items(config: Config, repo: Repository) -> None:
@@ -42,7 +53,7 @@ def test_elements_returns_ordered_items(config: Config, repo: Repository) -> Non
         repo.add(element)
     repo.commit()
 
-    result = views.get_elements(repo, config)
+    result = list(views.get_elements(repo, config))
 
     assert result[0] == elements[2]
     assert result[1] == elements[3]
@@ -85,9 +96,561 @@ def test_elements_returns_ordered_items_when_newest(
         repo.add(element)
     repo.commit()
 
-    result = views.get_elements(repo, config, newest=True)
+    result = list(views.get_elements(repo, config, newest=True))
 
     assert result[0] == elements[3]
     assert result[1] == elements[2]
     assert result[2] == elements[1]
     assert result[3] == elements[0]
+
+
+def test_elements_returns_only_open_elements_of_the_selected_type(
+    config: Config, repo: Repository
+) -> None:
+    """
+    Given: Open and closed elements of different types, one of them not configured
+    When: elements is called for one type
+    Then: Only the open elements of that type are returned.
+    """
+    elements = [
+        Element(description="Open task", type_="task"),
+        Element(description="Closed task", type_="task", state=ElementState.CLOSED),
+        Element(description="Open idea", type_="idea"),
+        Element(description="Open tasks", type_="tasks"),
+    ]
+    for element in elements:
+        repo.add(element)
+    repo.commit()
+
+    result = list(views.get_elements(repo, config, "task"))
+
+    assert result == [elements[0]]
+
+
+@pytest.mark.parametrize("backend", ["fake", "tinydb", "sqlite"])
+def test_status_returns_the_open_elements_per_type(
+    config: Config, tmp_path: Path, backend: str
+) -> None:
+    """
+    Given: Open, closed and deleted elements of different types
+    When: status is called
+    Then: The number of open elements of each configured type with open elements
+        is returned in the order of the configuration.
+    """
+    config.database_url = f"{backend}:///{tmp_path / 'database.db'}"
+    repo = get_repo(config)
+    services.add_elements(
+        repo,
+        [
+            Element(description="Open idea", type_="idea"),
+            Element(description="Open task", type_="task"),
+            Element(description="Open task", type_="task"),
+            Element(description="Closed task", type_="task", state=ElementState.CLOSED),
+            Element(
+                description="Deleted idea", type_="idea", state=ElementState.DELETED
+            ),
+            Element(description="Unknown type", type_="unknown"),
+        ],
+    )
+    repo.commit()
+
+    result = views.status(repo, config)
+
+    assert list(result.items()) == [("task", 2), ("idea", 1)]
+    repo.close()
+
+
+def test_status_ignores_types_without_open_elements(
+    config: Config, repo: Repository
+) -> None:
+    """
+    Given: An empty repository
+    When: status is called
+    Then: An empty dictionary is returned.
+    """
+    result = views.status(repo, config)
+
+    assert result == {}
+
+
+def test_status_reads_the_element_counters(config: Config, repo: Repository) -> None:
+    """
+    Given: A repository with element counters
+    When: status is called
+    Then: The number of open elements is taken from the counters.
+    """
+    repo.add(
+        ElementCounter(id_="idea:open", type_="idea", state=ElementState.OPEN, count=7)
+    )
+    repo.add(
+        ElementCounter(
+            id_="idea:closed", type_="idea", state=ElementState.CLOSED, count=3
+        )
+    )
+    repo.commit()
+
+    result = views.status(repo, config)
+
+    assert result == {"idea": 7}
+
+
+@pytest.mark.parametrize("backend", ["fake", "tinydb", "sqlite"])
+@pytest.mark.parametrize("newest", [False, True])
+def test_elements_are_built_lazily_in_pages(
+    config: Config, tmp_path: Path, backend: str, newest: bool
+) -> None:
+    """
+    Given: More open elements than the page size in a repository
+    When: elements is called
+    Then: An iterator is returned that yields all the elements in order.
+    """
+    config.database_url = f"{backend}:///{tmp_path / 'database.db'}"
+    repo = get_repo(config)
+    elements = [
+        Element(
+            description=f"Task {index}",
+            type_="task",
+            created=datetime(2020, 1, 1 + index),
+        )
+        for index in range(5)
+    ] + [Element(description="Idea", type_="idea", created=datetime(2020, 2, 1))]
+    services.add_elements(repo, elements)
+    repo.commit()
+
+    result = views.get_elements(repo, config, newest=newest, page_size=2)
+
+    assert not isinstance(result, list)
+    expected_tasks = elements[4::-1] if newest else elements[:5]
+    assert list(result) == expected_tasks + [elements[5]]
+    repo.close()
+
+
+@pytest.mark.parametrize("backend", ["fake", "tinydb", "sqlite"])
+@pytest.mark.parametrize("order", list(ElementOrder))
+def test_element_records_are_the_elements_to_process(
+    config: Config, tmp_path: Path, backend: str, order: ElementOrder
+) -> None:
+    """
+    Given: Open and closed elements in a repository
+    When: get_element_records is called
+    Then: The records of the open elements are returned in the same order as
+        get_elements, and they build the same elements.
+    """
+    config.database_url = f"{backend}:///{tmp_path / 'database.db'}"
+    repo = get_repo(config)
+    services.add_elements(
+        repo,
+        [
+            Element(
+                description=f"Task {index}",
+                body="Task body" if index % 2 else None,
+                type_="task",
+                priority=index % 3,
+                created=datetime(2020, 1, 1 + index),
+            )
+            for index in range(5)
+        ]
+        + [
+            Element(description="Idea", type_="idea", created=datetime(2020, 2, 1)),
+            Element(description="Closed", type_="idea", state=ElementState.CLOSED),
+        ],
+    )
+    repo.commit()
+    elements = list(views.get_elements(repo, config, order=order))
+
+    result = list(views.get_element_records(repo, config, order=order))
+
+    assert all(isinstance(record, ElementRecord) for record in result)
+    assert [record.to_element() for record in result] == elements
+    assert [record.id_ for record in result] == [element.id_ for element in elements]
+    repo.close()
+
+
+@pytest.mark.parametrize("order", list(ElementOrder))
+@pytest.mark.parametrize("type_", [None, "task", "unknown"])
+def test_sqlite_orders_the_elements_as_the_rest_of_repositories(
+    config: Config, tmp_path: Path, order: ElementOrder, type_: Optional[str]
+) -> None:
+    """
+    Given: The same open elements in a sqlite repository and in memory
+    When: the records are fetched in pages smaller than the number of elements
+    Then: The sqlite query returns them in the same order as the in memory one.
+    """
+    now = datetime.now()
+    elements = [
+        Element(
+            description=f"Element {index}",
+            type_=["task", "idea", "unknown"][index % 3],
+            priority=index % 4,
+            skips=index % 2,
+            created=now - timedelta(hours=index * 7 % 50),
+        )
+        for index in range(30)
+    ]
+    repos = []
+    for backend in ["fake", "sqlite"]:
+        config.database_url = f"{backend}:///{tmp_path / 'database.db'}"
+        repo = get_repo(config)
+        services.add_elements(repo, [element.copy() for element in elements])
+        repo.commit()
+        repos.append(repo)
+
+    result = [
+        [
+            row["id_"]
+            for row in views._ordered_rows(  # noqa: W0212
+                repo, config, type_, order, page_size=4
+            )
+        ]
+        for repo in repos
+    ]
+
+    assert len(result[1]) > 0
+    assert result[1] == result[0]
+    for repo in repos:
+        repo.close()
+
+
+def test_element_record_builds_an_unchanged_element() -> None:
+    """
+    Given: The stored attributes of an element with the dates as strings
+    When: the record is built and converted to an Element
+    Then: The Element has the same attributes, and it's not marked as changed.
+    """
+    row = {
+        "id_": 3,
+        "type_": "task",
+        "description": "Task",
+        "body": None,
+        "priority": 1,
+        "skips": 2,
+        "state": "open",
+        "created": "2021-01-02T03:04:05",
+        "closed": None,
+    }
+
+    result = ElementRecord.from_row(row).to_element()
+
+    assert result.id_ == 3
+    assert result.state == ElementState.OPEN
+    assert result.created == datetime(2021, 1, 2, 3, 4, 5)
+    assert result.skips == 2
+    assert result.defined_values == {}
+
+
+def test_count_open_elements(config: Config, repo: Repository) -> None:
+    """
+    Given: Open and closed elements of different types
+    When: count_open_elements is called with and without type
+    Then: The number of open elements of the configured types is returned.
+    """
+    services.add_elements(
+        repo,
+        [
+            Element(description="Open task", type_="task"),
+            Element(description="Closed task", type_="task", state=ElementState.CLOSED),
+            Element(description="Open idea", type_="idea"),
+        ],
+    )
+    repo.commit()
+
+    result = views.count_open_elements(repo, config)
+
+    assert result == 2
+    assert views.count_open_elements(repo, config, "task") == 1
+
+
+@pytest.mark.parametrize("backend", ["fake", "tinydb", "sqlite"])
+def test_search_finds_the_elements_with_the_words(
+    config: Config, tmp_path: Path, backend: str
+) -> None:
+    """
+    Given: Elements with different descriptions and bodies
+    When: search is called with the start of two words
+    Then: Only the elements that contain both words in the description or the body
+        are returned.
+    """
+    config.database_url = f"{backend}:///{tmp_path / 'database.db'}"
+    repo = get_repo(config)
+    services.add_elements(
+        repo,
+        [
+            Element(type_="task", description="Buy Bread", body="At the bakery"),
+            Element(type_="task", description="Buy milk"),
+            Element(type_="idea", description="Bake bread", body="With sourdough"),
+        ],
+    )
+    repo.commit()
+
+    result = views.search(repo, "bread bak")
+
+    assert sorted(element.description for element in result) == [
+        "Bake bread",
+        "Buy Bread",
+    ]
+    repo.close()
+
+
+@pytest.mark.parametrize("backend", ["fake", "tinydb", "sqlite"])
+def test_search_filters_by_state_and_type(
+    config: Config, tmp_path: Path, backend: str
+) -> None:
+    """
+    Given: Matching elements of different types and states
+    When: search is called with a state and a type
+    Then: Only the elements of that state and type are returned.
+    """
+    config.database_url = f"{backend}:///{tmp_path / 'database.db'}"
+    repo = get_repo(config)
+    elements = services.add_elements(
+        repo,
+        [
+            Element(type_="task", description="Open task"),
+            Element(type_="task", description="Closed task"),
+            Element(type_="idea", description="Closed idea task"),
+        ],
+    )
+    repo.commit()
+    for element in elements[1:]:
+        element.close()
+    services.save_elements(
+        repo,
+        [(element, (element.type_, ElementState.OPEN)) for element in elements[1:]],
+    )
+    repo.commit()
+
+    result = views.search(repo, "task", state=ElementState.CLOSED, type_="task")
+
+    assert [element.description for element in result] == ["Closed task"]
+    repo.close()
+
+
+def test_search_index_is_updated_when_the_elements_change(
+    config: Config, tmp_path: Path
+) -> None:
+    """
+    Given: A stored element in a sqlite repository
+    When: its description is changed
+    Then: search finds it by the new description and not by the old one.
+    """
+    config.database_url = f"sqlite:///{tmp_path / 'database.db'}"
+    repo = get_repo(config)
+    element = services.add_elements(
+        repo, [Element(type_="task", description="Old description")]
+    )[0]
+    repo.commit()
+    element.description = "New description"
+
+    services.save_element(repo, element, ("task", ElementState.OPEN))
+
+    repo.commit()
+    assert views.search(repo, "new") == [element]
+    assert views.search(repo, "old") == []
+    repo.close()
+
+
+def test_search_ignores_the_search_syntax_characters(
+    config: Config, tmp_path: Path
+) -> None:
+    """
+    Given: An element in a sqlite repository
+    When: search is called with characters of the FTS5 query syntax
+    Then: They are ignored instead of raising an error.
+    """
+    config.database_url = f"sqlite:///{tmp_path / 'database.db'}"
+    repo = get_repo(config)
+    services.add_elements(repo, [Element(type_="task", description="Task title")])
+    repo.commit()
+
+    result = views.search(repo, 'task" (title* -')
+
+    assert len(result) == 1
+    repo.close()
+
+
+@pytest.mark.parametrize("backend", ["fake", "tinydb", "sqlite"])
+def test_elements_can_be_ordered_by_priority(
+    config: Config, tmp_path: Path, backend: str
+) -> None:
+    """
+    Given: Elements with different type priorities, element priorities, ages and
+        skips
+    When: elements is called with the priority order
+    Then: They are returned from the highest priority score to the lowest.
+    """
+    config.database_url = f"{backend}:///{tmp_path / 'database.db'}"
+    repo = get_repo(config)
+    now = datetime.now()
+    services.add_elements(
+        repo,
+        [
+            Element(type_="idea", description="Idea", created=now),
+            Element(type_="task", description="Task", created=now),
+            Element(
+                type_="idea", description="Important idea", priority=5, created=now
+            ),
+            Element(
+                type_="task", description="Old task", created=now - timedelta(days=5)
+            ),
+            Element(type_="task", description="Skipped task", skips=3, created=now),
+        ],
+    )
+    repo.commit()
+
+    result = views.get_elements(repo, config, order=ElementOrder.PRIORITY)
+
+    assert [element.description for element in result] == [
+        "Important idea",
+        "Old task",
+        "Task",
+        "Idea",
+        "Skipped task",
+    ]
+    repo.close()
+
+
+def test_priority_score_combines_priorities_age_and_skips() -> None:
+    """
+    Given: The attributes of an element
+    When: priority_score is called
+    Then: The priorities weigh ten times a day of age, the age is capped to 30 days
+        and each skip takes five days away.
+    """
+    now = datetime(2021, 1, 31)
+
+    result = views.priority_score(4, 3, datetime(2021, 1, 21), 1, now)
+
+    assert result == 70 + 10 - 5
+    assert views.priority_score(4, 3, datetime(2020, 1, 1), 0, now) == 100
+
+
+@pytest.mark.parametrize("backend", ["fake", "tinydb", "sqlite"])
+def test_element_stats_aggregates_the_history(
+    config: Config, tmp_path: Path, backend: str
+) -> None:
+    """
+    Given: Open, closed, deleted and skipped elements created on different days
+    When: element_stats is called
+    Then: The elements created and closed per type and day, the days to close them
+        and the skip distribution are returned. The deleted elements are not
+        counted as closed.
+    """
+    config.database_url = f"{backend}:///{tmp_path / 'database.db'}"
+    repo = get_repo(config)
+    elements = [
+        Element(type_="task", description="Open", created=datetime(2021, 1, 1)),
+        Element(
+            type_="task",
+            description="Closed in a day",
+            created=datetime(2021, 1, 1),
+            state=ElementState.CLOSED,
+            closed=datetime(2021, 1, 2),
+        ),
+        Element(
+            type_="task",
+            description="Closed in three days",
+            created=datetime(2021, 1, 2),
+            state=ElementState.CLOSED,
+            closed=datetime(2021, 1, 5),
+            skips=2,
+        ),
+        Element(
+            type_="idea",
+            description="Deleted",
+            created=datetime(2021, 1, 2, 12),
+            state=ElementState.DELETED,
+            closed=datetime(2021, 1, 3),
+            skips=2,
+        ),
+    ]
+    services.add_elements(repo, elements)
+    repo.commit()
+
+    result = views.element_stats(repo)
+
+    assert result.created == {
+        "task": {date(2021, 1, 1): 2, date(2021, 1, 2): 1},
+        "idea": {date(2021, 1, 2): 1},
+    }
+    assert result.closed == {"task": {date(2021, 1, 2): 1, date(2021, 1, 5): 1}}
+    assert result.median_time_to_close == {"task": pytest.approx(3)}
+    assert result.p90_time_to_close == {"task": pytest.approx(3)}
+    assert result.skips == {0: 2, 2: 2}
+    repo.close()
+
+
+def test_element_stats_of_an_empty_repository(repo: Repository) -> None:
+    """
+    Given: A repository without elements
+    When: element_stats is called
+    Then: Empty aggregates are returned.
+    """
+    result = views.element_stats(repo)
+
+    assert result.created == {}
+    assert result.median_time_to_close == {}
+    assert result.skips == {}
+
+
+def test_decision_metrics_returns_the_percentiles_per_type_and_action(
+    tmp_path: Path,
+) -> None:
+    """
+    Given: A metrics file with decisions of two sessions and a corrupt line
+    When: decision_metrics is called
+    Then: The percentiles of the think and storage times per type and action, and
+        of the session durations are returned.
+    """
+    metrics_path = tmp_path / "metrics.jsonl"
+    first_session = datetime(2021, 1, 1)
+    second_session = datetime(2021, 1, 2)
+    decisions = [
+        Decision(
+            id_=index,
+            type_="task",
+            action="done",
+            think_time=index + 1,
+            storage_time=0.001 * (index + 1),
+            session=first_session,
+            date=first_session + timedelta(minutes=index + 1),
+        )
+        for index in range(10)
+    ] + [
+        Decision(
+            id_=10,
+            type_="idea",
+            action="skip",
+            think_time=3,
+            storage_time=0.002,
+            session=second_session,
+            date=second_session + timedelta(minutes=30),
+        )
+    ]
+    metrics_path.write_text(
+        "".join(decision.json() + "\n" for decision in decisions) + '{"id_": 1'
+    )
+
+    result = views.decision_metrics(str(metrics_path), (50, 90))
+
+    assert [(metric.type_, metric.action) for metric in result.metrics] == [
+        ("idea", "skip"),
+        ("task", "done"),
+    ]
+    task_metrics = result.metrics[1]
+    assert task_metrics.decisions == 10
+    assert task_metrics.think_time == {50: 6, 90: 10}
+    assert task_metrics.storage_time == {50: 0.006, 90: 0.010}
+    assert result.sessions == 2
+    assert result.session_time == {50: 1800, 90: 1800}
+
+
+def test_decision_metrics_without_decisions(tmp_path: Path) -> None:
+    """
+    Given: A metrics path that doesn't exist yet
+    When: decision_metrics is called
+    Then: An empty report is returned.
+    """
+    result = views.decision_metrics(str(tmp_path / "metrics.jsonl"))
+
+    assert result.metrics == []
+    assert result.sessions == 0
@@ -0,0 +1,199 @@
+"""Test the ingestion of the inbox files when they change."""
+
+import logging
+import time
+from pathlib import Path
+from threading import Event, Thread
+from typing import Callable
+
+import pytest
+from _pytest.logging import LogCaptureFixture
+from repository_orm import Repository
+
+from pynbox.config import Config
+from pynbox.model import Element, ParseReport
+from pynbox.watch import _ingest  # noqa: W0212
+from pynbox.watch import (
+    InotifyWatcher,
+    PollingWatcher,
+    WatchStats,
+    create_watcher,
+    watch,
+)
+
+
+def _wait_for(condition: Callable[[], bool], timeout: float = 5) -> None:
+    """Wait until the condition is true."""
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise TimeoutError("The condition was not met in time")
+        time.sleep(0.05)
+
+
+@pytest.mark.parametrize("polling", [False, True])
+def test_watch_ingests_the_appended_elements(
+    config: Config, repo: Repository, tmp_path: Path, polling: bool
+) -> None:
+    """
+    Given: A watched inbox directory with two elements in a file
+    When: the body of the last one and more elements are appended to the file,
+        and a new file is created
+    Then: all the elements except the last one of each file are stored once and
+        counted, and the files are kept.
+    """
+    inbox = tmp_path / "inbox"
+    inbox.mkdir()
+    (inbox / "phone.pynbox").write_text("t. First task\nt. Second task\n")
+    stop = Event()
+    stats = WatchStats()
+    thread = Thread(
+        target=watch,
+        args=(config, repo, [str(inbox)], stop, stats, polling, 0.1),
+    )
+    thread.start()
+    _wait_for(lambda: stats.elements == 1)
+
+    with open(inbox / "phone.pynbox", "a", encoding="utf-8") as inbox_file:
+        inbox_file.write("Task body\nt. Third task\n")
+    (inbox / "laptop.pynbox").write_text("i. First idea\ni. Second idea\n")
+
+    _wait_for(lambda: stats.elements == 3)
+    stop.set()
+    thread.join()
+    elements = sorted(repo.all(Element), key=lambda element: element.description)
+    assert [element.description for element in elements] == [
+        "First idea",
+        "First task",
+        "Second task",
+    ]
+    assert elements[2].body == "Task body"
+    assert (inbox / "phone.pynbox").read_text() == (
+        "t. First task\nt. Second task\nTask body\nt. Third task\n"
+    )
+    assert len(stats.latencies) >= 2
+
+
+def test_watch_logs_the_parse_errors_and_goes_on(
+    config: Config, repo: Repository, tmp_path: Path, caplog: LogCaptureFixture
+) -> None:
+    """
+    Given: A watched file with invalid markup
+    When: it's fixed
+    Then: the error is logged and the element is stored after the fix.
+    """
+    inbox_file = tmp_path / "inbox.pynbox"
+    inbox_file.write_text("invalid markup\n")
+    stop = Event()
+    stats = WatchStats()
+    thread = Thread(
+        target=watch, args=(config, repo, [str(inbox_file)], stop, stats, False, 0.1)
+    )
+    thread.start()
+    _wait_for(lambda: len(caplog.records) > 0)
+
+    inbox_file.write_text("t. Task title\nt. Next task\n")
+
+    _wait_for(lambda: stats.elements == 1)
+    stop.set()
+    thread.join()
+    assert caplog.record_tuples[0][1] == logging.ERROR
+    assert "Could not parse" in caplog.record_tuples[0][2]
+
+
+def test_ingest_reads_the_lines_of_writers_that_keep_the_file_open(
+    config: Config, repo: Repository, tmp_path: Path
+) -> None:
+    """
+    Given: A capture tool that keeps the inbox file open to append elements
+    When: the file is ingested after each append
+    Then: all the elements but the last one are stored once.
+    """
+    inbox_file = tmp_path / "inbox.pynbox"
+    stats = WatchStats()
+    with open(inbox_file, "a", encoding="utf-8") as capture:
+        capture.write("t. First task\nt. Second task\n")
+        capture.flush()
+        _ingest(config, repo, [str(inbox_file)], stats)
+        capture.write("t. Third task\n")
+        capture.flush()
+
+        _ingest(config, repo, [str(inbox_file)], stats)  # act
+
+    assert [element.description for element in repo.all(Element)] == [
+        "First task",
+        "Second task",
+    ]
+    assert stats.elements == 2
+
+
+def test_ingest_waits_for_the_body_of_the_last_element(
+    config: Config, repo: Repository, tmp_path: Path, caplog: LogCaptureFixture
+) -> None:
+    """
+    Given: A file with an element that has been ingested
+    When: its body and another element are appended and the file is ingested
+    Then: the element is stored with its body, without parse errors, and the
+        last element waits for the next one.
+    """
+    inbox_file = tmp_path / "inbox.pynbox"
+    inbox_file.write_text("t. task one\n")
+    _ingest(config, repo, [str(inbox_file)], WatchStats())
+    with open(inbox_file, "a", encoding="utf-8") as capture:
+        capture.write("  body\nt. task two\n")
+
+    _ingest(config, repo, [str(inbox_file)], WatchStats())  # act
+
+    elements = repo.all(Element)
+    assert [(element.description, element.body) for element in elements] == [
+        ("task one", "body")
+    ]
+    assert "Could not parse" not in caplog.text
+
+
+def test_ingest_goes_on_with_the_rest_of_files_if_one_fails(
+    config: Config, repo: Repository, tmp_path: Path, caplog: LogCaptureFixture
+) -> None:
+    """
+    Given: A file with invalid markup and a valid one
+    When: they are ingested
+    Then: the error is logged and the elements of the valid file are stored.
+    """
+    (tmp_path / "invalid.pynbox").write_text("invalid markup\n")
+    (tmp_path / "valid.pynbox").write_text("t. Task title\nt. Next task\n")
+
+    _ingest(config, repo, [str(tmp_path)], WatchStats())  # act
+
+    assert [element.description for element in repo.all(Element)] == ["Task title"]
+    assert "Could not parse" in caplog.text
+
+
+def test_create_watcher_uses_inotify_unless_polling_is_asked(tmp_path: Path) -> None:
+    """
+    Given: A directory to watch
+    When: the watcher is created with and without polling
+    Then: inotify is used by default, and the polling watcher if asked.
+    """
+    result = create_watcher([str(tmp_path)])
+
+    assert isinstance(result, InotifyWatcher)
+    result.close()
+    assert isinstance(create_watcher([str(tmp_path)], polling=True), PollingWatcher)
+
+
+def test_watch_stats_gives_the_latency_percentiles() -> None:
+    """
+    Given: A WatchStats with ten ingestions
+    When: the percentiles and summary are requested
+    Then: they are computed from the recorded latencies.
+    """
+    stats = WatchStats()
+    for latency in range(1, 11):
+        stats.record(ParseReport(elements=2, duplicates=1), latency / 10)
+
+    result = stats.summary()
+
+    assert stats.latency(50) == 0.6
+    assert stats.latency(95) == 1.0
+    assert result.startswith("Ingested 20 elements in 10 batches, merged 10 duplicates")
+    assert "p50 600ms, p95 1000ms" in result